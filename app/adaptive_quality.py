@@ -0,0 +1,74 @@
+class QualityController:
+    """Closed-loop capture settings for one session.
+
+    After every processed frame the controller looks at how long the frame
+    took on the server (queueing plus inference), how deep the detector
+    worker's queue was and whether frames were dropped. Settings move one
+    step down a fixed ladder as soon as the session falls behind, and one
+    step up only after a run of frames with spare headroom, so quality drops
+    quickly under load and recovers slowly.
+    """
+
+    # (capture width, JPEG quality, frames per second)
+    LEVELS = [
+        (160, 0.5, 6),
+        (240, 0.6, 8),
+        (300, 0.7, 10),  # What the browser used before adaptation
+        (300, 0.75, 15),
+        (300, 0.8, 20),
+        (300, 0.8, 25),
+    ]
+
+    def __init__(self, target_latency=0.05, start_level=2, smoothing=0.3, upgrade_after=30, cooldown=10):
+        self.target_latency = target_latency
+        self.level = start_level
+        self.smoothing = smoothing
+        self.upgrade_after = upgrade_after  # Good frames needed before stepping up
+        self.cooldown = cooldown  # Frames to wait after any change
+
+        self.latency = None  # Exponentially smoothed latency in seconds
+        self.good_frames = 0
+        self.frames_since_change = 0
+        self.last_dropped = 0
+
+    def settings(self):
+        width, quality, fps = self.LEVELS[self.level]
+        return {"width": width, "jpeg_quality": quality, "fps": fps, "level": self.level}
+
+    def observe(self, latency, queue_depth, dropped):
+        """Feed one processed frame; returns new settings when they change.
+
+        ``latency`` is the server time for the frame in seconds,
+        ``queue_depth`` the number of frames waiting on the session's worker
+        and ``dropped`` the session's running count of dropped frames.
+        """
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += (latency - self.latency) * self.smoothing
+
+        new_drops = dropped - self.last_dropped
+        self.last_dropped = dropped
+        self.frames_since_change += 1
+
+        overloaded = self.latency > self.target_latency * 1.5 or new_drops > 0 or queue_depth > 1
+        headroom = self.latency < self.target_latency * 0.6 and queue_depth == 0
+
+        if overloaded:
+            self.good_frames = 0
+            if self.level > 0 and self.frames_since_change >= self.cooldown:
+                return self._change(-1)
+        elif headroom:
+            self.good_frames += 1
+            if (self.level < len(self.LEVELS) - 1 and self.good_frames >= self.upgrade_after
+                    and self.frames_since_change >= self.cooldown):
+                return self._change(1)
+        else:
+            self.good_frames = 0
+        return None
+
+    def _change(self, step):
+        self.level += step
+        self.good_frames = 0
+        self.frames_since_change = 0
+        return self.settings()
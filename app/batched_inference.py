@@ -0,0 +1,113 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from app.landmark_model import LandmarkModel
+
+logger = logging.getLogger(__name__)
+
+
+class BatchedLandmarkEngine:
+    """Runs landmark inference for many sessions as shared batches.
+
+    Detector workers submit a face crop and block on the returned future.
+    A single inference thread collects the crops that arrive within
+    ``window`` seconds of the first one (up to ``max_batch``) and runs the
+    landmark model on all of them at once. Per-session tracking state such
+    as the ROI stays with each session's FaceDetector.
+    """
+
+    def __init__(self, model_path="face_landmark.tflite", max_batch=16, window=0.004, num_threads=None):
+        self.model_path = model_path
+        self.max_batch = max_batch
+        self.window = window
+        self.num_threads = num_threads
+        self.input_size = LandmarkModel.input_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        self.load_error = None
+
+        # Statistics
+        self.batches = 0
+        self.crops = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="landmark-batcher", daemon=True)
+                self._thread.start()
+
+    def check(self, timeout=30.0):
+        """Start the inference thread and raise if the model could not be loaded"""
+        self.start()
+        if not self._loaded.wait(timeout):
+            raise TimeoutError(f"Landmark model {self.model_path} did not load in {timeout}s")
+        if self.load_error is not None:
+            raise self.load_error
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, crop):
+        """Queue a 192x192 RGB crop; the future resolves to ``(landmarks, score)``"""
+        self.start()
+        future = Future()
+        self._queue.put((crop, future))
+        return future
+
+    def infer(self, crop):
+        return self.submit(crop).result()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        # The interpreter is created and used on this thread only
+        model = None
+        try:
+            model = LandmarkModel(self.model_path, self.num_threads)
+            logger.info(f"Batched landmark inference started with {self.model_path}")
+        except Exception as e:
+            self.load_error = e
+            logger.error(f"Could not load landmark model {self.model_path}: {str(e)}")
+        self._loaded.set()
+
+        while True:
+            batch = self._collect()
+            if batch is None:
+                break
+            try:
+                if model is None:
+                    raise self.load_error
+                landmarks, scores = model.run([crop for crop, _ in batch])
+                for i, (_, future) in enumerate(batch):
+                    future.set_result((landmarks[i], float(scores[i])))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            self.batches += 1
+            self.crops += len(batch)
@@ -0,0 +1,142 @@
+import logging
+
+import cv2
+import numpy as np
+
+from app.profiling import stage
+
+logger = logging.getLogger(__name__)
+
+# Frame decoding and encoding for one session.
+#
+# Frames are decoded straight into RGB, which is what the landmark models
+# take, and large JPEGs are decoded at a reduced size through the decoder's
+# DCT scaling instead of decoding everything and resizing afterwards.
+# Buffers the codec fills itself are kept and reused for the next frame of
+# the session.
+#
+# Backends:
+#
+#   "opencv"      cv2.imdecode/imencode. Decodes into RGB from OpenCV 4.11
+#                 on (older versions decode BGR and convert). imdecode
+#                 always returns a new array.
+#   "simplejpeg"  libjpeg-turbo through the simplejpeg package: JPEG is
+#                 decoded into a reused buffer and encoded from RGB without
+#                 a conversion. Other formats (WebP) still go through OpenCV.
+
+_IMREAD_RGB = getattr(cv2, "IMREAD_COLOR_RGB", None)
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2)
+)
+_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def jpeg_size(data):
+    """``(width, height)`` from the frame header of a JPEG, None if it is not one"""
+    data = memoryview(data).cast("B")
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # Fill byte
+            i += 1
+            continue
+        if marker in _SOF_MARKERS:
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        i += 2 + ((data[i + 2] << 8) | data[i + 3])
+    return None
+
+
+class OpenCVCodec:
+    name = "opencv"
+
+    def __init__(self, max_width=800):
+        self.max_width = max_width  # Frames at least twice as wide are decoded reduced
+        self._bgr = None  # Reused for encoding RGB images
+
+    def _reduced_flag(self, data):
+        size = jpeg_size(data)
+        if size is None:
+            return cv2.IMREAD_COLOR
+        for factor, flag in _REDUCED_FLAGS:
+            if size[0] // factor >= self.max_width:
+                return flag
+        return cv2.IMREAD_COLOR
+
+    def decode(self, data):
+        """Decode an encoded frame; returns ``(image, rgb)`` or ``(None, False)``.
+
+        ``rgb`` tells whether the image is RGB or BGR ordered.
+        """
+        buffer = np.frombuffer(data, np.uint8)
+        flag = self._reduced_flag(buffer)
+        with stage("imdecode"):
+            if _IMREAD_RGB is not None:
+                return cv2.imdecode(buffer, flag | _IMREAD_RGB), True
+            return cv2.imdecode(buffer, flag), False
+
+    def encode(self, image, rgb, quality=70):
+        """JPEG-encode an image; returns the encoded buffer or None"""
+        if rgb:
+            if self._bgr is None or self._bgr.shape != image.shape:
+                self._bgr = np.empty_like(image)
+            with stage("color"):
+                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR, dst=self._bgr)
+        with stage("imencode"):
+            ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return buffer if ok else None
+
+    def buffer_bytes(self):
+        """Size of the buffers kept for reuse"""
+        return self._bgr.nbytes if self._bgr is not None else 0
+
+
+class SimpleJpegCodec(OpenCVCodec):
+    name = "simplejpeg"
+
+    def __init__(self, max_width=800):
+        import simplejpeg
+        super().__init__(max_width)
+        self.simplejpeg = simplejpeg
+        self._decoded = None  # Reused decode buffer
+
+    def decode(self, data):
+        if not self.simplejpeg.is_jpeg(data):
+            return super().decode(data)
+        with stage("imdecode"):
+            # Scaled down by the largest factor that keeps max_width
+            options = {"min_width": self.max_width, "min_height": 0}
+            height, width, _, _ = self.simplejpeg.decode_jpeg_header(data, **options)
+            size = height * width * 3
+            if self._decoded is None or len(self._decoded) < size:
+                self._decoded = bytearray(size)
+            image = self.simplejpeg.decode_jpeg(data, colorspace="RGB", buffer=self._decoded, **options)
+        return image, True
+
+    def encode(self, image, rgb, quality=70):
+        with stage("imencode"):
+            return np.frombuffer(self.simplejpeg.encode_jpeg(
+                image, quality=quality, colorspace="RGB" if rgb else "BGR", colorsubsampling="420"
+            ), np.uint8)
+
+    def buffer_bytes(self):
+        return super().buffer_bytes() + (len(self._decoded) if self._decoded is not None else 0)
+
+
+def create_codec(backend="opencv", max_width=800):
+    """Codec for one session; falls back to OpenCV if ``backend`` is not installed"""
+    if backend == "simplejpeg":
+        try:
+            return SimpleJpegCodec(max_width)
+        except ImportError as e:
+            logger.warning(f"simplejpeg codec not available, using OpenCV: {str(e)}")
+    elif backend != "opencv":
+        raise ValueError(f"Unknown codec backend: {backend}")
+    return OpenCVCodec(max_width)
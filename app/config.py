@@ -0,0 +1,105 @@
+import os
+
+# Runtime settings, overridable through environment variables.
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+# Detector execution engine
+DETECTOR_EXECUTOR = os.environ.get("DETECTOR_EXECUTOR", "thread")  # "thread" or "process"
+DETECTOR_WORKERS = _env_int("DETECTOR_WORKERS", os.cpu_count() or 1)
+DETECTOR_MAX_PENDING = _env_int("DETECTOR_MAX_PENDING", 2)  # In-flight frames per worker
+DETECTOR_MAX_WIDTH = _env_int("DETECTOR_MAX_WIDTH", 800)  # Wider frames are downscaled first
+
+# Detector warm-up at startup: "background" builds the first detectors while
+# the server already serves pages (/ready answers 503 until done), "startup"
+# waits for them before accepting connections, "off" builds them on the first
+# connection
+DETECTOR_WARMUP = os.environ.get("DETECTOR_WARMUP", "background")
+
+# Frame codec: "opencv", or "simplejpeg" (libjpeg-turbo, decodes into reused
+# buffers; needs the simplejpeg package, falls back to OpenCV without it)
+CODEC_BACKEND = os.environ.get("CODEC_BACKEND", "opencv")
+
+# Frame gate: outside a running game (preview), a frame whose 1/8 size
+# grayscale thumbnail differs from the last processed frame by less than
+# FRAME_GATE_THRESHOLD grey levels on average reuses that frame's result
+# instead of running detection, but at most FRAME_GATE_MAX_SKIP frames in a
+# row (0 disables the gate). Paused and finished games skip detection always.
+FRAME_GATE_THRESHOLD = _env_float("FRAME_GATE_THRESHOLD", 1.0)
+FRAME_GATE_MAX_SKIP = _env_int("FRAME_GATE_MAX_SKIP", 10)
+
+# Detector pool per worker: detectors built at startup, idle detectors kept
+# for reuse, total detectors (0 = no limit; connections beyond it are
+# refused) and seconds before an idle detector above the warm count is closed
+DETECTOR_POOL_WARM = _env_int("DETECTOR_POOL_WARM", 1)
+DETECTOR_POOL_MAX_IDLE = _env_int("DETECTOR_POOL_MAX_IDLE", 4)
+DETECTOR_POOL_MAX = _env_int("DETECTOR_POOL_MAX", 0)
+DETECTOR_POOL_IDLE_TIMEOUT = _env_int("DETECTOR_POOL_IDLE_TIMEOUT", 300)
+
+# Smoothing of the bird position: "one_euro" follows quick head movements
+# with less lag, "average" is the mean of the last 3 positions
+NOSE_SMOOTHING = os.environ.get("NOSE_SMOOTHING", "one_euro")
+
+# Landmark inference: "facemesh" runs one MediaPipe graph per connection on
+# every full frame, "tracking" runs the TFLite landmark model on a crop
+# around the tracked face and only uses FaceMesh to find the face again,
+# "batched" does the same with the crops of all connections in shared
+# batches. The last two need ai-edge-litert or tflite-runtime.
+LANDMARK_BACKEND = os.environ.get("LANDMARK_BACKEND", "facemesh")
+LANDMARK_MODEL = os.environ.get("LANDMARK_MODEL", "face_landmark.tflite")
+LANDMARK_BATCH_SIZE = _env_int("LANDMARK_BATCH_SIZE", 16)
+LANDMARK_BATCH_WINDOW_MS = _env_int("LANDMARK_BATCH_WINDOW_MS", 4)
+
+# Game loop
+GAME_TICK_RATE = _env_int("GAME_TICK_RATE", 60)  # Simulation steps per second
+GAME_BROADCAST_RATE = _env_int("GAME_BROADCAST_RATE", 30)  # State pushes per second
+
+# Highscores
+HIGHSCORE_DB = os.environ.get("HIGHSCORE_DB", "data/highscores.db")
+# "memory" keeps highscores in this process (written behind to HIGHSCORE_DB),
+# "sqlite" shares them with other server processes through HIGHSCORE_DB
+HIGHSCORE_BACKEND = os.environ.get("HIGHSCORE_BACKEND", "memory")
+
+# Most players (faces) one camera may drive, see the "players" option of
+# the configure message
+MAX_PLAYERS_PER_CAMERA = _env_int("MAX_PLAYERS_PER_CAMERA", 4)
+
+# Spectators (/spectate/{game_id}): messages a viewer may fall behind before
+# it is disconnected, and the most viewers per game (0 for no limit)
+SPECTATOR_QUEUE = _env_int("SPECTATOR_QUEUE", 32)
+MAX_SPECTATORS_PER_GAME = _env_int("MAX_SPECTATORS_PER_GAME", 0)
+
+# Sessions (/ws): the most open at once, further connections are closed
+# with 1013 (0 for no limit), and the seconds without any message after
+# which a session is closed (0 to keep idle sessions)
+MAX_SESSIONS = _env_int("MAX_SESSIONS", 0)
+SESSION_IDLE_TIMEOUT = _env_float("SESSION_IDLE_TIMEOUT", 300.0)
+
+# Capture quality: the most frames per second processed for one connection,
+# and the server time per frame that adaptive clients are steered towards
+MAX_CLIENT_FPS = _env_int("MAX_CLIENT_FPS", 25)
+ADAPTIVE_TARGET_LATENCY_MS = _env_int("ADAPTIVE_TARGET_LATENCY_MS", 50)
+
+# Metrics: time every frame processing stage into the /metrics histograms
+METRICS_STAGES = _env_int("METRICS_STAGES", 1)
+
+# Recording: with RECORD_DIR set, every session's landmarks and game events
+# are written there for offline replay (benchmarks/replay.py), with its video
+# frames too when RECORD_FRAMES=1; each recording keeps at most
+# RECORD_MAX_MB on disk, dropping its oldest parts, and all recordings in
+# RECORD_DIR together at most RECORD_TOTAL_MB, dropping the oldest finished
+# recordings (0 for no limit)
+RECORD_DIR = os.environ.get("RECORD_DIR", "")
+RECORD_FRAMES = _env_int("RECORD_FRAMES", 0)
+RECORD_MAX_MB = _env_int("RECORD_MAX_MB", 50)
+RECORD_TOTAL_MB = _env_int("RECORD_TOTAL_MB", 1000)
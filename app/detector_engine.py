@@ -0,0 +1,512 @@
+import asyncio
+import base64
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from app.detector_pool import DetectorPool
+from app.profiling import stage
+from app.protocol import HEADER_SIZE
+
+logger = logging.getLogger(__name__)
+
+# OpenCV and MediaPipe (app.face_detection, app.codec) are only imported
+# by the workers when they build their first detector, so importing this
+# module, and with it the server, stays fast.
+
+# FaceDetector instances owned by this thread/process, keyed by connection id.
+# A connection is pinned to a single worker, so each entry is only ever
+# touched from that worker's thread.
+_detectors = {}
+
+# Per-process worker options and the landmark engine shared by its detectors
+_options = {}
+_landmark_engine = None
+
+# Frame codecs with their reused buffers, keyed by connection id like _detectors
+_codecs = {}
+
+# Frame gates and the last result they let a connection reuse for frames
+# that did not change, keyed by connection id; see app.frame_gate
+_gates = {}
+_last_results = {}
+
+# Idle detectors per worker index, so a connection does not wait for a new
+# MediaPipe graph to be built
+_pools = {}
+
+# Process CPU time split among the frames running in this process, see
+# _process_frame_accounted(); guarded by _cpu_lock as thread workers share it
+_cpu_lock = threading.Lock()
+_cpu_mark = time.process_time()
+_cpu_running = {}  # Frame token -> CPU seconds charged to it so far
+
+
+def _init_worker(options):
+    global _landmark_engine
+    _options.update(options)
+    if _options.get("landmark_backend") == "batched" and _landmark_engine is None:
+        from app.batched_inference import BatchedLandmarkEngine
+        _landmark_engine = BatchedLandmarkEngine(
+            model_path=_options.get("landmark_model", "face_landmark.tflite"),
+            max_batch=_options.get("landmark_batch_size", 16),
+            window=_options.get("landmark_batch_window", 0.004)
+        )
+
+
+def _checked_landmark_engine():
+    """The batched landmark engine, or None if its model could not be loaded.
+
+    Checked when the first detector is built (on a worker, so startup does
+    not wait for the model), not when the engine is created.
+    """
+    global _landmark_engine
+    engine = _landmark_engine
+    if engine is None:
+        return None
+    try:
+        engine.check()
+    except Exception as e:
+        # Like tracking mode without a runtime: FaceMesh on every frame
+        if _landmark_engine is engine:
+            _landmark_engine = None
+            engine.stop()
+            logger.warning(f"Batched landmark inference disabled: {str(e)}")
+        return None
+    return engine
+
+
+def _new_detector(max_faces=1):
+    from app.face_detection import FaceDetector
+    return FaceDetector(
+        landmark_engine=_checked_landmark_engine(),
+        tracking=_options.get("landmark_backend") == "tracking",
+        max_width=_options.get("max_width", 800),
+        smoothing=_options.get("smoothing", "one_euro"),
+        max_faces=max_faces
+    )
+
+
+def _get_pool(worker_index):
+    pool = _pools.get(worker_index)
+    if pool is None:
+        pool = _pools[worker_index] = DetectorPool(
+            _new_detector,
+            warm_size=_options.get("pool_warm_size", 1),
+            max_idle=_options.get("pool_max_idle", 4),
+            max_size=_options.get("pool_max_size", 0),
+            idle_timeout=_options.get("pool_idle_timeout", 300.0)
+        )
+    return pool
+
+
+def _warm_pool(worker_index):
+    _get_pool(worker_index).warm()
+
+
+def _evict_idle(worker_index):
+    pool = _get_pool(worker_index)
+    pool.evict_idle()
+    return pool.stats()
+
+
+def _create_detector(connection_id, worker_index=0):
+    from app.codec import create_codec
+    _detectors[connection_id] = _get_pool(worker_index).lease()
+    _codecs[connection_id] = create_codec(_options.get("codec", "opencv"), _options.get("max_width", 800))
+    if _options.get("frame_gate_threshold", 0) > 0:
+        from app.frame_gate import FrameGate
+        _gates[connection_id] = FrameGate(
+            threshold=_options["frame_gate_threshold"],
+            max_skip=_options.get("frame_gate_max_skip", 10)
+        )
+
+
+def _release_detector(connection_id, worker_index=0):
+    _codecs.pop(connection_id, None)
+    _last_results.pop(connection_id, None)
+    gate = _gates.pop(connection_id, None)
+    if gate is not None:
+        logger.debug(f"Frame gate stats for {connection_id}: {gate.stats()}")
+    _give_back_detector(_detectors.pop(connection_id, None), worker_index)
+
+
+def _lease_detector(max_faces, worker_index):
+    pool = _get_pool(worker_index)
+    if max_faces > 1:
+        # Multi-face detectors are not reused, but count toward the pool's limit
+        return pool.lease_unpooled(lambda: _new_detector(max_faces))
+    return pool.lease()
+
+
+def _give_back_detector(detector, worker_index):
+    if detector is None:
+        return
+    if detector.max_faces > 1:
+        _get_pool(worker_index).give_back_unpooled(detector)
+    else:
+        _get_pool(worker_index).give_back(detector)
+
+
+def _set_players(connection_id, players, worker_index=0):
+    """Give the connection a detector for ``players`` faces"""
+    old = _detectors[connection_id]
+    if old.max_faces == players:
+        return
+    # The old detector first, so that a full pool has room for the new one
+    _give_back_detector(old, worker_index)
+    try:
+        _detectors[connection_id] = _lease_detector(players, worker_index)
+    except Exception:
+        # Stay with the old number of players (a single-face detector comes
+        # back from the pool reset)
+        _detectors[connection_id] = _lease_detector(old.max_faces, worker_index)
+        raise
+    _last_results.pop(connection_id, None)
+    if connection_id in _gates:
+        _gates[connection_id].reset()
+
+
+def _reset_calibration(connection_id):
+    _detectors[connection_id].reset_calibration()
+    _last_results.pop(connection_id, None)
+    if connection_id in _gates:
+        _gates[connection_id].reset()
+
+
+def _reusable_result(connection_id, frame_bytes, key, gate):
+    """The last result of the connection if its frame gate skips this frame"""
+    frame_gate = _gates.get(connection_id)
+    if frame_gate is None:
+        return None
+    last = _last_results.get(connection_id)
+    if not gate or last is None or last[0] != key:
+        # The gate's reference has to be the frame of the reused result
+        frame_gate.reset()
+    if not gate:
+        return None
+    if frame_gate.changed(frame_bytes):
+        return None
+    return last[1]
+
+
+def _process_frame(connection_id, frame_data, annotate=True, gate=False):
+    """Decode a frame, run face detection and encode the annotated result.
+
+    ``frame_data`` is either a base64 data URL from the JSON protocol or a
+    complete binary message (see app.protocol). JSON frames get the result
+    back as base64 text, binary frames as the raw JPEG buffer. Without
+    ``annotate`` nothing is drawn or encoded and only landmarks are returned.
+    With ``gate`` and a frame gate configured, a frame that hardly differs
+    from the last processed one gets that frame's result again, with
+    ``"reused": True`` in its landmarks.
+    """
+    if isinstance(frame_data, str):
+        # Decode base64 image
+        with stage("b64decode"):
+            if ',' in frame_data:
+                frame_bytes = base64.b64decode(frame_data.split(',')[1])
+            else:
+                frame_bytes = base64.b64decode(frame_data)
+    else:
+        # Image bytes follow the header, wrap them without copying
+        frame_bytes = memoryview(frame_data)[HEADER_SIZE:]
+
+    key = (annotate, isinstance(frame_data, str))
+    reused = _reusable_result(connection_id, frame_bytes, key, gate)
+    if reused is not None:
+        bird_pos_y, buffer, landmarks = reused
+        return bird_pos_y, buffer, {**landmarks, "reused": True}
+
+    result = _detect(connection_id, frame_data, frame_bytes, annotate)
+    if connection_id in _gates:
+        if gate and result is not None:
+            _last_results[connection_id] = (key, result)
+        else:
+            _last_results.pop(connection_id, None)
+    return result
+
+
+def _charge_cpu():
+    """Split the process CPU time since the last call evenly among the running frames"""
+    global _cpu_mark
+    now = time.process_time()
+    if _cpu_running:
+        share = (now - _cpu_mark) / len(_cpu_running)
+        for token in _cpu_running:
+            _cpu_running[token] += share
+    _cpu_mark = now
+
+
+def _process_frame_accounted(connection_id, frame_data, annotate=True, gate=False):
+    """_process_frame, plus the CPU time it took and the connection's buffer bytes.
+
+    The CPU time is process time, so it includes the threads MediaPipe runs
+    the graph on. A process worker handles one frame at a time and gets it
+    exactly. Thread workers share the server process: there the process time
+    while frames run is split evenly among them, which also hands out the
+    event loop's CPU, so it is only an estimate.
+    """
+    token = object()
+    with _cpu_lock:
+        _charge_cpu()
+        _cpu_running[token] = 0.0
+    try:
+        result = _process_frame(connection_id, frame_data, annotate, gate)
+    finally:
+        with _cpu_lock:
+            _charge_cpu()
+            cpu_seconds = _cpu_running.pop(token)
+    return result, cpu_seconds, _buffer_bytes(connection_id)
+
+
+def _buffer_bytes(connection_id):
+    """Bytes held for a connection in reused buffers and the cached result"""
+    size = 0
+    codec = _codecs.get(connection_id)
+    if codec is not None:
+        size += codec.buffer_bytes()
+    gate = _gates.get(connection_id)
+    if gate is not None and gate.reference is not None:
+        size += gate.reference.nbytes
+    last = _last_results.get(connection_id)
+    if last is not None and last[1][1] is not None:
+        size += len(last[1][1])
+    return size
+
+
+def _detect(connection_id, frame_data, frame_bytes, annotate):
+    codec = _codecs[connection_id]
+    frame, rgb = codec.decode(frame_bytes)
+    if frame is None:
+        return None
+
+    detector = _detectors[connection_id]
+    if detector.max_faces > 1:
+        bird_pos_y, processed_image = detector.detect_players(frame, annotate=annotate, rgb=rgb)
+    else:
+        bird_pos_y, processed_image = detector.detect_nose_position(frame, annotate=annotate, rgb=rgb)
+    landmarks = detector.get_landmark_state()
+    if not annotate:
+        return bird_pos_y, None, landmarks
+
+    # Reduce image quality for better performance
+    buffer = codec.encode(processed_image, rgb, quality=70)
+    if buffer is None:
+        return bird_pos_y, None, landmarks
+    if isinstance(frame_data, str):
+        with stage("b64encode"):
+            buffer = base64.b64encode(buffer).decode('utf-8')
+    return bird_pos_y, buffer, landmarks
+
+
+class _Worker:
+    def __init__(self, index, executor, max_pending):
+        self.index = index
+        self.executor = executor
+        self.slots = asyncio.Semaphore(max_pending)
+        self.connections = set()
+        self.pending = 0  # Calls submitted or waiting for a slot
+
+
+class DetectorEngine:
+    """Runs face detection for all connections on a bounded worker pool.
+
+    Every worker is a single-threaded executor (a thread or a process) that
+    owns the FaceDetector instances of the connections pinned to it, so the
+    MediaPipe tracking state of a connection always stays on one worker.
+    Each worker accepts at most ``max_pending`` frames at a time; further
+    submissions wait, which pushes back on the sending connection only.
+    """
+
+    def __init__(self, num_workers=1, executor="thread", max_pending=2, **options):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown detector executor: {executor}")
+        self.num_workers = max(1, num_workers)
+        self.executor_type = executor
+        self.max_pending = max(1, max_pending)
+        # Passed to _init_worker: landmark_backend ("facemesh", "tracking"
+        # or "batched"),
+        # landmark_model, landmark_batch_size, landmark_batch_window,
+        # max_width, smoothing, codec ("opencv" or "simplejpeg"),
+        # frame_gate_threshold (0 for no gate), frame_gate_max_skip, and the
+        # detector pool settings pool_warm_size, pool_max_idle,
+        # pool_max_size and pool_idle_timeout
+        self.options = options
+        self.workers = []
+        self.assignments = {}
+        # Per connection: CPU seconds and frames spent on it, and the bytes
+        # of its buffers on the worker. The CPU seconds are exact with
+        # process workers and an estimate with thread workers, see
+        # _process_frame_accounted() and session_usage().
+        self.usage = {}
+        self.maintenance = None
+        self.warming = []  # Futures of the warm-up started by start()
+
+    def start(self, warm=True):
+        """Create the worker executors.
+
+        With ``warm`` every worker builds its pool's first detectors in the
+        background; see ``ready`` and ``warm_up``. Without it the first
+        connection of a worker pays for loading MediaPipe.
+        """
+        if self.workers:
+            return
+        for index in range(self.num_workers):
+            if self.executor_type == "process":
+                executor = ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.options,)
+                )
+            else:
+                executor = ThreadPoolExecutor(
+                    max_workers=1,
+                    thread_name_prefix=f"detector-{index}"
+                )
+            self.workers.append(_Worker(index, executor, self.max_pending))
+        if self.executor_type == "thread":
+            # Thread workers share this process, and with it one landmark
+            # engine that batches across all of them
+            _init_worker(self.options)
+        if warm:
+            # Build the first detectors before any player connects
+            self.warming = [worker.executor.submit(_warm_pool, worker.index) for worker in self.workers]
+        try:
+            self.maintenance = asyncio.get_running_loop().create_task(self._evict_idle_loop())
+        except RuntimeError:
+            pass  # No event loop; idle detectors are then only evicted on release
+        logger.info(f"Detector engine started: {self.num_workers} {self.executor_type} worker(s)")
+
+    @property
+    def ready(self):
+        """True once the workers are started and done warming up"""
+        return bool(self.workers) and all(future.done() for future in self.warming)
+
+    async def warm_up(self):
+        """Start the workers if needed and wait until they are warmed up"""
+        if not self.workers:
+            self.start()
+        await asyncio.gather(*(asyncio.wrap_future(future) for future in self.warming))
+
+    def shutdown(self):
+        """Stop all workers, dropping frames that have not started yet"""
+        if self.maintenance is not None:
+            self.maintenance.cancel()
+            self.maintenance = None
+        for worker in self.workers:
+            worker.executor.shutdown(wait=False, cancel_futures=True)
+        self.workers = []
+        self.assignments = {}
+        self.warming = []
+
+    async def _evict_idle_loop(self):
+        interval = max(1.0, self.options.get("pool_idle_timeout", 300.0) / 2)
+        while True:
+            await asyncio.sleep(interval)
+            for worker in list(self.workers):
+                try:
+                    stats = await self._run(worker, _evict_idle, worker.index)
+                    logger.debug(f"Detector pool of worker {worker.index}: {stats}")
+                except RuntimeError:
+                    return  # Executor shut down
+
+    async def _run(self, worker, fn, *args):
+        loop = asyncio.get_running_loop()
+        worker.pending += 1
+        try:
+            async with worker.slots:
+                return await loop.run_in_executor(worker.executor, fn, *args)
+        finally:
+            worker.pending -= 1
+
+    async def register(self, connection_id):
+        """Pin a connection to the least loaded worker and create its detector"""
+        self.start()
+        worker = min(self.workers, key=lambda w: len(w.connections))
+        worker.connections.add(connection_id)
+        self.assignments[connection_id] = worker
+        try:
+            await self._run(worker, _create_detector, connection_id, worker.index)
+        except Exception:
+            worker.connections.discard(connection_id)
+            self.assignments.pop(connection_id, None)
+            raise
+        if connection_id not in self.assignments:
+            # Unregistered while the detector was being created
+            self._release(worker, connection_id)
+            return
+        self.usage[connection_id] = {"cpu_seconds": 0.0, "frames": 0, "buffer_bytes": 0}
+
+    def unregister(self, connection_id):
+        """Return the connection's detector to its worker's pool"""
+        worker = self.assignments.pop(connection_id, None)
+        self.usage.pop(connection_id, None)
+        if worker is None:
+            return
+        self._release(worker, connection_id)
+
+    def _release(self, worker, connection_id):
+        worker.connections.discard(connection_id)
+        try:
+            worker.executor.submit(_release_detector, connection_id, worker.index)
+        except RuntimeError:
+            # Executor already shut down
+            pass
+
+    async def process_frame(self, connection_id, frame_data, annotate=True, gate=False):
+        """Run a frame through the connection's detector.
+
+        Returns ``(bird_pos_y, processed_frame, landmarks)``, or None when the
+        frame could not be decoded. ``processed_frame`` is base64 text for
+        JSON frames, the encoded JPEG buffer for binary frames and None when
+        ``annotate`` is off. ``gate`` lets an unchanged frame reuse the last
+        result (see _process_frame).
+        """
+        worker = self.assignments[connection_id]
+        result, cpu_seconds, buffer_bytes = await self._run(
+            worker, _process_frame_accounted, connection_id, frame_data, annotate, gate
+        )
+        usage = self.usage.get(connection_id)
+        if usage is not None:
+            usage["cpu_seconds"] += cpu_seconds
+            usage["frames"] += 1
+            usage["buffer_bytes"] = buffer_bytes
+        return result
+
+    def session_usage(self, connection_id):
+        """CPU seconds, frames and buffer bytes used by a connection so far.
+
+        With thread workers the CPU seconds are an estimate and reported as
+        ``cpu_seconds_approx`` instead of ``cpu_seconds``.
+        """
+        usage = self.usage.get(connection_id, {"cpu_seconds": 0.0, "frames": 0, "buffer_bytes": 0})
+        cpu_key = "cpu_seconds" if self.executor_type == "process" else "cpu_seconds_approx"
+        return {
+            cpu_key: round(usage["cpu_seconds"], 3),
+            "frames": usage["frames"],
+            "buffer_bytes": usage["buffer_bytes"]
+        }
+
+    def queue_depth(self, connection_id):
+        """Calls queued on the connection's worker besides the one running"""
+        worker = self.assignments.get(connection_id)
+        if worker is None:
+            return 0
+        return max(0, worker.pending - 1)
+
+    async def set_players(self, connection_id, players):
+        """Detect up to ``players`` faces on the connection's frames.
+
+        With more than one, process_frame returns one bird position per
+        player and the landmarks list them under ``players``.
+        """
+        worker = self.assignments[connection_id]
+        await self._run(worker, _set_players, connection_id, players, worker.index)
+
+    async def reset_calibration(self, connection_id):
+        worker = self.assignments[connection_id]
+        await self._run(worker, _reset_calibration, connection_id)
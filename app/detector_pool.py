@@ -0,0 +1,125 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class DetectorPoolExhausted(RuntimeError):
+    pass
+
+
+class DetectorPool:
+    """Reusable FaceDetector instances of one detector worker.
+
+    Building a detector builds a MediaPipe graph, which is slow enough to
+    delay a new player's first frame. The pool creates ``warm_size``
+    detectors up front; connections lease one and give it back on
+    disconnect, when its calibration, smoothing and tracking state is reset
+    for the next player. At most ``max_idle`` returned detectors are kept,
+    detectors idle for longer than ``idle_timeout`` seconds are closed
+    (down to ``warm_size``), and with ``max_size`` no more than that many
+    detectors exist at once.
+
+    A pool is only used from its worker's thread, so it needs no locking.
+    """
+
+    def __init__(self, factory, warm_size=1, max_idle=4, max_size=0, idle_timeout=300.0):
+        self.factory = factory
+        self.warm_size = warm_size
+        self.max_idle = max(max_idle, warm_size)
+        self.max_size = max_size  # 0 for no limit
+        self.idle_timeout = idle_timeout
+
+        self.idle = []  # (detector, returned_at), most recently returned last
+        self.leased = 0
+
+        # Statistics
+        self.created = 0
+        self.reused = 0
+        self.closed = 0
+
+    def _create(self):
+        self.created += 1
+        return self.factory()
+
+    def warm(self):
+        """Create detectors until ``warm_size`` are idle"""
+        started = time.perf_counter()
+        count = 0
+        while len(self.idle) < self.warm_size and not self._full():
+            self.idle.append((self._create(), time.monotonic()))
+            count += 1
+        if count:
+            logger.info(f"Warmed {count} detector(s) in {time.perf_counter() - started:.2f}s")
+
+    def _full(self):
+        return self.max_size and self.leased + len(self.idle) >= self.max_size
+
+    def lease(self):
+        """Take an idle detector, or create one when none is left"""
+        if self.idle:
+            detector, _ = self.idle.pop()
+            self.reused += 1
+        elif self._full():
+            raise DetectorPoolExhausted(f"All {self.max_size} detectors are in use")
+        else:
+            detector = self._create()
+        self.leased += 1
+        return detector
+
+    def lease_unpooled(self, factory):
+        """Create a detector that is not reused, e.g. a multi-face one.
+
+        It still counts toward ``max_size``; an idle detector is closed to
+        make room for it if needed.
+        """
+        if self._full():
+            if not self.idle:
+                raise DetectorPoolExhausted(f"All {self.max_size} detectors are in use")
+            detector, _ = self.idle.pop(0)
+            self._close(detector)
+        detector = factory()
+        self.leased += 1
+        return detector
+
+    def give_back_unpooled(self, detector):
+        """Close a detector from lease_unpooled()"""
+        self.leased -= 1
+        self._close(detector)
+
+    def give_back(self, detector):
+        """Return a leased detector, resetting it for the next connection"""
+        self.leased -= 1
+        if len(self.idle) >= self.max_idle:
+            self._close(detector)
+        else:
+            detector.reset()
+            self.idle.append((detector, time.monotonic()))
+        self.evict_idle()
+
+    def evict_idle(self):
+        """Close detectors idle for longer than ``idle_timeout``, keeping ``warm_size``"""
+        deadline = time.monotonic() - self.idle_timeout
+        # The oldest idle detectors are at the front
+        while len(self.idle) > self.warm_size and self.idle[0][1] < deadline:
+            detector, _ = self.idle.pop(0)
+            self._close(detector)
+
+    def _close(self, detector):
+        detector.release()
+        self.closed += 1
+
+    def close(self):
+        """Close all idle detectors"""
+        while self.idle:
+            detector, _ = self.idle.pop()
+            self._close(detector)
+
+    def stats(self):
+        return {
+            "idle": len(self.idle),
+            "leased": self.leased,
+            "created": self.created,
+            "reused": self.reused,
+            "closed": self.closed
+        }
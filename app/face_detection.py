@@ -2,141 +2,300 @@ import cv2
 import mediapipe as mp
 import numpy as np
 import logging
+import time
+from app.face_tracking import FaceTracker
+from app.filters import DEFAULT_BIRD_POS, create_nose_filter
+from app.roi import roi_from_points, scale_roi, crop_roi, crop_to_frame
+from app.profiling import stage
 
 logger = logging.getLogger(__name__)
 class FaceDetector:
-    def __init__(self):
+    def __init__(self, landmark_engine=None, tracking=False, max_width=800, smoothing="one_euro", max_faces=1):
+        # With max_faces > 1 every face is a player (detect_players()); all
+        # faces come out of one FaceMesh pass over the full frame, so ROI
+        # tracking is not used
+        self.max_faces = max_faces
+        if max_faces > 1:
+            landmark_engine, tracking = None, False
+
+        # ROI tracking: once a face is found, only a small crop around it is
+        # run through the landmark model (a shared BatchedLandmarkEngine, or
+        # a LandmarkRunner of our own with tracking=True). FaceMesh on the
+        # full frame is only needed to find the face again once it is lost.
+        if landmark_engine is None and tracking:
+            try:
+                from app.landmark_model import LandmarkRunner
+                landmark_engine = LandmarkRunner()
+            except Exception as e:
+                logger.warning(f"ROI tracking disabled: {str(e)}")
+        self.landmark_engine = landmark_engine
+        self.max_width = max_width  # Larger frames are downscaled before full-frame detection
+        self.roi = None
+        self.min_face_score = 0.5
+        self.tracked_frames = 0
+        self.full_detections = 0
+        
         self.mp_face_mesh = mp.solutions.face_mesh
         self.face_mesh = self.mp_face_mesh.FaceMesh(
-            max_num_faces=1, 
+            # With ROI tracking FaceMesh only runs now and then to find the
+            # face again; its own tracking state would be stale by then
+            static_image_mode=self.landmark_engine is not None,
+            max_num_faces=max_faces, 
             refine_landmarks=True,
             min_detection_confidence=0.5, 
             min_tracking_confidence=0.5
         )
         self.mp_drawing = mp.solutions.drawing_utils
         
-        # For smoothing nose position
-        self.nose_positions = []
-        self.smoothing_window = 3
-        
-        # Calibration variables
-        self.nose_y_min = None
-        self.nose_y_max = None
-        self.calibration_frames = 0
-        self.max_calibration_frames = 30
-        self.is_calibrated = False
+        # Calibration of the nose range and smoothing of the bird position,
+        # per player with several faces
+        self.nose_filter = create_nose_filter(smoothing)
+        self.face_tracker = FaceTracker(max_faces, smoothing) if max_faces > 1 else None
         
         # Default bird position
-        self.default_bird_pos = 5.0
+        self.default_bird_pos = DEFAULT_BIRD_POS
         
         # Face detection tracking
         self.no_face_count = 0
         self.max_no_face_frames = 10
+        
+        # Last detection result in normalized frame coordinates
+        self.last_nose = None
+        self.last_bird_pos = self.default_bird_pos
+        
+        # Buffers reused from frame to frame (resized frame, RGB frame, crops)
+        self._buffers = {}
 
-    def detect_nose_position(self, frame):
+    def _buffer(self, name, shape):
+        """A reusable array of ``shape`` for intermediate results"""
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = self._buffers[name] = np.empty(shape, np.uint8)
+        return buffer
+
+    def detect_nose_position(self, frame, annotate=True, rgb=False):
+        """Detect the nose tip and map it to a bird position.
+
+        ``frame`` is BGR, or RGB with ``rgb=True`` (as decoded by app.codec),
+        which saves converting it for the landmark models.
+
+        Returns ``(bird_pos_y, image)``. With ``annotate=True`` the overlay is
+        drawn onto ``image``, the (possibly downscaled) frame in the same
+        channel order. With ``annotate=False`` no overlay is drawn and
+        ``image`` is None; use get_landmark_state() to let the client draw
+        the overlay itself.
+        """
         if frame is None:
             return self.default_bird_pos, frame
+        
+        # Follow a tracked face on a crop of the full-resolution frame
+        nose = None
+        if self.landmark_engine is not None and self.roi is not None:
+            nose = self.track_roi(frame, rgb)
             
         # Resize frame for better performance
+        if nose is None or annotate:
+            frame = self._downscale(frame)
         height, width = frame.shape[:2]
-        if width > 800:
-            scale = 800.0 / width
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            frame = cv2.resize(frame, (new_width, new_height))
-            height, width = new_height, new_width
-        
-        # Convert BGR to RGB
-        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        image.flags.writeable = False
-        results = self.face_mesh.process(image)
         
-        # Convert back to BGR for OpenCV
-        image.flags.writeable = True
-        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        if nose is not None:
+            self.tracked_frames += 1
+        else:
+            # Full-frame detection on RGB
+            image = self._rgb_image(frame, rgb)
+            image.flags.writeable = False
+            nose = self.detect_full_frame(image)
+            image.flags.writeable = True
+            self.full_detections += 1
+        
+        # The overlay is drawn onto the frame itself
+        image = frame if annotate else None
 
         bird_pos_y = self.default_bird_pos
+        self.last_nose = nose
         
-        if results.multi_face_landmarks:
+        if nose is not None:
             self.no_face_count = 0
+            nose_x, nose_y = nose
             
-            for face_landmarks in results.multi_face_landmarks:
-                # Get nose tip landmark (index 1)
-                nose_tip = face_landmarks.landmark[1]
-                
-                # Convert to pixel coordinates
-                nose_x_pixel = int(nose_tip.x * width)
-                nose_y_pixel = int(nose_tip.y * height)
-                
-                # Draw yellow circle at nose
-                cv2.circle(image, (nose_x_pixel, nose_y_pixel), 8, (0, 255, 255), -1)
-                cv2.circle(image, (nose_x_pixel, nose_y_pixel), 12, (0, 0, 255), 2)
-                
-                # Calibration phase
-                if not self.is_calibrated:
-                    self.calibrate_nose_position(nose_tip.y)
-                    if self.calibration_frames >= self.max_calibration_frames:
-                        self.is_calibrated = True
-                        logger.info(f"Calibration complete! Range: {self.nose_y_min:.3f} - {self.nose_y_max:.3f}")
-                
-                # Map nose position to bird position after calibration
-                if self.is_calibrated:
-                    bird_pos_y = self.map_nose_to_bird_position(nose_tip.y)
-                    
-                    # Apply smoothing
-                    self.nose_positions.append(bird_pos_y)
-                    if len(self.nose_positions) > self.smoothing_window:
-                        self.nose_positions.pop(0)
-                    
-                    if len(self.nose_positions) > 0:
-                        bird_pos_y = sum(self.nose_positions) / len(self.nose_positions)
-                
-                # Draw vertical guide line with matching yellow dot on the right side
-                guide_x = width - 50
-                guide_y_start = 50
-                guide_y_end = height - 50
-                cv2.line(image, (guide_x, guide_y_start), (guide_x, guide_y_end), (128, 128, 128), 2)
-                # Map bird_pos_y (0.5 to 8.5) to guide line range
-                guide_y = int(guide_y_start + (guide_y_end - guide_y_start) * (8.5 - bird_pos_y) / 8.0)
-                cv2.circle(image, (guide_x, guide_y), 8, (0, 255, 255), -1)
-                cv2.circle(image, (guide_x, guide_y), 12, (0, 0, 255), 2)
-                
-                break
+            # Calibrate, map to the bird position and smooth
+            bird_pos_y = self.nose_filter(nose_y, time.monotonic())
+            
+            if annotate:
+                with stage("draw"):
+                    self.draw_overlay(image, nose_x, nose_y, bird_pos_y, width, height, rgb)
         else:
             self.no_face_count += 1
             if self.no_face_count > self.max_no_face_frames:
                 bird_pos_y = self.default_bird_pos
 
+        self.last_bird_pos = bird_pos_y
         return bird_pos_y, image
 
-    def calibrate_nose_position(self, nose_y):
-        """Calibrate the range of nose movement"""
-        if self.nose_y_min is None or nose_y < self.nose_y_min:
-            self.nose_y_min = nose_y
-        if self.nose_y_max is None or nose_y > self.nose_y_max:
-            self.nose_y_max = nose_y
+    def _downscale(self, frame):
+        """The frame, resized to ``max_width`` if it is wider"""
+        height, width = frame.shape[:2]
+        if width <= self.max_width:
+            return frame
+        scale = float(self.max_width) / width
+        new_width = int(width * scale)
+        new_height = int(height * scale)
+        with stage("resize"):
+            return cv2.resize(frame, (new_width, new_height),
+                              dst=self._buffer("resized", (new_height, new_width, 3)))
+
+    def _rgb_image(self, frame, rgb):
+        """The frame in RGB order for the landmark models"""
+        if rgb:
+            return frame
+        with stage("color"):
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self._buffer("rgb", frame.shape))
+
+    def detect_players(self, frame, annotate=True, rgb=False):
+        """Detect every face and map each to its player's bird position.
+
+        Like detect_nose_position(), for a detector with ``max_faces > 1``.
+        Returns ``(positions, image)`` with one bird position per player
+        slot; see app.face_tracking for how faces keep their slot.
+        """
+        if frame is None:
+            return [self.default_bird_pos] * self.max_faces, frame
+        
+        frame = self._downscale(frame)
+        height, width = frame.shape[:2]
+        image = self._rgb_image(frame, rgb)
+        image.flags.writeable = False
+        with stage("inference"):
+            results = self.face_mesh.process(image)
+        image.flags.writeable = True
+        self.full_detections += 1
+        noses = [(face.landmark[1].x, face.landmark[1].y) for face in results.multi_face_landmarks or ()]
         
-        self.calibration_frames += 1
+        positions = self.face_tracker.update(noses, time.monotonic())
+        tracks = self.face_tracker.tracks
+        self.last_nose = tracks[0].nose if tracks[0].found else None
+        self.last_bird_pos = positions[0]
+        
+        image = frame if annotate else None
+        if annotate:
+            with stage("draw"):
+                for track in tracks:
+                    if track.found:
+                        self.draw_overlay(image, track.nose[0], track.nose[1], track.bird_pos, width, height, rgb,
+                                          player=track.index)
+        return positions, image
 
-    def map_nose_to_bird_position(self, nose_y):
-        """Map nose Y position to bird position (0-9)"""
-        if self.nose_y_min is None or self.nose_y_max is None:
-            return self.default_bird_pos
+    def detect_full_frame(self, image):
+        """Find the nose tip (landmark 1) in a full RGB frame with FaceMesh"""
+        height, width = image.shape[:2]
+        with stage("inference"):
+            results = self.face_mesh.process(image)
+        if not results.multi_face_landmarks:
+            return None
         
-        y_range = self.nose_y_max - self.nose_y_min
-        if y_range < 0.02:
-            return self.default_bird_pos
+        landmarks = results.multi_face_landmarks[0].landmark
+        if self.landmark_engine is not None:
+            self.roi = roi_from_points(
+                [p.x for p in landmarks], [p.y for p in landmarks], width, height
+            )
+        # Get nose tip landmark (index 1)
+        return landmarks[1].x, landmarks[1].y
+
+    def track_roi(self, frame, rgb=False):
+        """Find the nose tip on a crop around the tracked face ROI.
+
+        Works on the frame at its original resolution; a BGR frame only has
+        the crop converted to RGB. If the face is not in the crop, a crop twice the
+        size is tried before giving up the ROI, so that a fast head movement
+        does not cost a full-frame detection. If the landmark engine fails,
+        tracking is turned off for this detector.
+        """
+        height, width = frame.shape[:2]
+        crop_size = self.landmark_engine.input_size
         
-        # Normalize nose position within the calibrated range (no inversion)
-        normalized_y = (nose_y - self.nose_y_min) / y_range
+        for roi in (self.roi, scale_roi(self.roi, 2.0)):
+            crop = crop_roi(frame, roi, crop_size, out=self._buffer("crop", (crop_size, crop_size, 3)))
+            if not rgb:
+                with stage("color"):
+                    crop = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB, dst=self._buffer("crop_rgb", crop.shape))
+            try:
+                with stage("inference"):
+                    landmarks, score = self.landmark_engine.infer(crop)
+            except Exception as e:
+                # E.g. the landmark model could not be loaded; FaceMesh on
+                # the full frame still works
+                logger.warning(f"ROI tracking disabled: {str(e)}")
+                self.landmark_engine = None
+                break
+            if score >= self.min_face_score:
+                xs, ys = crop_to_frame(landmarks, roi, crop_size, width, height)
+                self.roi = roi_from_points(xs, ys, width, height)
+                return float(xs[1]), float(ys[1])
         
-        # Clamp to 0-1 range with some tolerance
-        normalized_y = max(-0.1, min(1.1, normalized_y))
+        self.roi = None  # Face lost, detect on the full frame again
+        return None
+
+    def draw_overlay(self, image, nose_x, nose_y, bird_pos_y, width, height, rgb=False, player=None):
+        """Draw the nose marker and the bird position guide onto a BGR or RGB image.
+
+        With several players, ``player`` is the player's slot: its guide is
+        drawn further left and its number next to the nose.
+        """
+        yellow, red, gray = (0, 255, 255), (0, 0, 255), (128, 128, 128)
+        if rgb:
+            yellow, red = yellow[::-1], red[::-1]
+        
+        # Convert to pixel coordinates
+        nose_x_pixel = int(nose_x * width)
+        nose_y_pixel = int(nose_y * height)
         
-        # Map to bird positions (0.5 to 8.5) directly (no inversion)
-        bird_pos_y = normalized_y * 8.0 + 0.5
+        # Draw yellow circle at nose
+        cv2.circle(image, (nose_x_pixel, nose_y_pixel), 8, yellow, -1)
+        cv2.circle(image, (nose_x_pixel, nose_y_pixel), 12, red, 2)
         
-        return max(0.5, min(8.5, bird_pos_y))
+        if player is not None:
+            cv2.putText(image, str(player + 1), (nose_x_pixel + 14, nose_y_pixel - 14),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, yellow, 2)
+        
+        # Draw vertical guide line with matching yellow dot on the right side
+        guide_x = width - 50 - 30 * (player or 0)
+        guide_y_start = 50
+        guide_y_end = height - 50
+        cv2.line(image, (guide_x, guide_y_start), (guide_x, guide_y_end), gray, 2)
+        # Map bird_pos_y (0.5 to 8.5) to guide line range
+        guide_y = int(guide_y_start + (guide_y_end - guide_y_start) * (8.5 - bird_pos_y) / 8.0)
+        cv2.circle(image, (guide_x, guide_y), 8, yellow, -1)
+        cv2.circle(image, (guide_x, guide_y), 12, red, 2)
+
+    def get_landmark_state(self):
+        """Last detection result for clients that draw the overlay themselves.
+
+        ``nose`` is in normalized frame coordinates (None without a face) and
+        ``guide_pos`` is the bird position along the guide line, 0 at the top
+        and 1 at the bottom. With several players the same fields are listed
+        per player under ``players``.
+        """
+        if self.face_tracker is not None:
+            players = [self._player_state(track) for track in self.face_tracker.tracks]
+            # Player 1 also at the top level, for clients without multiplayer
+            return {**{k: v for k, v in players[0].items() if k != "player"}, "players": players}
+        return self._landmark_state(self.last_nose, self.last_bird_pos, self.nose_filter)
+
+    @staticmethod
+    def _landmark_state(nose, bird_pos, nose_filter):
+        if nose is not None:
+            nose = {"x": round(nose[0], 4), "y": round(nose[1], 4)}
+        return {
+            "nose": nose,
+            "bird_pos_y": round(float(bird_pos), 3),
+            "guide_pos": round((8.5 - bird_pos) / 8.0, 4),
+            "calibrated": nose_filter.is_calibrated,
+            "calibration_progress": round(nose_filter.calibrator.progress(), 3)
+        }
+
+    def _player_state(self, track):
+        nose = track.nose if track.found else None
+        return {"player": track.index + 1, **self._landmark_state(nose, track.bird_pos, track.nose_filter)}
 
     def draw_debug_info(self, image, nose_tip_y, bird_pos_y, width, height):
         # This function is now empty as we removed all debug text
@@ -148,14 +307,23 @@ class FaceDetector:
 
     def reset_calibration(self):
         """Reset calibration for a new user"""
-        self.nose_y_min = None
-        self.nose_y_max = None
-        self.calibration_frames = 0
-        self.is_calibrated = False
-        self.nose_positions = []
+        self.nose_filter.reset()
+        if self.face_tracker is not None:
+            self.face_tracker.reset()
         self.no_face_count = 0
+        self.last_nose = None
+        self.last_bird_pos = self.default_bird_pos
+        self.roi = None
         logger.info("Calibration reset")
 
+    def reset(self):
+        """Forget everything about the current user before reuse by another"""
+        self.reset_calibration()
+        self.tracked_frames = 0
+        self.full_detections = 0
+        # Drop FaceMesh's tracking state from the previous user's frames
+        self.face_mesh.reset()
+
     def release(self):
         """Release MediaPipe resources"""
         if hasattr(self, 'face_mesh'):
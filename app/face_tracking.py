@@ -0,0 +1,95 @@
+import math
+
+from app.filters import DEFAULT_BIRD_POS, create_nose_filter
+
+# Face to player assignment for several players in front of one camera.
+#
+# FaceMesh returns the faces of a frame in no particular order, so every
+# frame the detected noses are matched to the players' last nose positions:
+# closest pairs first, up to ``max_distance`` apart (normalized frame
+# coordinates). A nose without a match takes the lowest free player slot,
+# left to right in the image. A player keeps its slot, and its calibration,
+# while its face is missing for up to ``max_missing`` frames, e.g. when
+# turning away or being covered by another player for a moment.
+
+
+class PlayerTrack:
+    """One player slot: last nose position and its own calibration"""
+
+    def __init__(self, index, smoothing="one_euro"):
+        self.index = index
+        self.nose_filter = create_nose_filter(smoothing)
+        self.nose = None  # (x, y) of the last match, None while the slot is free
+        self.missing = 0  # Frames since the last match
+        self.bird_pos = DEFAULT_BIRD_POS
+        self.found = False  # Matched in the last frame
+
+    @property
+    def active(self):
+        return self.nose is not None
+
+    def release(self):
+        self.nose_filter.reset()
+        self.nose = None
+        self.missing = 0
+        self.bird_pos = DEFAULT_BIRD_POS
+        self.found = False
+
+
+class FaceTracker:
+    """Keeps each detected face on the same player from frame to frame"""
+
+    def __init__(self, max_players, smoothing="one_euro", max_distance=0.25, max_missing=45,
+                 max_no_face_frames=10):
+        self.tracks = [PlayerTrack(index, smoothing) for index in range(max_players)]
+        self.max_distance = max_distance
+        self.max_missing = max_missing
+        # Like FaceDetector: the bird returns to the default position when
+        # the face has been missing for this many frames
+        self.max_no_face_frames = max_no_face_frames
+
+    def match(self, noses):
+        """Assign ``noses`` to player slots; returns ``{track_index: nose}``"""
+        pairs = sorted(
+            (math.dist(track.nose, nose), track.index, n)
+            for track in self.tracks if track.active
+            for n, nose in enumerate(noses)
+        )
+        assigned = {}
+        used = set()
+        for distance, index, n in pairs:
+            if distance > self.max_distance:
+                break
+            if index in assigned or n in used:
+                continue
+            assigned[index] = noses[n]
+            used.add(n)
+
+        free = [track.index for track in self.tracks if not track.active and track.index not in assigned]
+        new = sorted((nose for n, nose in enumerate(noses) if n not in used), key=lambda nose: nose[0])
+        for index, nose in zip(free, new):
+            assigned[index] = nose
+        return assigned
+
+    def update(self, noses, timestamp):
+        """Feed the noses of one frame; returns the bird position of every player"""
+        assigned = self.match(noses)
+        for track in self.tracks:
+            nose = assigned.get(track.index)
+            if nose is not None:
+                track.nose = nose
+                track.missing = 0
+                track.found = True
+                track.bird_pos = track.nose_filter(nose[1], timestamp)
+            elif track.active:
+                track.missing += 1
+                track.found = False
+                if track.missing > self.max_missing:
+                    track.release()
+                elif track.missing > self.max_no_face_frames:
+                    track.bird_pos = DEFAULT_BIRD_POS
+        return [track.bird_pos for track in self.tracks]
+
+    def reset(self):
+        for track in self.tracks:
+            track.release()
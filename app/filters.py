@@ -0,0 +1,244 @@
+import bisect
+import logging
+import math
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Turn detected nose heights into bird positions.
+#
+# A NoseFilter runs every detection through two stages:
+#
+#   RangeCalibrator   learns the range the nose moves in from rolling
+#                     percentiles, and maps the nose into it
+#   smoother          MovingAverage or OneEuroFilter on the bird position
+#
+# Every stage costs constant time per frame (the calibrator's sorted window
+# has a fixed size). Each also has a batch() method for a whole recorded
+# stream that gives the same result as feeding the values one by one, using
+# NumPy where the stage allows it.
+
+DEFAULT_BIRD_POS = 5.0
+
+
+class MovingAverage:
+    """Mean of the last ``window`` values, kept in a ring buffer"""
+
+    def __init__(self, window=3):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.buffer = [0.0] * self.window
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+
+    def __call__(self, value, timestamp=None):
+        if self.count == self.window:
+            self.total -= self.buffer[self.index]
+        else:
+            self.count += 1
+        self.buffer[self.index] = value
+        self.total += value
+        self.index = (self.index + 1) % self.window
+        if self.index == 0:
+            self.total = math.fsum(self.buffer[:self.count])  # Drop rounding errors once per lap
+        return self.total / self.count
+
+    def batch(self, values, timestamps=None):
+        values = np.asarray(values, dtype=np.float64)
+        sums = np.cumsum(values)
+        sums[self.window:] -= sums[:-self.window].copy()
+        counts = np.minimum(np.arange(1, len(values) + 1), self.window)
+        return sums / counts
+
+
+class OneEuroFilter:
+    """One Euro filter (Casiez et al., CHI 2012).
+
+    An exponential smoother whose cutoff frequency rises with the speed of
+    the signal: jitter of a still head is smoothed away, while a quick head
+    movement passes with little lag, unlike a moving average that always
+    lags by half its window. ``rate`` is the frame rate assumed when no
+    usable timestamps are given.
+    """
+
+    def __init__(self, min_cutoff=1.0, beta=0.3, d_cutoff=1.0, rate=15.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.rate = rate
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self.speed = 0.0
+        self.last_time = None
+
+    @staticmethod
+    def _alpha(cutoff, dt):
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def __call__(self, value, timestamp=None):
+        if self.value is None:
+            self.value = value
+            self.last_time = timestamp
+            return value
+
+        dt = 1.0 / self.rate
+        if timestamp is not None and self.last_time is not None and timestamp > self.last_time:
+            dt = timestamp - self.last_time
+        self.last_time = timestamp
+
+        speed = (value - self.value) / dt
+        self.speed += self._alpha(self.d_cutoff, dt) * (speed - self.speed)
+        cutoff = self.min_cutoff + self.beta * abs(self.speed)
+        self.value += self._alpha(cutoff, dt) * (value - self.value)
+        return self.value
+
+    def batch(self, values, timestamps=None):
+        # Every output depends on the previous one, so this is a plain loop
+        # over a fresh filter
+        fresh = OneEuroFilter(self.min_cutoff, self.beta, self.d_cutoff, self.rate)
+        if timestamps is None:
+            timestamps = [None] * len(values)
+        return np.array([fresh(float(v), t) for v, t in zip(values, timestamps)], dtype=np.float64)
+
+
+def _percentile(ordered, q):
+    """Percentile of a sorted list, interpolated like numpy.percentile"""
+    position = q / 100.0 * (len(ordered) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    a, b, t = ordered[lower], ordered[upper], position - lower
+    return b - (b - a) * (1 - t) if t >= 0.5 else a + (b - a) * t
+
+
+class RangeCalibrator:
+    """Range of nose heights from rolling percentiles of the recent detections.
+
+    The range is the ``low`` to ``high`` percentile of the last ``window``
+    nose heights, so single outliers do not stretch it and it follows the
+    player when they move or the camera shifts. It is usable after
+    ``warmup`` detections, and only replaced by ranges at least
+    ``min_range`` wide, so a player who keeps still keeps their range.
+    """
+
+    def __init__(self, window=450, low=5.0, high=95.0, warmup=30, min_range=0.02):
+        self.window = window
+        self.low = low
+        self.high = high
+        self.warmup = warmup
+        self.min_range = min_range
+        self.reset()
+
+    def reset(self):
+        self.samples = deque()
+        self.ordered = []
+        self.count = 0
+        self.range = None  # (low, high) nose heights
+
+    @property
+    def is_calibrated(self):
+        return self.count >= self.warmup
+
+    def progress(self):
+        return min(1.0, self.count / self.warmup)
+
+    def update(self, nose_y):
+        self.samples.append(nose_y)
+        bisect.insort(self.ordered, nose_y)
+        if len(self.samples) > self.window:
+            del self.ordered[bisect.bisect_left(self.ordered, self.samples.popleft())]
+        self.count += 1
+
+        if self.is_calibrated:
+            low = _percentile(self.ordered, self.low)
+            high = _percentile(self.ordered, self.high)
+            if high - low >= self.min_range:
+                self.range = (low, high)
+
+    def batch(self, nose_ys):
+        """Ranges in effect after each value of a fresh calibrator, as ``(low, high)`` arrays (NaN without a range)"""
+        # Sorting every window with NumPy costs more than updating one
+        # sorted window, so this runs a fresh calibrator over the values
+        fresh = RangeCalibrator(self.window, self.low, self.high, self.warmup, self.min_range)
+        ranges = np.full((len(nose_ys), 2), np.nan)
+        for i, nose_y in enumerate(nose_ys):
+            fresh.update(float(nose_y))
+            if fresh.range is not None:
+                ranges[i] = fresh.range
+        return ranges[:, 0], ranges[:, 1]
+
+
+def map_to_bird(nose_y, low, high):
+    """Map a nose height inside the calibrated range to a bird position (0.5 to 8.5)"""
+    # Normalize within the range, with some tolerance beyond its ends
+    normalized = max(-0.1, min(1.1, (nose_y - low) / (high - low)))
+    return max(0.5, min(8.5, normalized * 8.0 + 0.5))
+
+
+class NoseFilter:
+    """Calibration, mapping and smoothing of one player's nose heights"""
+
+    def __init__(self, smoother=None, calibrator=None, default=DEFAULT_BIRD_POS):
+        self.smoother = smoother if smoother is not None else OneEuroFilter()
+        self.calibrator = calibrator if calibrator is not None else RangeCalibrator()
+        self.default = default
+
+    @property
+    def is_calibrated(self):
+        return self.calibrator.is_calibrated
+
+    def reset(self):
+        self.smoother.reset()
+        self.calibrator.reset()
+
+    def __call__(self, nose_y, timestamp=None):
+        """Bird position for a detected nose height; the default while calibrating"""
+        calibrator = self.calibrator
+        calibrator.update(nose_y)
+        if not calibrator.is_calibrated:
+            return self.default
+        if calibrator.count == calibrator.warmup:
+            if calibrator.range:
+                logger.info(f"Calibration complete! Range: {calibrator.range[0]:.3f} - {calibrator.range[1]:.3f}")
+            else:
+                logger.info("Calibration complete, waiting for more head movement")
+
+        bird_pos_y = self.default
+        if calibrator.range is not None:
+            bird_pos_y = map_to_bird(nose_y, *calibrator.range)
+        return self.smoother(bird_pos_y, timestamp)
+
+    def batch(self, nose_ys, timestamps=None):
+        """Bird positions for a whole recorded stream.
+
+        The same as feeding the values one by one into a freshly reset
+        filter; the filter itself is left unchanged.
+        """
+        nose_ys = np.asarray(nose_ys, dtype=np.float64)
+        lows, highs = self.calibrator.batch(nose_ys)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            normalized = np.clip((nose_ys - lows) / (highs - lows), -0.1, 1.1)
+        positions = np.where(np.isnan(lows), self.default, np.clip(normalized * 8.0 + 0.5, 0.5, 8.5))
+
+        result = np.full(len(nose_ys), self.default)
+        start = min(self.calibrator.warmup - 1, len(nose_ys))
+        if timestamps is not None:
+            timestamps = list(timestamps)[start:]
+        result[start:] = self.smoother.batch(positions[start:], timestamps)
+        return result
+
+
+def create_nose_filter(smoothing="one_euro"):
+    """NoseFilter with the named smoother: "one_euro" or "average" (last 3 positions)"""
+    if smoothing == "average":
+        return NoseFilter(MovingAverage(3))
+    if smoothing == "one_euro":
+        return NoseFilter(OneEuroFilter())
+    raise ValueError(f"Unknown smoothing: {smoothing}")
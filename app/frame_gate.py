@@ -0,0 +1,61 @@
+import cv2
+import numpy as np
+
+from app.profiling import stage
+
+# Pre-inference check for frames that hardly differ from the last frame
+# that went through face detection, so a player holding still, or not
+# playing at all, does not cost a full FaceMesh pass per frame.
+#
+# Frames are compared on a grayscale thumbnail decoded at 1/8 size, which
+# for JPEG uses the decoder's DCT scaling and costs a fraction of a full
+# decode. The comparison is against the thumbnail of the last frame that
+# was let through, not the previous frame, so a slow movement adds up
+# until it counts as a change.
+
+
+class FrameGate:
+    """Decides per frame whether detection has to run again.
+
+    A frame counts as changed when the mean absolute difference of its
+    thumbnail to the reference is at least ``threshold`` grey levels, when
+    ``max_skip`` frames in a row were skipped already, or when there is no
+    reference yet. Changed frames become the new reference.
+    """
+
+    def __init__(self, threshold=1.0, max_skip=10):
+        self.threshold = threshold
+        self.max_skip = max_skip
+        self.reference = None
+        self.skipped = 0  # Frames skipped since the reference
+
+        # Statistics
+        self.checked = 0
+        self.total_skipped = 0
+
+    def changed(self, data):
+        """True if the encoded frame ``data`` has to be run through detection"""
+        self.checked += 1
+        with stage("gate"):
+            thumbnail = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+            if (thumbnail is not None and self.reference is not None
+                    and thumbnail.shape == self.reference.shape and self.skipped < self.max_skip
+                    and cv2.mean(cv2.absdiff(thumbnail, self.reference))[0] < self.threshold):
+                self.skipped += 1
+                self.total_skipped += 1
+                return False
+        self.reference = thumbnail
+        self.skipped = 0
+        return True
+
+    def reset(self):
+        """Forget the reference; the next frame is always processed"""
+        self.reference = None
+        self.skipped = 0
+
+    def stats(self):
+        return {
+            "checked": self.checked,
+            "skipped": self.total_skipped,
+            "skip_rate": round(self.total_skipped / self.checked, 4) if self.checked else 0.0
+        }
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+
+class LatestFrameSlot:
+    """Single-entry frame buffer for one connection (latest frame wins).
+
+    The receive loop puts raw, still-encoded frames in; the frame consumer
+    takes the newest one when it is ready for more work. A frame that is
+    replaced before it was taken is dropped without ever being decoded.
+    """
+
+    def __init__(self):
+        self._frame = None
+        self._received_at = 0.0
+        self._event = asyncio.Event()
+
+        # Statistics
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+        self.last_age = 0.0
+
+    def put(self, frame_data):
+        """Store a newly received frame; returns True if a pending one was dropped"""
+        dropped = self._frame is not None
+        if dropped:
+            self.dropped += 1
+        self._frame = frame_data
+        self._received_at = time.monotonic()
+        self.received += 1
+        self._event.set()
+        return dropped
+
+    async def wait(self):
+        """Wait until a frame is pending"""
+        await self._event.wait()
+
+    def take(self):
+        """Take the pending frame, returning ``(frame_data, received_at)``"""
+        frame_data, received_at = self._frame, self._received_at
+        self._frame = None
+        self._event.clear()
+        if frame_data is not None:
+            self.processed += 1
+        return frame_data, received_at
+
+    def pending(self):
+        return 0 if self._frame is None else 1
+
+    def pending_bytes(self):
+        return 0 if self._frame is None else len(self._frame)
+
+    def record_age(self, received_at):
+        """Record how long a frame took from arrival to applied result"""
+        self.last_age = time.monotonic() - received_at
+        return self.last_age
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "last_age_ms": round(self.last_age * 1000.0, 1)
+        }
@@ -1,13 +1,17 @@
 import random
-import os
 import time
+import numpy as np
+from app.highscore_store import HighscoreStore
+from app.pipe_store import PipeStore
 
 class Game:
-    def __init__(self):
+    def __init__(self, highscore_store=None, player_id="anonymous", seed=None, clock=time.time):
         # Game modes
         self.game_mode = "preview"  # "preview", "playing", "paused", "game_over"
         
-        # Score system
+        # Score system, highscores live in memory and are shared between games
+        self.highscore_store = highscore_store or HighscoreStore()
+        self.player_id = player_id
         self.score = 0
         self.highscore = self.read_highscore()
         
@@ -17,16 +21,32 @@ class Game:
         self.gravity = 0.4  # Reduced gravity for slower start
         self.terminal_velocity = 6.0  # Reduced terminal velocity
         
-        # Pipes system
-        self.pipes = []
+        # Pipes system, stored in a PipeStore slot (shared with other games
+        # once the game is stepped through a GameBatch)
+        self.pipe_store = PipeStore(capacity=4)
+        self.pipe_slot = self.pipe_store.add_slot()
         self.pipe_speed = 0.2  # Start slow
         self.max_pipe_speed = 0.8  # Maximum speed
         self.speed_increase_rate = 0.02  # How fast speed increases
         self.pipe_count = 0  # Total pipes passed
+        self.next_pipe_id = 0  # Pipes get ids so clients can track them
+        self.scroll = 0.0  # Total distance the pipes have moved
+        
+        # Randomness is seeded so a game can be replayed: each round draws a
+        # round seed from ``rng`` and spawns its pipes from ``round_rng``
+        self.seed = seed if seed is not None else random.getrandbits(32)
+        self.rng = random.Random(self.seed)
+        self.round_seed = None
+        self.round_rng = random.Random(0)
         
         # Timing
-        self.last_pipe_time = time.time()
-        self.last_update_time = time.time()
+        # Movement constants are per update at the 10 FPS the browser used to
+        # drive the game; step() scales them to the actual timestep.
+        self.reference_rate = 10.0
+        self.sim_time = 0.0  # Simulated seconds, advanced by step()
+        self.play_time = 0.0  # Simulated seconds spent in playing mode
+        self.clock = clock  # Wall clock, only used by update()
+        self.last_update_time = self.clock()
         self.game_start_time = None
         
         # Game over dialog
@@ -38,25 +58,27 @@ class Game:
         self.preview_mode_active = True
 
     def read_highscore(self):
-        try:
-            with open("data/highscore.txt", "r") as f:
-                return int(f.read())
-        except:
-            return 0
+        return self.highscore_store.best()
 
     def save_highscore(self):
-        if self.score > self.highscore:
-            os.makedirs("data", exist_ok=True)
-            with open("data/highscore.txt", "w") as f:
-                f.write(str(self.score))
-            self.highscore = self.score
+        """Submit the final score, persisted in the background by the store"""
+        self.highscore_store.submit(self.player_id, self.score)
+        self.highscore = self.read_highscore()
             
-    def start_game(self):
-        """Start the actual game with obstacles"""
+    def start_game(self, round_seed=None):
+        """Start the actual game with obstacles.
+
+        The pipes of the round follow from ``round_seed`` (drawn from the
+        game's own seed when not given) and the inputs of every step.
+        """
+        self.round_seed = round_seed if round_seed is not None else self.rng.getrandbits(32)
+        self.round_rng.seed(self.round_seed)
         self.game_mode = "playing"
         self.preview_mode_active = False
-        self.game_start_time = time.time()
-        self.pipes = [{"x": 15, "gap_y": random.randint(3, 7)}]
+        self.game_start_time = self.sim_time
+        self.play_time = 0.0
+        self.pipe_store.clear(self.pipe_slot)
+        self.spawn_pipe(15, self.round_rng.randint(3, 7))
         self.pipe_speed = 0.3  # Start slow
         self.score = 0
         self.pipe_count = 0
@@ -70,13 +92,13 @@ class Game:
             self.game_mode = "paused"
         elif self.game_mode == "paused":
             self.game_mode = "playing"
-            self.last_update_time = time.time()  # Reset timer to prevent big jumps
+            self.last_update_time = self.clock()  # Reset timer to prevent big jumps
 
     def enter_preview_mode(self):
         """Enter preview mode - bird movement only, no obstacles"""
         self.game_mode = "preview"
         self.preview_mode_active = True
-        self.pipes = []
+        self.pipe_store.clear(self.pipe_slot)
         self.score = 0
         self.pipe_count = 0
         self.bird_pos_y = 5.0
@@ -87,116 +109,146 @@ class Game:
         """Handle collision with obstacles"""
         self.game_mode = "game_over"
         self.show_restart_dialog = True
-        self.restart_dialog_start_time = time.time()
+        self.restart_dialog_start_time = self.sim_time
         self.save_highscore()
 
     def check_auto_restart(self):
         """Check if we should auto-restart after collision"""
         if (self.show_restart_dialog and 
-            self.restart_dialog_start_time and
-            time.time() - self.restart_dialog_start_time >= self.auto_restart_delay):
+            self.restart_dialog_start_time is not None and
+            self.sim_time - self.restart_dialog_start_time >= self.auto_restart_delay):
             self.restart()
             return True
         return False
 
     def update_game_speed(self):
         """Gradually increase game speed based on time played"""
-        if self.game_start_time and self.game_mode == "playing":
-            time_played = time.time() - self.game_start_time
+        if self.game_start_time is not None and self.game_mode == "playing":
             # Increase speed every 10 seconds
-            speed_multiplier = 1 + (time_played / 10.0) * self.speed_increase_rate
+            speed_multiplier = 1 + (self.play_time / 10.0) * self.speed_increase_rate
             self.pipe_speed = min(self.max_pipe_speed, 0.2 * speed_multiplier)
             
     def update(self, detected_nose_y):
-        current_time = time.time()
+        """Advance the game by the wall-clock time since the last update"""
+        current_time = self.clock()
         dt = current_time - self.last_update_time
         
         if dt < 0.016:  # Limit update rate to ~60fps
             return
+        
+        self.step(detected_nose_y, dt)
+        self.last_update_time = current_time
+
+    def step(self, detected_nose_y, dt):
+        """Advance the game by a fixed timestep of ``dt`` seconds"""
+        # Only update pipes and collision in playing mode
+        if self.step_bird(detected_nose_y, dt):
+            # Number of reference updates this step stands for
+            scale = dt * self.reference_rate
+            self.play_time += dt
+            self.update_game_speed()
+            self.update_pipes(scale)
+            self.check_pipes()
+
+    def step_bird(self, detected_nose_y, dt):
+        """First part of step(): timers and bird movement.
+
+        Returns True when the game is playing and its pipes, collisions and
+        scoring still need to be stepped (by step() or GameBatch.step()).
+        """
+        self.sim_time += dt
+        # Number of reference updates this step stands for
+        scale = dt * self.reference_rate
             
         # Check for auto-restart in game over mode
         if self.game_mode == "game_over":
             self.check_auto_restart()
-            return
+            return False
         
         # Update bird position based on nose detection
         if detected_nose_y is not None:
             # Smooth transition to detected position
             target_y = float(detected_nose_y)
-            # Use interpolation for smoother movement
-            self.bird_pos_y += (target_y - self.bird_pos_y) * 0.6
+            # Use interpolation for smoother movement (60% of the way per reference update)
+            self.bird_pos_y += (target_y - self.bird_pos_y) * (1.0 - 0.4 ** scale)
         else:
             # Apply gravity if no face detected
             if self.game_mode in ["playing", "preview"]:
-                self.bird_velocity += self.gravity
+                self.bird_velocity += self.gravity * scale
                 self.bird_velocity = min(self.bird_velocity, self.terminal_velocity)
-                self.bird_pos_y += self.bird_velocity
+                self.bird_pos_y += self.bird_velocity * scale
         
         # Keep bird within bounds
         self.bird_pos_y = max(0.5, min(8.5, self.bird_pos_y))
         
-        # Only update pipes and collision in playing mode
-        if self.game_mode == "playing":
-            self.update_game_speed()
-            self.update_pipes()
-            self.check_collisions()
-            self.check_scoring()
-        
-        self.last_update_time = current_time
+        return self.game_mode == "playing"
+
+    @property
+    def pipes(self):
+        """Current pipes as ``{"id", "x", "gap_y"}`` dicts"""
+        return self.pipe_store.pipes(self.pipe_slot)
+
+    def move_pipes_to(self, store):
+        """Move this game's pipes into another PipeStore, e.g. a GameBatch's"""
+        old_store, old_slot = self.pipe_store, self.pipe_slot
+        slot = store.add_slot()
+        for i in old_store.rows(old_slot):
+            store.add(slot, old_store.pipe_id[i], old_store.x[i], old_store.gap_y[i], old_store.scored[i])
+        old_store.remove_slot(old_slot)
+        self.pipe_store, self.pipe_slot = store, slot
+
+    def _own_slot(self, value, dtype=np.float64):
+        """Per-slot array that is ``value`` for this game only"""
+        array = self.pipe_store.per_slot(dtype)
+        array[self.pipe_slot] = value
+        return array
 
-    def update_pipes(self):
+    def spawn_pipe(self, x, gap_y):
+        self.pipe_store.add(self.pipe_slot, self.next_pipe_id, x, gap_y)
+        self.next_pipe_id += 1
+
+    def update_pipes(self, scale=1.0):
         """Update pipe positions and spawn new ones"""
-        # Move existing pipes
-        for pipe in self.pipes:
-            pipe["x"] -= self.pipe_speed
-        
-        # Remove pipes that are off screen
-        self.pipes = [p for p in self.pipes if p["x"] >= -3]
+        # Move existing pipes, removing those that are off screen
+        distance = self.pipe_speed * scale
+        self.scroll += distance
+        self.pipe_store.advance(self._own_slot(distance))
         
         # Add new pipe when needed
-        if not any(p["x"] > 15 for p in self.pipes):
-            # Vary gap position and size for difficulty
-            gap_y = random.randint(3, 7)
-            self.pipes.append({"x": 22, "gap_y": gap_y})
-
-    def check_scoring(self):
-        """Check if bird passed through pipe for scoring"""
-        scored_this_frame = False  # Flag untuk mencegah penghitungan ganda dalam satu frame
-        for pipe in self.pipes:
-            # Periksa hanya saat pipa baru saja melewati posisi burung (x sekitar 2.0)
-            if not scored_this_frame and not hasattr(pipe, 'scored') and 1.8 <= pipe["x"] < 2.0:
-                gap_start = pipe["gap_y"] - 1.5
-                gap_end = pipe["gap_y"] + 1.5
-                if gap_start <= self.bird_pos_y <= gap_end:
-                    self.score += 10
-                    self.pipe_count += 1
-                    pipe['scored'] = True
-                    scored_this_frame = True  # Tandai bahwa sudah mencetak skor di frame ini
-
-    def check_collisions(self):
-        """Check for collisions with pipes or boundaries"""
-        # Check ground and ceiling collision
-        if self.bird_pos_y <= 0.5 or self.bird_pos_y >= 8.5:
+        if not self.pipe_store.has_pipe_beyond(15)[self.pipe_slot]:
+            self.spawn_next_pipe()
+
+    def spawn_next_pipe(self):
+        # Vary gap position and size for difficulty
+        gap_y = self.round_rng.randint(3, 7)
+        self.spawn_pipe(22, gap_y)
+
+    def add_point(self):
+        self.score += 10
+        self.pipe_count += 1
+
+    def out_of_bounds(self):
+        """Ground and ceiling collision"""
+        return self.bird_pos_y <= 0.5 or self.bird_pos_y >= 8.5
+
+    def check_pipes(self):
+        """Check for collisions with pipes or boundaries, then for scoring"""
+        hits, scored = self.pipe_store.check(self._own_slot(self.bird_pos_y), self._own_slot(True, np.bool_))
+        if self.out_of_bounds() or hits[self.pipe_slot]:
             self.handle_collision()
-            return
-            
-        # Check pipe collision
-        for pipe in self.pipes:
-            if 0.5 <= pipe["x"] <= 3.5:  # Bird collision zone
-                gap_start = pipe["gap_y"] - 1.5
-                gap_end = pipe["gap_y"] + 1.5
-                if not (gap_start <= self.bird_pos_y <= gap_end):
-                    self.handle_collision()
-                    return
+        # Scoring is checked even on the step that ends the game, at most
+        # one pipe per step, while it has just passed the bird (x around 2.0)
+        if scored[self.pipe_slot]:
+            self.add_point()
 
     def restart(self):
         """Restart the game"""
         self.enter_preview_mode()  # Start in preview mode
-        self.last_update_time = time.time()
+        self.last_update_time = self.clock()
 
     def get_state(self):
         """Get current game state"""
-        self.highscore = self.read_highscore()  # Perbarui highscore dari file
+        self.highscore = self.read_highscore()  # Perbarui highscore dari memori
         return {
             "bird_pos_y": float(self.bird_pos_y),
             "pipes": self.pipes if not self.preview_mode_active else [],
@@ -208,13 +260,72 @@ class Game:
             "preview_mode": self.preview_mode_active,
             "show_restart_dialog": self.show_restart_dialog,
             "pipe_speed": self.pipe_speed,
+            "scroll": self.scroll,
             "auto_restart_countdown": self.get_restart_countdown()
         }
     
     def get_restart_countdown(self):
         """Get countdown time for auto restart"""
-        if (self.show_restart_dialog and self.restart_dialog_start_time):
-            elapsed = time.time() - self.restart_dialog_start_time
+        if (self.show_restart_dialog and self.restart_dialog_start_time is not None):
+            elapsed = self.sim_time - self.restart_dialog_start_time
             remaining = max(0, self.auto_restart_delay - elapsed)
             return int(remaining) + 1
-        return 0
\ No newline at end of file
+        return 0
+
+
+class GameBatch:
+    """Steps many games at once.
+
+    The pipes of all games live in one PipeStore, so moving, culling,
+    collision checks and scoring are one set of array operations per step
+    for all playing games together; only the bird update and rare events
+    (spawning a pipe, a collision, a point) run per game.
+    """
+
+    def __init__(self):
+        self.pipe_store = PipeStore(capacity=64)
+        self.games = {}
+
+    def add(self, game_id, game):
+        game.move_pipes_to(self.pipe_store)
+        self.games[game_id] = game
+
+    def remove(self, game_id):
+        game = self.games.pop(game_id, None)
+        if game is not None:
+            game.move_pipes_to(PipeStore(capacity=4))
+        return game
+
+    def step(self, inputs, dt):
+        """Advance every game by ``dt``; ``inputs`` maps game ids to nose positions"""
+        store = self.pipe_store
+        distance = store.per_slot()
+        bird_y = store.per_slot()
+        active = store.per_slot(np.bool_)
+        playing = []
+        for game_id, game in self.games.items():
+            if not game.step_bird(inputs.get(game_id), dt):
+                continue
+            game.play_time += dt
+            game.update_game_speed()
+            moved = game.pipe_speed * (dt * game.reference_rate)  # As in Game.update_pipes()
+            game.scroll += moved
+            distance[game.pipe_slot] = moved
+            active[game.pipe_slot] = True
+            playing.append(game)
+        if not playing:
+            return
+
+        store.advance(distance)
+        has_next = store.has_pipe_beyond(15)
+        for game in playing:
+            if not has_next[game.pipe_slot]:
+                game.spawn_next_pipe()
+            bird_y[game.pipe_slot] = game.bird_pos_y
+
+        hits, scored = store.check(bird_y, active)
+        for game in playing:
+            if game.out_of_bounds() or hits[game.pipe_slot]:
+                game.handle_collision()
+            if scored[game.pipe_slot]:
+                game.add_point()
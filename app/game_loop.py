@@ -0,0 +1,97 @@
+import asyncio
+import logging
+
+from app.game_logic import GameBatch
+
+logger = logging.getLogger(__name__)
+
+
+class GameLoop:
+    """Server-side scheduler that steps every active Game at a fixed rate.
+
+    Video frames only update the latest detected nose position of a game
+    (set_input); physics, pipes and scoring advance on the loop's own
+    timestep, and game state is pushed to clients at ``broadcast_rate``
+    through the ``on_broadcast`` coroutine. All games are stepped together
+    through a GameBatch.
+    """
+
+    def __init__(self, tick_rate=60, broadcast_rate=30, max_catchup_ticks=5):
+        self.tick_rate = tick_rate
+        self.broadcast_rate = broadcast_rate
+        self.dt = 1.0 / tick_rate
+        self.max_catchup_ticks = max_catchup_ticks
+        self.batch = GameBatch()
+        self.games = self.batch.games
+        self.inputs = {}
+        self.on_broadcast = None  # async callable taking a list of game ids
+        self.tick_count = 0
+        self._task = None
+
+    def add(self, game_id, game):
+        self.batch.add(game_id, game)
+        self.inputs[game_id] = None
+
+    def remove(self, game_id):
+        self.batch.remove(game_id)
+        self.inputs.pop(game_id, None)
+
+    def set_input(self, game_id, nose_y):
+        """Store the most recent detected position, used from the next tick on"""
+        if game_id in self.games:
+            self.inputs[game_id] = nose_y
+
+    def is_running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.is_running():
+            self._task = asyncio.create_task(self.run())
+            logger.info(f"Game loop started: {self.tick_rate} Hz ticks, {self.broadcast_rate} Hz broadcasts")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def step_all(self):
+        """Advance every game by one fixed timestep"""
+        self.batch.step(self.inputs, self.dt)
+        self.tick_count += 1
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        broadcast_interval = 1.0 / self.broadcast_rate
+        next_tick = next_broadcast = loop.time()
+
+        while True:
+            now = loop.time()
+
+            # Run the ticks that are due; if the server fell too far behind,
+            # skip ahead instead of fast-forwarding the games
+            ticks = 0
+            while next_tick <= now and ticks < self.max_catchup_ticks:
+                try:
+                    self.step_all()
+                except Exception as e:
+                    logger.error(f"Error stepping games: {str(e)}")
+                next_tick += self.dt
+                ticks += 1
+            if next_tick <= now:
+                next_tick = now + self.dt
+
+            if next_broadcast <= now:
+                if self.on_broadcast is not None and self.games:
+                    try:
+                        await self.on_broadcast(list(self.games))
+                    except Exception as e:
+                        logger.error(f"Error broadcasting game state: {str(e)}")
+                next_broadcast += broadcast_interval
+                if next_broadcast <= now:
+                    next_broadcast = now + broadcast_interval
+
+            await asyncio.sleep(max(0.0, min(next_tick, next_broadcast) - loop.time()))
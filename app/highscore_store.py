@@ -0,0 +1,250 @@
+import bisect
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class HighscoreStore:
+    """Highscores shared by all games, kept in memory and written behind.
+
+    Reads (best(), leaderboard()) never touch the filesystem. submit()
+    updates the in-memory tables and queues the result for a writer thread
+    that appends it to SQLite, one transaction per batch, so concurrent
+    games cannot corrupt the stored data. Without ``db_path`` the store is
+    memory only.
+    """
+
+    def __init__(self, db_path=None, legacy_path="data/highscore.txt", top_size=10):
+        self.db_path = db_path
+        self.legacy_path = legacy_path
+        self.top_size = top_size
+
+        self.player_best = {}  # player -> best score
+        self.player_top = {}  # player -> ascending list of top scores
+        self.global_best = 0
+
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = None
+
+        if self.db_path:
+            self.load()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS scores (
+                player TEXT NOT NULL,
+                score INTEGER NOT NULL,
+                achieved_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS scores_player ON scores (player, score)")
+        return conn
+
+    def load(self):
+        """Load stored scores into memory, importing the old highscore.txt once"""
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT player, score FROM scores").fetchall()
+            if not rows and self.legacy_path and os.path.exists(self.legacy_path):
+                try:
+                    with open(self.legacy_path, "r") as f:
+                        legacy_score = int(f.read())
+                    with conn:
+                        conn.execute(
+                            "INSERT INTO scores (player, score, achieved_at) VALUES (?, ?, ?)",
+                            ("anonymous", legacy_score, time.time())
+                        )
+                    rows = [("anonymous", legacy_score)]
+                    logger.info(f"Imported legacy highscore {legacy_score} from {self.legacy_path}")
+                except ValueError:
+                    pass
+        finally:
+            conn.close()
+
+        for player, score in rows:
+            self._record(player, score)
+        logger.info(f"Loaded {len(rows)} scores from {self.db_path}")
+
+    def start(self):
+        """Start the background writer thread"""
+        if self.db_path and self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name="highscore-writer", daemon=True)
+            self._writer.start()
+
+    def close(self):
+        """Flush pending scores and stop the writer thread"""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def _write_loop(self):
+        conn = self._connect()
+        try:
+            while True:
+                batch = [self._queue.get()]
+                # Drain whatever else is already waiting into the same transaction
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = None in batch
+                rows = [row for row in batch if row is not None]
+                if rows:
+                    try:
+                        with conn:
+                            conn.executemany(
+                                "INSERT INTO scores (player, score, achieved_at) VALUES (?, ?, ?)",
+                                rows
+                            )
+                    except sqlite3.Error as e:
+                        logger.error(f"Error saving {len(rows)} highscore(s): {str(e)}")
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _record(self, player, score):
+        with self._lock:
+            if score > self.player_best.get(player, 0):
+                self.player_best[player] = score
+            top = self.player_top.setdefault(player, [])
+            bisect.insort(top, score)
+            if len(top) > self.top_size:
+                del top[0]
+            self.global_best = max(self.global_best, score)
+
+    def submit(self, player, score):
+        """Record a finished game; returns True for a new personal best"""
+        if score <= 0:
+            return False
+        is_best = score > self.player_best.get(player, 0)
+        self._record(player, score)
+        if self.db_path:
+            self._queue.put((player, score, time.time()))
+        return is_best
+
+    def best(self, player=None):
+        """Best score of ``player``, or the global best"""
+        if player is None:
+            return self.global_best
+        return self.player_best.get(player, 0)
+
+    def leaderboard(self, limit=10):
+        """Global leaderboard: the best score of each player, highest first"""
+        with self._lock:
+            entries = sorted(self.player_best.items(), key=lambda item: item[1], reverse=True)
+        return [{"player": player, "score": score} for player, score in entries[:limit]]
+
+    def player_scores(self, player, limit=10):
+        """Per-player leaderboard: the player's top scores, highest first"""
+        with self._lock:
+            top = list(self.player_top.get(player, []))
+        return top[::-1][:limit]
+
+
+class SharedHighscoreStore(HighscoreStore):
+    """Highscores shared by several server processes through one SQLite file.
+
+    Works like HighscoreStore, but before answering a read it picks up
+    scores that other processes appended since the last look (at most every
+    ``refresh_interval`` seconds, and only when ``PRAGMA data_version``
+    says the file changed). Scores submitted here are already in memory and
+    are skipped when they come back from the file.
+    """
+
+    def __init__(self, db_path, legacy_path="data/highscore.txt", top_size=10, refresh_interval=0.5):
+        self.refresh_interval = refresh_interval
+        self.last_rowid = 0
+        self.data_version = None
+        self.next_refresh = 0.0
+        self.own_pending = set()  # Submitted here, not yet read back from the file
+        self._reader = None
+        self._read_lock = threading.Lock()
+        super().__init__(db_path=db_path, legacy_path=legacy_path, top_size=top_size)
+
+    def load(self):
+        super().load()
+        self._reader = sqlite3.connect(self.db_path, check_same_thread=False)
+        row = self._reader.execute("SELECT MAX(rowid) FROM scores").fetchone()
+        self.last_rowid = row[0] or 0
+        self.data_version = self._reader.execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self):
+        super().close()
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def refresh(self, force=False):
+        """Read scores added by other processes"""
+        now = time.monotonic()
+        if self._reader is None or (not force and now < self.next_refresh):
+            return
+        with self._read_lock:
+            self.next_refresh = now + self.refresh_interval
+            try:
+                data_version = self._reader.execute("PRAGMA data_version").fetchone()[0]
+                if data_version == self.data_version and not force:
+                    return
+                self.data_version = data_version
+                rows = self._reader.execute(
+                    "SELECT rowid, player, score, achieved_at FROM scores WHERE rowid > ? ORDER BY rowid",
+                    (self.last_rowid,)
+                ).fetchall()
+            except sqlite3.Error as e:
+                logger.error(f"Error reading shared highscores: {str(e)}")
+                return
+            for rowid, player, score, achieved_at in rows:
+                self.last_rowid = rowid
+                key = (player, score, achieved_at)
+                if key in self.own_pending:
+                    self.own_pending.discard(key)
+                else:
+                    self._record(player, score)
+
+    def submit(self, player, score):
+        if score <= 0:
+            return False
+        self.refresh()
+        is_best = score > self.player_best.get(player, 0)
+        self._record(player, score)
+        row = (player, score, time.time())
+        with self._read_lock:
+            self.own_pending.add(row)
+        self._queue.put(row)
+        return is_best
+
+    def best(self, player=None):
+        self.refresh()
+        return super().best(player)
+
+    def leaderboard(self, limit=10):
+        self.refresh()
+        return super().leaderboard(limit)
+
+    def player_scores(self, player, limit=10):
+        self.refresh()
+        return super().player_scores(player, limit)
+
+
+def create_highscore_store(backend="memory", db_path=None):
+    """Highscore store for ``backend``: "memory" keeps scores per process,
+    "sqlite" shares them between processes through ``db_path``"""
+    if backend == "memory":
+        return HighscoreStore(db_path=db_path)
+    if backend == "sqlite":
+        if not db_path:
+            raise ValueError("The sqlite highscore backend needs a database path")
+        return SharedHighscoreStore(db_path=db_path)
+    raise ValueError(f"Unknown highscore backend: {backend}")
@@ -0,0 +1,111 @@
+import logging
+import math
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def load_interpreter(model_path, num_threads=None):
+    """Create a TFLite interpreter from whichever runtime is installed"""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tensorflow.lite import Interpreter
+            except ImportError:
+                raise ImportError(
+                    "Batched landmark inference needs a TFLite runtime: "
+                    "pip install ai-edge-litert (or tflite-runtime)"
+                )
+    return Interpreter(model_path=model_path, num_threads=num_threads)
+
+
+class LandmarkModel:
+    """Face landmark model (face_landmark.tflite) run on batches of crops.
+
+    Input crops are 192x192 RGB uint8 images around a face. The batch
+    dimension of the interpreter is resized on demand, rounded up to a
+    power of two so that varying batch sizes rarely reallocate tensors.
+    """
+
+    input_size = 192
+    num_landmarks = 468
+
+    def __init__(self, model_path="face_landmark.tflite", num_threads=None):
+        self.model_path = model_path
+        self.interpreter = load_interpreter(model_path, num_threads)
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+
+        # Pick the mesh and face flag outputs by size. The attention model
+        # (face_landmark_with_attention.tflite, extra lips/eyes/iris
+        # outputs) needs MediaPipe's custom Landmarks2TransformMatrix op,
+        # which the plain TFLite runtimes do not have
+        outputs = self.interpreter.get_output_details()
+        if len(outputs) != 2:
+            raise ValueError(
+                f"{model_path} has {len(outputs)} outputs; only the plain face landmark model "
+                "(face_landmark.tflite) is supported, not the attention model"
+            )
+        self.landmarks_index = None
+        self.score_index = None
+        for output in outputs:
+            size = int(np.prod(output["shape"][1:]))
+            if size == self.num_landmarks * 3 and self.landmarks_index is None:
+                self.landmarks_index = output["index"]
+            elif size == 1:
+                self.score_index = output["index"]
+        if self.landmarks_index is None or self.score_index is None:
+            raise ValueError(f"{model_path} is not a face landmark model")
+
+        self.batch_capacity = 0
+        self.input_buffer = None
+
+    def _ensure_capacity(self, batch_size):
+        if batch_size <= self.batch_capacity:
+            return
+        capacity = 1 << math.ceil(math.log2(batch_size))
+        self.interpreter.resize_tensor_input(
+            self.input_index, [capacity, self.input_size, self.input_size, 3]
+        )
+        self.interpreter.allocate_tensors()
+        self.input_buffer = np.zeros((capacity, self.input_size, self.input_size, 3), np.float32)
+        self.batch_capacity = capacity
+        logger.info(f"Landmark model batch capacity: {capacity}")
+
+    def run(self, crops):
+        """Run a list of crops; returns ``(landmarks, scores)``.
+
+        ``landmarks`` is ``(N, 468, 3)`` in crop pixels and ``scores`` the
+        face presence probability of each crop.
+        """
+        batch_size = len(crops)
+        self._ensure_capacity(batch_size)
+
+        for i, crop in enumerate(crops):
+            np.multiply(crop, 1.0 / 255.0, out=self.input_buffer[i], casting="unsafe")
+
+        self.interpreter.set_tensor(self.input_index, self.input_buffer)
+        self.interpreter.invoke()
+
+        landmarks = self.interpreter.get_tensor(self.landmarks_index)
+        landmarks = landmarks.reshape(self.batch_capacity, self.num_landmarks, 3)[:batch_size]
+        logits = self.interpreter.get_tensor(self.score_index).reshape(self.batch_capacity)[:batch_size]
+        scores = 1.0 / (1.0 + np.exp(-logits))
+        return landmarks.copy(), scores
+
+
+class LandmarkRunner:
+    """Runs the landmark model directly on the calling thread, one crop at a
+    time. Same interface as BatchedLandmarkEngine, for a single session."""
+
+    def __init__(self, model_path="face_landmark.tflite", num_threads=1):
+        self.model = LandmarkModel(model_path, num_threads)
+        self.input_size = self.model.input_size
+
+    def infer(self, crop):
+        landmarks, scores = self.model.run([crop])
+        return landmarks[0], float(scores[0])
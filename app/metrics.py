@@ -0,0 +1,182 @@
+import bisect
+import threading
+
+from app import profiling
+
+# Minimal Prometheus-style metrics for the frame path, rendered in the text
+# exposition format by the /metrics endpoint. Stage timings arrive through
+# app.profiling once enable_stage_metrics() is called; with the process
+# executor only the stages that run in the server process (JSON, send) are
+# seen, the worker processes keep their own timings.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {} if label_names else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield self.name, _format_labels(self.label_names, label_values), value
+
+
+class Gauge:
+    """A value that is set directly or read from a function at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, function=None):
+        self.name = name
+        self.documentation = documentation
+        self.value = 0
+        self.function = function
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def samples(self):
+        value = self.function() if self.function is not None else self.value
+        yield self.name, "", value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.label_names = tuple(label_names)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.label_names, label_values, ("le", _format_value(float(bound))))
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.label_names, label_values, ("le", "+Inf"))
+            yield f"{self.name}_bucket", labels, series[-1]
+            plain = _format_labels(self.label_names, label_values)
+            yield f"{self.name}_sum", plain, series[-2]
+            yield f"{self.name}_count", plain, series[-1]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "flappy_frame_stage_seconds", "Time spent per frame processing stage", LATENCY_BUCKETS, ("stage",)
+))
+FRAME_SECONDS = REGISTRY.register(Histogram(
+    "flappy_frame_seconds", "Server time per frame, from arrival to the result being applied"
+))
+QUEUE_DEPTH = REGISTRY.register(Histogram(
+    "flappy_detector_queue_depth", "Frames queued on a connection's detector worker, sampled per frame",
+    DEPTH_BUCKETS
+))
+FRAMES_PROCESSED = REGISTRY.register(Counter(
+    "flappy_frames_processed_total", "Frames run through face detection"
+))
+FRAMES_SKIPPED = REGISTRY.register(Counter(
+    "flappy_frames_skipped_total", "Frames answered without face detection", ("reason",)
+))
+FRAMES_DROPPED = REGISTRY.register(Counter(
+    "flappy_frames_dropped_total", "Frames replaced by a newer one before processing"
+))
+ACTIVE_SESSIONS = REGISTRY.register(Gauge(
+    "flappy_active_sessions", "Open WebSocket game sessions"
+))
+SESSIONS_REJECTED = REGISTRY.register(Counter(
+    "flappy_sessions_rejected_total", "Connections turned away because the server was full", ("reason",)
+))
+SESSIONS_EVICTED = REGISTRY.register(Counter(
+    "flappy_sessions_evicted_total", "Sessions closed for being idle"
+))
+SPECTATORS = REGISTRY.register(Gauge(
+    "flappy_spectators", "Open spectator sockets"
+))
+SPECTATORS_DROPPED = REGISTRY.register(Counter(
+    "flappy_spectators_dropped_total", "Spectators disconnected for falling too far behind"
+))
+
+
+class _StageHistograms:
+    def add(self, name, seconds):
+        STAGE_SECONDS.observe(seconds, name)
+
+
+_stage_histograms = _StageHistograms()
+
+
+def enable_stage_metrics():
+    """Feed app.profiling stage timings into STAGE_SECONDS"""
+    profiling.add_recorder(_stage_histograms)
+
+
+def disable_stage_metrics():
+    profiling.remove_recorder(_stage_histograms)
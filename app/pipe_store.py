@@ -0,0 +1,144 @@
+import numpy as np
+
+
+class PipeStore:
+    """Pipes of any number of games, kept in flat NumPy arrays.
+
+    Every game owns a slot. Row ``i`` of the arrays is one pipe: the slot it
+    belongs to, its id, x position, gap centre and whether it was scored.
+    Rows ``[0, size)`` are live and culling compacts them, so movement,
+    culling, collision and scoring are a few array operations over the pipes
+    of all games together instead of Python loops per game and pipe.
+
+    Per-slot inputs and results (distance moved, bird position, hits) are
+    arrays of length ``num_slots`` indexed by slot.
+    """
+
+    def __init__(self, capacity=16):
+        self.size = 0
+        self.num_slots = 0
+        self.free_slots = []
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        old = getattr(self, "x", None)
+        slot = np.zeros(capacity, np.int32)
+        pipe_id = np.zeros(capacity, np.int64)
+        x = np.zeros(capacity, np.float64)
+        gap_y = np.zeros(capacity, np.float64)
+        scored = np.zeros(capacity, np.bool_)
+        if old is not None:
+            n = self.size
+            slot[:n], pipe_id[:n], x[:n] = self.slot[:n], self.pipe_id[:n], self.x[:n]
+            gap_y[:n], scored[:n] = self.gap_y[:n], self.scored[:n]
+        self.slot, self.pipe_id, self.x, self.gap_y, self.scored = slot, pipe_id, x, gap_y, scored
+
+    def add_slot(self):
+        if self.free_slots:
+            return self.free_slots.pop()
+        self.num_slots += 1
+        return self.num_slots - 1
+
+    def remove_slot(self, slot):
+        self.clear(slot)
+        self.free_slots.append(slot)
+
+    def add(self, slot, pipe_id, x, gap_y, scored=False):
+        if self.size == len(self.x):
+            self._allocate(len(self.x) * 2)
+        i = self.size
+        self.slot[i], self.pipe_id[i], self.x[i] = slot, pipe_id, x
+        self.gap_y[i], self.scored[i] = gap_y, scored
+        self.size += 1
+
+    def _keep(self, mask):
+        """Compact the live rows down to those where ``mask`` is True"""
+        n = self.size
+        k = int(np.count_nonzero(mask))
+        if k == n:
+            return
+        for array in (self.slot, self.pipe_id, self.x, self.gap_y, self.scored):
+            array[:k] = array[:n][mask]
+        self.size = k
+
+    def clear(self, slot):
+        """Remove all pipes of ``slot``"""
+        self._keep(self.slot[:self.size] != slot)
+
+    def rows(self, slot):
+        return np.flatnonzero(self.slot[:self.size] == slot)
+
+    def pipes(self, slot):
+        """Pipes of ``slot`` as ``{"id", "x", "gap_y"}`` dicts, oldest first"""
+        return [
+            {"id": int(self.pipe_id[i]), "x": float(self.x[i]), "gap_y": float(self.gap_y[i])}
+            for i in self.rows(slot)
+        ]
+
+    def per_slot(self, dtype=np.float64):
+        """A zeroed per-slot array to pass to the batch operations"""
+        return np.zeros(self.num_slots, dtype)
+
+    def advance(self, distance, cull_x=-3.0):
+        """Move each pipe left by its slot's ``distance`` and drop pipes past ``cull_x``.
+
+        Pipes of slots that do not move (distance 0) never reach ``cull_x``,
+        so they are left alone.
+        """
+        n = self.size
+        if n == 0:
+            return
+        x = self.x[:n]
+        x -= distance[self.slot[:n]]
+        if x.min() < cull_x:
+            self._keep(x >= cull_x)
+
+    def has_pipe_beyond(self, x_limit):
+        """Per slot: is any pipe further right than ``x_limit``"""
+        n = self.size
+        ahead = self.slot[:n][self.x[:n] > x_limit]
+        return np.bincount(ahead, minlength=self.num_slots) > 0
+
+    def next_gap(self, min_x):
+        """Per slot: gap centre of the oldest pipe at or right of ``min_x``, NaN if none"""
+        gaps = np.full(self.num_slots, np.nan)
+        n = self.size
+        rows = np.flatnonzero(self.x[:n] >= min_x)
+        slots, first = np.unique(self.slot[rows], return_index=True)
+        gaps[slots] = self.gap_y[rows[first]]
+        return gaps
+
+    def check(self, bird_y, active, zone=(0.5, 3.5), window=(1.8, 2.0), half_gap=1.5):
+        """Collisions and scoring for the ``active`` slots; returns ``(hits, scored)``.
+
+        A slot is hit when a pipe inside the collision ``zone`` does not have
+        the bird in its gap. A pipe scores when it is inside the scoring
+        ``window`` just behind the bird, has not scored before and the bird
+        is inside its gap; at most one pipe per slot scores per call and it
+        is marked as scored. The window lies inside the zone, so only pipes
+        in the zone are looked at.
+        """
+        hits = np.zeros(self.num_slots, np.bool_)
+        scored = np.zeros(self.num_slots, np.bool_)
+        n = self.size
+        x = self.x[:n]
+        rows = np.flatnonzero((x >= zone[0]) & (x <= zone[1]))
+        if len(rows) == 0:
+            return hits, scored
+        slots = self.slot[rows]
+        rows, slots = rows[active[slots]], slots[active[slots]]
+        x = self.x[rows]
+        inside = np.abs(bird_y[slots] - self.gap_y[rows]) <= half_gap
+
+        hits[slots[~inside]] = True
+
+        passing = inside & ~self.scored[rows] & (x >= window[0]) & (x < window[1])
+        if passing.any():
+            rows, slots = rows[passing], slots[passing]
+            if len(slots) > 1:
+                # Only the oldest passing pipe of each slot
+                _, first = np.unique(slots, return_index=True)
+                rows, slots = rows[first], slots[first]
+            self.scored[rows] = True
+            scored[slots] = True
+        return hits, scored
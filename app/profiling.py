@@ -0,0 +1,104 @@
+import time
+
+import numpy as np
+
+# Optional per-stage timing of the frame path (b64decode, gate, imdecode, resize,
+# color, inference, draw, imencode, b64encode, json, send). The stage()
+# calls stay in the code; nothing is measured unless a recorder is active,
+# so with profiling off each call only costs a global lookup. A recorder is anything with an
+# ``add(name, seconds)`` method: a StageRecorder for benchmarks, or the
+# histograms behind /metrics (see app.metrics).
+
+_recorders = ()
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("recorders", "name", "started")
+
+    def __init__(self, recorders, name):
+        self.recorders = recorders
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        for recorder in self.recorders:
+            recorder.add(self.name, elapsed)
+        return False
+
+
+def stage(name):
+    """Context manager timing one stage into the active recorders, if any"""
+    if not _recorders:
+        return _NULL_STAGE
+    return _Stage(_recorders, name)
+
+
+def add_recorder(recorder):
+    """Start feeding stage timings to ``recorder``"""
+    global _recorders
+    if recorder not in _recorders:
+        _recorders = _recorders + (recorder,)
+
+
+def remove_recorder(recorder):
+    global _recorders
+    _recorders = tuple(r for r in _recorders if r is not recorder)
+
+
+class StageRecorder:
+    """Collects stage durations while active (``with StageRecorder() as r:``).
+
+    Samples from all threads go into the same lists, which is fine for the
+    single detector thread the benchmarks use.
+    """
+
+    def __init__(self):
+        self.samples = {}
+
+    def __enter__(self):
+        add_recorder(self)
+        return self
+
+    def __exit__(self, *exc):
+        remove_recorder(self)
+        return False
+
+    def add(self, name, seconds):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def reset(self):
+        self.samples = {}
+
+    def summary(self):
+        """Per stage: count, mean and p50/p90/p99 in milliseconds"""
+        return {name: summarize(values) for name, values in self.samples.items()}
+
+
+def summarize(values):
+    """Count, mean and p50/p90/p99 of durations in seconds, as milliseconds"""
+    if not values:
+        return {"count": 0}
+    ms = np.asarray(values) * 1000.0
+    p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+    return {
+        "count": len(values),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p90_ms": round(float(p90), 3),
+        "p99_ms": round(float(p99), 3)
+    }
@@ -0,0 +1,44 @@
+import struct
+
+# Binary WebSocket messages carrying video frames.
+#
+# Every binary message starts with a 16 byte little-endian header followed
+# by the encoded image bytes:
+#
+#   uint8    message type      (MSG_VIDEO_FRAME / MSG_VIDEO_PROCESSED)
+#   uint8    image format      (FORMAT_JPEG / FORMAT_WEBP)
+#   uint16   reserved
+#   uint32   sequence number   (echoed back in the reply)
+#   float64  client timestamp  (milliseconds, echoed back in the reply)
+#
+# Text messages keep using the JSON protocol, so old clients still work.
+
+HEADER = struct.Struct("<BBHId")
+HEADER_SIZE = HEADER.size
+
+MSG_VIDEO_FRAME = 1
+MSG_VIDEO_PROCESSED = 2
+
+FORMAT_JPEG = 0
+FORMAT_WEBP = 1
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def unpack_header(message):
+    """Return ``(msg_type, image_format, seq, timestamp)`` of a binary message"""
+    if len(message) < HEADER_SIZE:
+        raise ProtocolError(f"Binary message too short: {len(message)} bytes")
+    msg_type, image_format, _, seq, timestamp = HEADER.unpack_from(message)
+    return msg_type, image_format, seq, timestamp
+
+
+def pack_message(msg_type, seq, timestamp, payload, image_format=FORMAT_JPEG):
+    """Build a binary message, copying ``payload`` once into the result"""
+    data = memoryview(payload).cast("B")
+    message = bytearray(HEADER_SIZE + len(data))
+    HEADER.pack_into(message, 0, msg_type, image_format, 0, seq & 0xFFFFFFFF, timestamp)
+    memoryview(message)[HEADER_SIZE:] = data
+    return message
@@ -0,0 +1,221 @@
+import glob
+import json
+import logging
+import math
+import os
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+# Recordings of one session's landmark stream, game events and optionally
+# its video frames, for replaying production issues offline
+# (benchmarks/replay.py).
+#
+# A recording is a series of append-only segment files
+# ``<name>-000001.rec``, ``<name>-000002.rec`` ... Each segment starts with
+#
+#   8 bytes  MAGIC
+#   uint32   length of the JSON metadata that follows (recording start
+#            time, tick rate, smoothing, game seed, ...)
+#
+# followed by records, each a 17 byte little-endian header and a payload:
+#
+#   uint8    kind              (LANDMARK / EVENT / FRAME)
+#   uint32   game loop tick    (tick count when the record was written)
+#   float64  seconds since the recording started
+#   uint32   payload length
+#
+#   LANDMARK payload: uint32 seq, float64 nose x, nose y (NaN without a
+#                     face) and bird position
+#   EVENT payload:    JSON object with at least a "type"
+#   FRAME payload:    uint32 seq followed by the encoded image
+#
+# A frame is written right after the landmark record of its detection, with
+# the same seq: the client's one for binary frames, a count of the
+# recording's landmark records for JSON frames, which have none.
+#
+# When a segment grows beyond ``segment_bytes`` a new one is started, and
+# the oldest segments are deleted while the recording is larger than
+# ``max_bytes``, so disk use stays bounded however long a session lasts.
+# That limit is per recording; with ``directory_max_bytes`` the oldest
+# finished recordings in the directory are deleted too, whenever a
+# recording starts or a segment rolls over, while all recordings there
+# together are larger, so the directory stays bounded however many
+# sessions come and go.
+
+MAGIC = b"FLAPREC1"
+RECORD = struct.Struct("<BIdI")
+LANDMARK = struct.Struct("<Iddd")
+FRAME_SEQ = struct.Struct("<I")
+
+KIND_LANDMARK = 1
+KIND_EVENT = 2
+KIND_FRAME = 3
+
+_open_recordings = set()  # (directory, name) of the recordings being written
+
+
+class Recorder:
+    """Writes one session's recording, see the format above"""
+
+    def __init__(self, directory, name, metadata=None, record_frames=False,
+                 max_bytes=50 * 2**20, segment_bytes=None, directory_max_bytes=0):
+        self.directory = directory
+        self.name = name
+        self.metadata = dict(metadata or {})
+        self.record_frames = record_frames
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes or max(1, max_bytes // 4)
+        self.directory_max_bytes = directory_max_bytes  # 0 for no limit
+        self.started = time.monotonic()
+        self.metadata.setdefault("started_at", time.time())
+        self.segments = []  # [path, size] of the segments on disk, oldest first
+        self.segment_count = 0
+        self.file = None
+        self.written = 0
+        self.landmarks = 0  # Landmark records written so far
+        self.closed = False
+        os.makedirs(directory, exist_ok=True)
+        _open_recordings.add((os.path.abspath(directory), name))
+        self._next_segment()
+
+    def _next_segment(self):
+        if self.file is not None:
+            self.file.close()
+        self.segment_count += 1
+        path = os.path.join(self.directory, f"{self.name}-{self.segment_count:06d}.rec")
+        metadata = json.dumps(self.metadata).encode()
+        self.file = open(path, "wb", buffering=64 * 1024)
+        self.file.write(MAGIC + struct.pack("<I", len(metadata)) + metadata)
+        self.segments.append([path, len(MAGIC) + 4 + len(metadata)])
+
+        # Stay within max_bytes, always keeping the segment just started
+        while len(self.segments) > 1 and sum(size for _, size in self.segments) > self.max_bytes:
+            old_path, _ = self.segments.pop(0)
+            try:
+                os.remove(old_path)
+            except OSError as e:
+                logger.warning(f"Could not remove old recording segment {old_path}: {str(e)}")
+        if self.directory_max_bytes:
+            prune_recordings(self.directory, self.directory_max_bytes)
+
+    def _write(self, kind, tick, payload):
+        if self.closed:
+            return
+        record = RECORD.pack(kind, tick, time.monotonic() - self.started, len(payload))
+        self.file.write(record)
+        self.file.write(payload)
+        size = len(record) + len(payload)
+        self.segments[-1][1] += size
+        self.written += size
+        if self.segments[-1][1] >= self.segment_bytes:
+            self._next_segment()
+
+    def landmark(self, tick, seq, nose, bird_pos_y):
+        """``nose`` is ``(x, y)`` in normalized frame coordinates, or None"""
+        nose_x, nose_y = nose if nose is not None else (math.nan, math.nan)
+        self._write(KIND_LANDMARK, tick, LANDMARK.pack(seq, nose_x, nose_y, bird_pos_y))
+        self.landmarks += 1
+
+    def event(self, tick, event_type, **fields):
+        self._write(KIND_EVENT, tick, json.dumps({"type": event_type, **fields}).encode())
+
+    def frame(self, tick, seq, image_bytes):
+        if self.record_frames:
+            self._write(KIND_FRAME, tick, FRAME_SEQ.pack(seq) + bytes(image_bytes))
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.file.close()
+            _open_recordings.discard((os.path.abspath(self.directory), self.name))
+
+
+def prune_recordings(directory, max_bytes):
+    """Delete the oldest finished recordings while ``directory`` holds more than ``max_bytes``.
+
+    Recordings still being written in this process count toward the total
+    but are never deleted. Returns the names of the deleted recordings.
+    """
+    recordings = {}  # name -> [size, last modified]
+    for path in glob.glob(os.path.join(glob.escape(directory), "*-[0-9][0-9][0-9][0-9][0-9][0-9].rec")):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue  # Deleted meanwhile
+        recording = recordings.setdefault(os.path.basename(path)[:-len("-000001.rec")], [0, 0.0])
+        recording[0] += stat.st_size
+        recording[1] = max(recording[1], stat.st_mtime)
+
+    total = sum(size for size, _ in recordings.values())
+    directory_key = os.path.abspath(directory)
+    finished = sorted(
+        (modified, name) for name, (_, modified) in recordings.items()
+        if (directory_key, name) not in _open_recordings
+    )
+    deleted = []
+    for _, name in finished:
+        if total <= max_bytes:
+            break
+        for path in segment_paths(os.path.join(directory, name)):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not remove old recording segment {path}: {str(e)}")
+        total -= recordings[name][0]
+        deleted.append(name)
+    return deleted
+
+
+def segment_paths(path):
+    """Segment files of a recording, oldest first.
+
+    ``path`` is one segment or the common prefix ``<directory>/<name>``.
+    """
+    if path.endswith(".rec"):
+        path = path[:-len("-000001.rec")]
+    return sorted(glob.glob(f"{glob.escape(path)}-[0-9][0-9][0-9][0-9][0-9][0-9].rec"))
+
+
+def read_recording(path):
+    """Read a recording; returns ``(metadata, records)``.
+
+    Records are ``(kind, tick, t, data)`` tuples in the order written.
+    ``data`` is ``(seq, nose, bird_pos_y)`` for landmarks (``nose`` None
+    without a face), the event dict for events and ``(seq, image_bytes)``
+    for frames. A segment cut short by a crash ends at its last complete
+    record.
+    """
+    metadata = None
+    records = []
+    paths = segment_paths(path)
+    if not paths:
+        raise FileNotFoundError(f"No recording segments found for {path}")
+    for segment in paths:
+        with open(segment, "rb") as f:
+            data = f.read()
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a recording segment: {segment}")
+        (length,) = struct.unpack_from("<I", data, len(MAGIC))
+        offset = len(MAGIC) + 4
+        if metadata is None:
+            metadata = json.loads(data[offset:offset + length])
+        offset += length
+
+        while offset + RECORD.size <= len(data):
+            kind, tick, t, size = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            if offset + size > len(data):
+                break
+            payload = data[offset:offset + size]
+            offset += size
+            if kind == KIND_LANDMARK:
+                seq, nose_x, nose_y, bird_pos_y = LANDMARK.unpack(payload)
+                nose = None if math.isnan(nose_y) else (nose_x, nose_y)
+                records.append((kind, tick, t, (seq, nose, bird_pos_y)))
+            elif kind == KIND_EVENT:
+                records.append((kind, tick, t, json.loads(payload)))
+            elif kind == KIND_FRAME:
+                records.append((kind, tick, t, (FRAME_SEQ.unpack_from(payload)[0], payload[FRAME_SEQ.size:])))
+    return metadata, records
@@ -0,0 +1,49 @@
+import cv2
+import numpy as np
+
+# Square face regions used to crop frames for the landmark model.
+# An ROI is ``(center_x, center_y, size)`` normalized to the frame: the
+# center by width and height, the side length by width. That keeps it valid
+# when the same camera stream is seen at a different resolution.
+
+
+def roi_from_points(xs, ys, width, height, scale=1.5):
+    """Square ROI around normalized landmark coordinates, grown by ``scale``"""
+    x_min, x_max = float(np.min(xs)) * width, float(np.max(xs)) * width
+    y_min, y_max = float(np.min(ys)) * height, float(np.max(ys)) * height
+    size = max(x_max - x_min, y_max - y_min) * scale
+    return (x_min + x_max) / (2.0 * width), (y_min + y_max) / (2.0 * height), size / width
+
+
+def scale_roi(roi, factor):
+    center_x, center_y, size = roi
+    return center_x, center_y, size * factor
+
+
+def _roi_pixels(roi, width, height):
+    center_x, center_y, size = roi
+    return center_x * width, center_y * height, size * width
+
+
+def crop_roi(image, roi, crop_size, out=None):
+    """Crop and resize the ROI in one warp; parts outside the frame are black"""
+    height, width = image.shape[:2]
+    center_x, center_y, size = _roi_pixels(roi, width, height)
+    scale = crop_size / size
+    matrix = np.array([
+        [scale, 0.0, crop_size / 2.0 - center_x * scale],
+        [0.0, scale, crop_size / 2.0 - center_y * scale]
+    ], dtype=np.float32)
+    return cv2.warpAffine(
+        image, matrix, (crop_size, crop_size),
+        dst=out, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT
+    )
+
+
+def crop_to_frame(points, roi, crop_size, width, height):
+    """Map ``(N, 2+)`` crop pixel coordinates to normalized frame coordinates"""
+    center_x, center_y, size = _roi_pixels(roi, width, height)
+    scale = size / crop_size
+    xs = (points[:, 0] - crop_size / 2.0) * scale + center_x
+    ys = (points[:, 1] - crop_size / 2.0) * scale + center_y
+    return xs / width, ys / height
@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import logging
+import re
+import urllib.request
+
+import websockets
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from fastapi.staticfiles import StaticFiles
+
+logger = logging.getLogger(__name__)
+
+# Front end for several game server processes (see cluster.py). Static files
+# are served here; every /ws connection is piped to one backend chosen by
+# rendezvous hashing of the client's session key, so a reconnecting client
+# lands on the same backend and only a share of the sessions moves when a
+# backend is added or fails. Highscores are shared by the backends through
+# the store (HIGHSCORE_BACKEND=sqlite), metrics are gathered from all of
+# them with a ``backend`` label added.
+
+_SAMPLE_LINE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})? (.*)$")
+
+
+class BackendRouter:
+    """Sticky choice of a backend (``host:port``) per session key"""
+
+    def __init__(self, backends, retry_after=5.0):
+        if not backends:
+            raise ValueError("The router needs at least one backend")
+        self.backends = list(backends)
+        self.retry_after = retry_after
+        self.down_until = {}  # backend -> loop time until which it is skipped
+
+    def ranked(self, key):
+        """Backends in preference order for ``key``, healthy ones first"""
+        def score(backend):
+            return hashlib.blake2b(f"{key}|{backend}".encode(), digest_size=8).digest()
+
+        now = asyncio.get_running_loop().time()
+        ranked = sorted(self.backends, key=score, reverse=True)
+        return sorted(ranked, key=lambda backend: self.down_until.get(backend, 0) > now)
+
+    def mark_down(self, backend):
+        logger.warning(f"Backend {backend} unreachable, skipping it for {self.retry_after}s")
+        self.down_until[backend] = asyncio.get_running_loop().time() + self.retry_after
+
+
+async def _http_get(url, timeout=2.0):
+    def fetch():
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.read().decode("utf-8")
+    return await asyncio.to_thread(fetch)
+
+
+def _label_metrics(text, backend):
+    """Add a backend label to every sample of a metrics page"""
+    lines = []
+    for line in text.splitlines():
+        match = _SAMPLE_LINE.match(line)
+        if line.startswith("#") or match is None:
+            lines.append(line)
+            continue
+        name, labels, value = match.groups()
+        labels = labels[1:-1] + "," if labels else ""
+        lines.append(f'{name}{{{labels}backend="{backend}"}} {value}')
+    return lines
+
+
+async def _pipe_client_to_backend(websocket: WebSocket, backend_ws):
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        if message.get("bytes") is not None:
+            await backend_ws.send(message["bytes"])
+        elif message.get("text") is not None:
+            await backend_ws.send(message["text"])
+
+
+async def _pipe_backend_to_client(websocket: WebSocket, backend_ws):
+    async for message in backend_ws:
+        if isinstance(message, bytes):
+            await websocket.send_bytes(message)
+        else:
+            await websocket.send_text(message)
+
+
+def create_router_app(backends, static_dir="static"):
+    router = BackendRouter(backends)
+    app = FastAPI(title="Flappy Bird Web Game (router)")
+    app.state.router = router
+    app.mount("/static", StaticFiles(directory=static_dir), name="static")
+
+    @app.get("/")
+    async def serve_game():
+        return FileResponse(f"{static_dir}/index.html")
+
+    @app.get("/leaderboard")
+    async def leaderboard(limit: int = 10):
+        # The backends share their highscores, any of them can answer
+        for backend in router.ranked("leaderboard"):
+            try:
+                text = await _http_get(f"http://{backend}/leaderboard?limit={int(limit)}")
+                return PlainTextResponse(text, media_type="application/json")
+            except OSError:
+                router.mark_down(backend)
+        return JSONResponse({"error": "No backend available"}, status_code=503)
+
+    @app.get("/metrics")
+    async def metrics():
+        pages = await asyncio.gather(
+            *(_http_get(f"http://{backend}/metrics") for backend in router.backends),
+            return_exceptions=True
+        )
+        seen = set()
+        lines = []
+        for backend, page in zip(router.backends, pages):
+            if isinstance(page, Exception):
+                continue
+            for line in _label_metrics(page, backend):
+                # HELP/TYPE once per metric
+                if line.startswith("#"):
+                    if line in seen:
+                        continue
+                    seen.add(line)
+                lines.append(line)
+        return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+    @app.websocket("/ws")
+    async def websocket_endpoint(websocket: WebSocket):
+        key = websocket.query_params.get("session") or (websocket.client.host if websocket.client else "")
+        backend_ws = None
+        for backend in router.ranked(key):
+            try:
+                backend_ws = await websockets.connect(f"ws://{backend}/ws", max_size=None)
+                break
+            except OSError:
+                router.mark_down(backend)
+        if backend_ws is None:
+            await websocket.close(code=1013, reason="No game server available")
+            return
+
+        await websocket.accept()
+        tasks = [
+            asyncio.create_task(_pipe_client_to_backend(websocket, backend_ws)),
+            asyncio.create_task(_pipe_backend_to_client(websocket, backend_ws))
+        ]
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            for task in done:
+                if task.exception() is not None and not isinstance(
+                    task.exception(), (WebSocketDisconnect, websockets.ConnectionClosed)
+                ):
+                    logger.error(f"Proxy for session {key} failed: {str(task.exception())}")
+        finally:
+            code, reason = backend_ws.close_code, backend_ws.close_reason
+            await backend_ws.close()
+            if code in (None, 1005, 1006):
+                code, reason = 1000, ""  # Not sendable, close normally
+            try:
+                # Passes refusals such as 1013 (server full) on to the client
+                await websocket.close(code=code, reason=reason or "")
+            except RuntimeError:
+                pass  # Client already gone
+
+    return app
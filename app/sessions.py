@@ -0,0 +1,112 @@
+import asyncio
+import itertools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Bookkeeping of the open /ws sessions: ids, limits and idle eviction.
+#
+# Session ids come from a counter, so unlike id(websocket) an id is never
+# handed out twice while the server runs, and a late message or task of a
+# closed session cannot touch a newer one. The manager only tracks
+# sessions; WebSocketHandler owns what belongs to them and releases it in
+# disconnect().
+
+
+class SessionLimitReached(RuntimeError):
+    pass
+
+
+class Session:
+    """One open /ws connection and what it has used so far"""
+
+    def __init__(self, session_id, websocket):
+        self.id = session_id
+        self.websocket = websocket
+        self.connected_at = time.time()
+        self.last_seen = time.monotonic()  # Last message from the client
+        self.messages = 0
+        self.bytes_in = 0
+
+    def touch(self, size):
+        """Count a message of ``size`` bytes from the client"""
+        self.last_seen = time.monotonic()
+        self.messages += 1
+        self.bytes_in += size
+
+    def idle_seconds(self, now=None):
+        return (now if now is not None else time.monotonic()) - self.last_seen
+
+    def stats(self):
+        return {
+            "session_id": self.id,
+            "connected_s": round(time.time() - self.connected_at, 1),
+            "idle_s": round(self.idle_seconds(), 1),
+            "messages": self.messages,
+            "bytes_in": self.bytes_in
+        }
+
+
+class SessionManager:
+    """Open sessions with a cap on their number and an idle timeout.
+
+    With ``max_sessions`` no more than that many sessions are open at once;
+    open() raises SessionLimitReached beyond it. Sessions that sent nothing
+    for ``idle_timeout`` seconds are passed to the ``on_idle`` coroutine by
+    the sweep task that start() runs. 0 turns either limit off.
+    """
+
+    def __init__(self, max_sessions=0, idle_timeout=0.0):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.on_idle = None  # async callable taking a Session
+        self.sweeper = None
+        self._ids = itertools.count(1)
+
+    def open(self, websocket):
+        """Register a new session and return it"""
+        if self.max_sessions and len(self.sessions) >= self.max_sessions:
+            raise SessionLimitReached(f"All {self.max_sessions} sessions are in use")
+        session = Session(next(self._ids), websocket)
+        self.sessions[session.id] = session
+        return session
+
+    def close(self, session_id):
+        """Forget a session; returns it, or None if it was closed already"""
+        return self.sessions.pop(session_id, None)
+
+    def get(self, session_id):
+        return self.sessions.get(session_id)
+
+    def idle(self):
+        """Sessions past the idle timeout"""
+        if not self.idle_timeout:
+            return []
+        now = time.monotonic()
+        return [session for session in self.sessions.values() if session.idle_seconds(now) > self.idle_timeout]
+
+    def start(self):
+        """Start the idle sweep; needs a running event loop"""
+        if self.idle_timeout and self.sweeper is None:
+            self.sweeper = asyncio.get_running_loop().create_task(self._sweep_loop())
+
+    def stop(self):
+        if self.sweeper is not None:
+            self.sweeper.cancel()
+            self.sweeper = None
+
+    async def _sweep_loop(self):
+        interval = min(30.0, max(1.0, self.idle_timeout / 4))
+        while True:
+            await asyncio.sleep(interval)
+            sessions = self.idle()
+            # Together, so one slow close handshake does not hold up the others
+            results = await asyncio.gather(*(self.on_idle(session) for session in sessions), return_exceptions=True)
+            for session, result in zip(sessions, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Error evicting idle session {session.id}: {str(result)}")
+
+    def __len__(self):
+        return len(self.sessions)
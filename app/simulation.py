@@ -0,0 +1,161 @@
+"""Headless, deterministic game simulation.
+
+Games run here without a browser, camera or wall clock: every step advances
+them by a fixed ``dt`` and pipes come from seeded random generators, so the
+same seeds and inputs always give the same result, as fast as the CPU
+allows. Used for bots, difficulty tuning, regression benchmarks of the game
+logic (benchmarks/game_sim.py) and for replaying a recorded round to check
+its score.
+
+Inputs come from policies: callables ``policy(simulation, game)`` returning
+the nose position for the next step, or None when no face is seen.
+"""
+import random
+
+from app.game_logic import Game, GameBatch
+from app.highscore_store import HighscoreStore
+
+DEFAULT_DT = 1.0 / 60
+
+
+class ManualClock:
+    """Stand-in for time.time() that only moves when advanced"""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class TracePolicy:
+    """Replays a recorded list of nose positions, one per step"""
+
+    def __init__(self, trace):
+        self.trace = trace
+
+    def __call__(self, simulation, game):
+        step = simulation.steps
+        return self.trace[step] if step < len(self.trace) else None
+
+
+class GapFollower:
+    """Bot that steers towards the gap of the next pipe.
+
+    ``noise`` is the standard deviation of its aim and ``miss_rate`` the
+    chance per step that no face is detected; both make it a weaker player,
+    which is what difficulty tuning needs.
+    """
+
+    def __init__(self, seed=0, noise=0.0, miss_rate=0.0):
+        self.rng = random.Random(seed)
+        self.noise = noise
+        self.miss_rate = miss_rate
+
+    def __call__(self, simulation, game):
+        if self.miss_rate and self.rng.random() < self.miss_rate:
+            return None
+        target = simulation.next_gap(game)
+        if target != target:  # NaN: no pipe ahead
+            target = 5.0
+        if self.noise:
+            target += self.rng.gauss(0.0, self.noise)
+        return target
+
+
+class Simulation:
+    """Many games with one policy each, stepped together through a GameBatch.
+
+    Games start right away and start a new round after every automatic
+    restart. Every finished round is appended to ``rounds`` with its seed,
+    and with its inputs when ``record_inputs`` is set, so it can be checked
+    with verify_round().
+    """
+
+    def __init__(self, policies, seed=0, dt=DEFAULT_DT, record_inputs=False, highscore_store=None):
+        self.dt = dt
+        self.clock = ManualClock()
+        self.highscore_store = highscore_store or HighscoreStore()
+        self.record_inputs = record_inputs
+        self.batch = GameBatch()
+        self.policies = {}
+        self.inputs = {}
+        self.traces = {}  # game id -> inputs of the current round
+        self.next_gaps = None
+        self.rounds = []
+        self.steps = 0
+
+        rng = random.Random(seed)
+        for game_id, policy in enumerate(policies):
+            game = Game(self.highscore_store, f"bot-{game_id}", seed=rng.getrandbits(32), clock=self.clock)
+            self.batch.add(game_id, game)
+            self.policies[game_id] = policy
+            self._start_round(game_id, game)
+
+    @property
+    def games(self):
+        return self.batch.games
+
+    def _start_round(self, game_id, game):
+        game.start_game()
+        self.traces[game_id] = []
+
+    def next_gap(self, game):
+        """Gap centre of the next pipe the bird of ``game`` has to pass, NaN if none"""
+        return self.next_gaps[game.pipe_slot]
+
+    def step(self):
+        # Oldest pipe each bird has not passed yet, for all games at once
+        self.next_gaps = self.batch.pipe_store.next_gap(0.5).tolist()
+        playing = set()
+        for game_id, game in self.batch.games.items():
+            nose_y = self.policies[game_id](self, game)
+            self.inputs[game_id] = nose_y
+            if game.game_mode == "playing":
+                playing.add(game_id)
+                if self.record_inputs:
+                    self.traces[game_id].append(nose_y)
+
+        self.batch.step(self.inputs, self.dt)
+        self.clock.advance(self.dt)
+        self.steps += 1
+
+        for game_id, game in self.batch.games.items():
+            if game.game_mode == "game_over" and game_id in playing:
+                self.rounds.append({
+                    "game": game_id,
+                    "round_seed": game.round_seed,
+                    "score": game.score,
+                    "play_time": game.play_time,
+                    "inputs": self.traces[game_id] if self.record_inputs else None
+                })
+            elif game.game_mode == "preview":
+                self._start_round(game_id, game)
+
+    def run(self, steps):
+        for _ in range(steps):
+            self.step()
+        return self.rounds
+
+
+def replay_round(inputs, round_seed, dt=DEFAULT_DT):
+    """Play one round from its seed and per-step inputs; returns the Game.
+
+    The round ends at the first collision or when the inputs run out.
+    """
+    game = Game(HighscoreStore(), seed=0, clock=ManualClock())
+    game.start_game(round_seed)
+    for nose_y in inputs:
+        game.step(nose_y, dt)
+        if game.game_mode != "playing":
+            break
+    return game
+
+
+def verify_round(inputs, round_seed, score, dt=DEFAULT_DT):
+    """Whether replaying a round ends it in a collision with exactly ``score``"""
+    game = replay_round(inputs, round_seed, dt)
+    return game.game_mode == "game_over" and game.score == score
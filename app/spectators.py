@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+
+from fastapi import WebSocket
+
+from app import metrics
+from app.profiling import stage
+from app.state_sync import StateSync
+
+logger = logging.getLogger(__name__)
+
+# Live viewers of other players' games (/spectate/{game_id}).
+#
+# Every watched game has one channel with one StateSync. On each broadcast
+# the game loop already takes the game's state for its player; the channel
+# encodes that same state once into a snapshot/delta message, serializes it
+# once, and puts the same string into every viewer's queue. Viewers joining
+# in between get one shared snapshot, so a game costs the same per tick
+# however many people watch it, apart from the sends themselves.
+#
+# A viewer's queue is bounded. A viewer that falls ``max_queue`` messages
+# behind is disconnected instead of holding up the others or buffering
+# without limit; it can reconnect and start again from a snapshot.
+
+CLOSE_TOO_SLOW = 1008
+CLOSE_GAME_ENDED = 1001
+CLOSE_NO_GAME = 1008
+
+class Viewer:
+    """One spectator socket with its send queue"""
+
+    def __init__(self, websocket: WebSocket, max_queue=32):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.sender = None
+        self.close_code = None
+        self.close_reason = None
+
+    def put(self, text):
+        """Queue a message; returns False if the viewer is too far behind"""
+        try:
+            self.queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def close(self, code, reason):
+        """Stop sending, also in the middle of a stuck send; watch() closes the socket"""
+        if self.close_code is None:
+            self.close_code = code
+            self.close_reason = reason
+        if self.sender is not None:
+            self.sender.cancel()
+
+    async def run(self):
+        """Send queued messages until cancelled or the socket is gone"""
+        while True:
+            text = await self.queue.get()
+            try:
+                await self.websocket.send_text(text)
+            except Exception:
+                return
+
+
+class GameChannel:
+    """The viewers of one game and the state stream they share"""
+
+    def __init__(self):
+        self.state_sync = StateSync()
+        self.viewers = set()
+        self.joining = set()  # Waiting for their first snapshot
+
+    def publish(self, state):
+        """Send ``state`` to every viewer; returns the viewers that fell behind"""
+        slow = []
+        message = self.state_sync.encode(state)
+        if message is not None and self.viewers:
+            with stage("spectator_json"):
+                text = json.dumps(message)
+            for viewer in self.viewers:
+                if not viewer.put(text):
+                    slow.append(viewer)
+        if self.joining:
+            with stage("spectator_json"):
+                text = json.dumps(self.state_sync.snapshot())
+            for viewer in self.joining:
+                if viewer.put(text):
+                    self.viewers.add(viewer)
+                else:
+                    slow.append(viewer)
+            self.joining.clear()
+        return slow
+
+    def remove(self, viewer):
+        self.viewers.discard(viewer)
+        self.joining.discard(viewer)
+
+    def __len__(self):
+        return len(self.viewers) + len(self.joining)
+
+
+class SpectatorHub:
+    """Channels of the watched games, keyed by game id"""
+
+    def __init__(self, max_queue=32, max_viewers=0):
+        self.max_queue = max_queue
+        self.max_viewers = max_viewers  # Per game, 0 for no limit
+        self.channels = {}
+
+    def watching(self, game_id):
+        """True if ``game_id`` has viewers, i.e. its state has to be published"""
+        return game_id in self.channels
+
+    def viewer_count(self, game_id=None):
+        if game_id is not None:
+            channel = self.channels.get(game_id)
+            return len(channel) if channel is not None else 0
+        return sum(len(channel) for channel in self.channels.values())
+
+    def publish(self, game_id, state):
+        """Fan ``state`` out to the viewers of ``game_id``"""
+        channel = self.channels.get(game_id)
+        if channel is None:
+            return
+        for viewer in channel.publish(state):
+            channel.remove(viewer)
+            viewer.close(CLOSE_TOO_SLOW, "Too far behind, reconnect to watch again")
+            metrics.SPECTATORS_DROPPED.inc()
+            logger.info(f"Dropped a slow spectator of game {game_id}")
+
+    def game_ended(self, game_id):
+        """Disconnect the viewers of a game that is gone"""
+        channel = self.channels.pop(game_id, None)
+        if channel is None:
+            return
+        for viewer in list(channel.viewers) + list(channel.joining):
+            viewer.close(CLOSE_GAME_ENDED, "Game ended")
+
+    async def watch(self, websocket: WebSocket, game_id, exists):
+        """Serve one spectator socket until it or the game goes away.
+
+        ``exists(game_id)`` tells whether the game is live. Messages from
+        the spectator are ignored.
+        """
+        await websocket.accept()
+        if not exists(game_id):
+            await websocket.close(code=CLOSE_NO_GAME, reason="No such game")
+            return
+        channel = self.channels.get(game_id)
+        if channel is None:
+            channel = self.channels[game_id] = GameChannel()
+        if self.max_viewers and len(channel) >= self.max_viewers:
+            await websocket.close(code=1013, reason="Too many spectators, try again later")
+            return
+
+        viewer = Viewer(websocket, self.max_queue)
+        channel.joining.add(viewer)
+        viewer.sender = asyncio.create_task(viewer.run())
+        receiver = asyncio.create_task(self._receive_until_closed(websocket))
+        try:
+            await asyncio.wait((viewer.sender, receiver), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            viewer.sender.cancel()
+            receiver.cancel()
+            channel.remove(viewer)
+            if not channel and self.channels.get(game_id) is channel:
+                del self.channels[game_id]
+        if viewer.close_code is not None:
+            try:
+                await websocket.close(code=viewer.close_code, reason=viewer.close_reason)
+            except Exception:
+                pass  # Already gone
+
+    @staticmethod
+    async def _receive_until_closed(websocket: WebSocket):
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
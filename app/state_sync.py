@@ -0,0 +1,85 @@
+class StateSync:
+    """Encodes one connection's game state as a snapshot followed by deltas.
+
+    The first message, and the first one after request_resync(), is a full
+    ``state_snapshot``. After that each message is a ``state_delta`` that
+    only carries the fields that changed since the previous message. Pipes
+    are sent once when they appear, positioned in world coordinates
+    (``wx = x + scroll``), so the client can move them from ``scroll``
+    alone; removed pipes are sent as ids. Every message has a sequence
+    number and a delta is only valid on top of ``seq - 1``; a client that
+    sees a gap asks for a resync.
+    """
+
+    # Floats are rounded so that noise does not produce a delta every tick
+    PRECISION = {"bird_pos_y": 3, "pipe_speed": 4, "scroll": 4}
+
+    def __init__(self):
+        self.seq = 0
+        self.last_fields = None
+        self.last_pipes = {}
+
+    def request_resync(self):
+        """Send a full snapshot with the next message"""
+        self.last_fields = None
+
+    def _split(self, state):
+        fields = {}
+        for key, value in state.items():
+            if key == "pipes":
+                continue
+            if key in self.PRECISION:
+                value = round(float(value), self.PRECISION[key])
+            fields[key] = value
+
+        scroll = fields.get("scroll", 0.0)
+        pipes = {
+            pipe["id"]: {"id": pipe["id"], "wx": round(pipe["x"] + scroll, 4), "gap_y": pipe["gap_y"]}
+            for pipe in state.get("pipes", [])
+        }
+        return fields, pipes
+
+    def encode(self, state):
+        """Return the message for ``state``, or None when nothing changed"""
+        fields, pipes = self._split(state)
+
+        if self.last_fields is None:
+            self.seq += 1
+            message = {
+                "type": "state_snapshot",
+                "seq": self.seq,
+                "data": {**fields, "pipes": list(pipes.values())}
+            }
+        else:
+            changes = {key: value for key, value in fields.items() if self.last_fields.get(key) != value}
+            added = [pipe for pipe_id, pipe in pipes.items() if pipe_id not in self.last_pipes]
+            removed = [pipe_id for pipe_id in self.last_pipes if pipe_id not in pipes]
+            if not changes and not added and not removed:
+                return None
+
+            self.seq += 1
+            message = {"type": "state_delta", "seq": self.seq}
+            if changes:
+                message["changes"] = changes
+            if added:
+                message["pipes_added"] = added
+            if removed:
+                message["pipes_removed"] = removed
+
+        self.last_fields = fields
+        self.last_pipes = pipes
+        return message
+
+    def snapshot(self):
+        """A snapshot of the last encoded state under its sequence number.
+
+        Deltas encoded afterwards apply on top of it, so a new receiver can
+        join a stream of deltas that others are already following.
+        """
+        if self.last_fields is None:
+            return None
+        return {
+            "type": "state_snapshot",
+            "seq": self.seq,
+            "data": {**self.last_fields, "pipes": list(self.last_pipes.values())}
+        }
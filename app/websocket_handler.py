@@ -1,11 +1,21 @@
-from fastapi import WebSocket
+from fastapi import WebSocket, WebSocketDisconnect
 import json
 import asyncio
-import base64
-import cv2
-import numpy as np
+import websockets
 from app.game_logic import Game
-from app.face_detection import FaceDetector
+from app.detector_engine import DetectorEngine
+from app.detector_pool import DetectorPoolExhausted
+from app.game_loop import GameLoop
+from app.highscore_store import HighscoreStore
+from app.state_sync import StateSync
+from app.frame_ingest import LatestFrameSlot
+from app.adaptive_quality import QualityController
+from app.profiling import stage
+from app.recorder import Recorder
+from app.sessions import SessionLimitReached, SessionManager
+from app.spectators import SpectatorHub
+from app import metrics, protocol
+import base64
 import logging
 import time
 
@@ -13,47 +23,151 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class WebSocketHandler:
-    def __init__(self):
+    def __init__(self, detector_engine=None, game_loop=None, highscore_store=None,
+                 max_fps=25, adaptive_target_latency=0.05,
+                 record_dir=None, record_frames=False, record_max_bytes=50 * 2**20,
+                 record_total_bytes=0, max_players=4,
+                 spectator_queue=32, max_spectators=0, max_sessions=0, idle_timeout=0.0):
+        # Session ids, the session cap and idle eviction, see app.sessions
+        self.sessions = SessionManager(max_sessions=max_sessions, idle_timeout=idle_timeout)
+        self.sessions.on_idle = self.evict_idle
         self.active_connections = {}
         self.games = {}
-        self.detectors = {}
+        self.highscore_store = highscore_store or HighscoreStore()
+        self.detector_engine = detector_engine or DetectorEngine()
+        self.game_loop = game_loop or GameLoop()
+        self.game_loop.on_broadcast = self.broadcast_game_states
+        self.state_sends = {}  # Game state sends still in progress per connection
         self.last_frame_time = {}
+        self.frame_slots = {}
+        self.frame_consumers = {}
+        self.min_frame_interval = 1.0/max_fps  # Process at most max_fps frames per connection
+        self.frame_intervals = {}  # Lower per-connection rates set by adaptive quality
+        # Connections that let the server steer their capture settings
+        self.quality_controllers = {}
+        self.adaptive_target_latency = adaptive_target_latency
+        # "annotated" sends back the drawn video frame (default for old clients),
+        # "landmarks" only sends the coordinates so the client draws the overlay
+        self.response_modes = {}
+        # Connections that asked for snapshot + delta state messages
+        self.state_syncs = {}
+        # Opt-in recordings of every session's landmarks and game events
+        # (and frames) for offline replay, see app.recorder
+        self.record_dir = record_dir
+        self.record_frames = record_frames
+        self.record_max_bytes = record_max_bytes
+        self.record_total_bytes = record_total_bytes  # All recordings together
+        self.recorders = {}
+        # Last landmarks per connection, sent again for frames that skip detection
+        self.last_landmarks = {}
+        # Last info message per connection, see send_status()
+        self.last_status = {}
+        # Several players on one camera: game ids of all players of a
+        # connection, the connection id itself for player 1 and
+        # (connection id, index) for the others; see game_ids()
+        self.max_players = max_players
+        self.player_games = {}
+        # Viewers of other connections' games, fed from broadcast_game_states
+        self.spectators = SpectatorHub(max_queue=spectator_queue, max_viewers=max_spectators)
 
     async def connect(self, websocket: WebSocket):
+        """Set up a new session; returns its id, or None if it had to be turned away.
+
+        Once an id is returned, disconnect() has to be called with it
+        however the session ends.
+        """
         await websocket.accept()
-        connection_id = id(websocket)
-        self.active_connections[connection_id] = websocket
-        self.games[connection_id] = Game()
-        self.detectors[connection_id] = FaceDetector()
-        self.last_frame_time[connection_id] = 0
-        self.last_status = {}
-        
-        logger.info(f"New connection: {connection_id}")
-        
-        # Send initial game state
-        await self.send_game_state(websocket, connection_id)
+        try:
+            session = self.sessions.open(websocket)
+        except SessionLimitReached as e:
+            logger.warning(f"Rejecting connection: {str(e)}")
+            metrics.SESSIONS_REJECTED.inc("sessions")
+            await websocket.close(code=1013, reason="Server is full, try again later")
+            return None
+        connection_id = session.id
+        try:
+            await self.detector_engine.register(connection_id)
+        except DetectorPoolExhausted as e:
+            self.disconnect(connection_id)
+            logger.warning(f"Rejecting connection {connection_id}: {str(e)}")
+            metrics.SESSIONS_REJECTED.inc("detectors")
+            await websocket.close(code=1013, reason="Server is full, try again later")
+            return None
+        except BaseException:
+            self.disconnect(connection_id)
+            raise
+        try:
+            self.active_connections[connection_id] = websocket
+            self.games[connection_id] = Game(self.highscore_store)
+            self.game_loop.add(connection_id, self.games[connection_id])
+            self.game_loop.start()
+            self.last_frame_time[connection_id] = 0
+            self.response_modes[connection_id] = "annotated"
+            self.frame_slots[connection_id] = LatestFrameSlot()
+            self.frame_consumers[connection_id] = asyncio.create_task(
+                self.consume_frames(websocket, connection_id)
+            )
+            if self.record_dir:
+                self.start_recording(connection_id)
 
-    def disconnect(self, websocket: WebSocket):
-        connection_id = id(websocket)
-        logger.info(f"Disconnecting: {connection_id}")
+            logger.info(f"New connection: {connection_id}")
+
+            # Send initial game state
+            await self.send_game_state(websocket, connection_id)
+        except BaseException:
+            self.disconnect(connection_id)
+            raise
+        return connection_id
+
+    def disconnect(self, connection_id: int):
+        """Release everything of a session; safe to call more than once"""
+        session = self.sessions.close(connection_id)
+        if session is None:
+            return
+        usage = self.session_stats(connection_id, session)
+        logger.info(f"Disconnecting: {connection_id}, usage: {usage}")
         
+        if connection_id in self.recorders:
+            self.record_event(connection_id, "disconnect")
+            self.recorders.pop(connection_id).close()
         if connection_id in self.active_connections:
             del self.active_connections[connection_id]
-        if connection_id in self.games:
-            del self.games[connection_id]
-        if connection_id in self.detectors:
-            self.detectors[connection_id].release()
-            del self.detectors[connection_id]
+        for game_id in self.game_ids(connection_id):
+            self.games.pop(game_id, None)
+            self.game_loop.remove(game_id)
+        self.player_games.pop(connection_id, None)
+        self.spectators.game_ended(connection_id)
+        self.detector_engine.unregister(connection_id)
         if connection_id in self.last_frame_time:
             del self.last_frame_time[connection_id]
+        if connection_id in self.response_modes:
+            del self.response_modes[connection_id]
+        if connection_id in self.state_syncs:
+            del self.state_syncs[connection_id]
+        self.last_landmarks.pop(connection_id, None)
+        self.last_status.pop(connection_id, None)
+        self.quality_controllers.pop(connection_id, None)
+        self.frame_intervals.pop(connection_id, None)
+        if connection_id in self.state_sends:
+            self.state_sends.pop(connection_id).cancel()
+        if connection_id in self.frame_consumers:
+            self.frame_consumers.pop(connection_id).cancel()
+        if connection_id in self.frame_slots:
+            stats = self.frame_slots.pop(connection_id).stats()
+            logger.info(f"Frame stats for {connection_id}: {stats}")
 
-    async def handle_message(self, websocket: WebSocket, message: str):
-        connection_id = id(websocket)
+    async def handle_message(self, websocket: WebSocket, connection_id: int, message: str):
+        session = self.sessions.get(connection_id)
+        if session is None:
+            return  # Evicted; the socket is being closed
+        session.touch(len(message))
         try:
             data = json.loads(message)
             
             if data["type"] == "video_frame":
-                await self.process_video_frame(websocket, connection_id, data["frame"])
+                # Only queue the still-encoded frame; older pending frames are dropped
+                if self.frame_slots[connection_id].put(data["frame"]):
+                    metrics.FRAMES_DROPPED.inc()
             elif data["type"] == "restart_game":
                 await self.restart_game(websocket, connection_id)
             elif data["type"] == "start_game":  # NEW
@@ -62,8 +176,17 @@ class WebSocketHandler:
                 await self.pause_game(websocket, connection_id)
             elif data["type"] == "manual_jump":  # NEW
                 await self.manual_jump(websocket, connection_id)
+            elif data["type"] == "get_leaderboard":
+                await self.send_leaderboard(websocket, connection_id)
+            elif data["type"] == "resync":
+                if connection_id in self.state_syncs:
+                    self.state_syncs[connection_id].request_resync()
+                await self.send_game_state(websocket, connection_id)
+            elif data["type"] == "configure":
+                await self.configure(websocket, connection_id, data)
             elif data["type"] == "reset_calibration":
-                self.detectors[connection_id].reset_calibration()
+                await self.detector_engine.reset_calibration(connection_id)
+                self.record_event(connection_id, "reset_calibration")
                 await websocket.send_text(json.dumps({
                     "type": "info",
                     "message": "Calibration reset - move your head up and down"
@@ -76,52 +199,110 @@ class WebSocketHandler:
                 "message": f"Error processing message: {str(e)}"
             }))
 
-    async def process_video_frame(self, websocket: WebSocket, connection_id: int, frame_data: str):
+    async def handle_binary_message(self, websocket: WebSocket, connection_id: int, message: bytes):
+        session = self.sessions.get(connection_id)
+        if session is None:
+            return  # Evicted; the socket is being closed
+        session.touch(len(message))
         try:
-            # Rate limiting - process at most 15 FPS
-            current_time = time.time()
-            if current_time - self.last_frame_time.get(connection_id, 0) < 1.0/25.0: 
-                return
-            
-            self.last_frame_time[connection_id] = current_time
+            msg_type, _, _, _ = protocol.unpack_header(message)
             
-            # Decode base64 image
-            if ',' in frame_data:
-                frame_bytes = base64.b64decode(frame_data.split(',')[1])
+            if msg_type == protocol.MSG_VIDEO_FRAME:
+                # The whole message is queued, the image is sliced out on the worker
+                if self.frame_slots[connection_id].put(message):
+                    metrics.FRAMES_DROPPED.inc()
             else:
-                frame_bytes = base64.b64decode(frame_data)
+                logger.warning(f"Unknown binary message type {msg_type} from {connection_id}")
+                
+        except Exception as e:
+            logger.error(f"Error handling binary message from {connection_id}: {str(e)}")
+            await websocket.send_text(json.dumps({
+                "type": "error",
+                "message": f"Error processing message: {str(e)}"
+            }))
+
+    async def consume_frames(self, websocket: WebSocket, connection_id: int):
+        """Process the newest pending frame whenever the previous one is done"""
+        slot = self.frame_slots[connection_id]
+        try:
+            while True:
+                await slot.wait()
                 
-            nparr = np.frombuffer(frame_bytes, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+                # Rate limiting - wait out the minimum interval, newer frames
+                # arriving meanwhile replace the pending one
+                interval = self.frame_intervals.get(connection_id, self.min_frame_interval)
+                elapsed = time.time() - self.last_frame_time.get(connection_id, 0)
+                if elapsed < interval:
+                    await asyncio.sleep(interval - elapsed)
+                
+                frame_data, received_at = slot.take()
+                if frame_data is not None:
+                    await self.process_video_frame(websocket, connection_id, frame_data, received_at)
+        except (asyncio.CancelledError, WebSocketDisconnect, websockets.ConnectionClosed):
+            pass  # Disconnected
+        except Exception as e:
+            logger.error(f"Frame consumer for {connection_id} stopped: {str(e)}")
+
+    async def process_video_frame(self, websocket: WebSocket, connection_id: int, frame_data, received_at: float):
+        try:
+            started = self.last_frame_time[connection_id] = time.time()
+            annotate = self.response_modes.get(connection_id) == "annotated"
+            game_ids = self.game_ids(connection_id)
+            game_modes = {self.games[game_id].game_mode for game_id in game_ids if game_id in self.games}
+            
+            if game_modes and game_modes <= {"paused", "game_over"}:
+                # No bird can be steered: answer without running detection
+                await self.skip_video_frame(websocket, connection_id, frame_data, received_at, annotate)
+                return
+            
+            # Decode, detect and re-encode on the detector worker pool. Outside
+            # a running game a frame that hardly changed reuses the last result.
+            result = await self.detector_engine.process_frame(
+                connection_id, frame_data, annotate, gate="playing" not in game_modes
+            )
+            latency = time.time() - started
+            queue_depth = self.detector_engine.queue_depth(connection_id)
+            metrics.QUEUE_DEPTH.observe(queue_depth)
             
-            if frame is None:
+            if result is None:
                 logger.warning(f"Failed to decode frame from {connection_id}")
                 return
             
-            # Get face detection result
-            detector = self.detectors[connection_id]
-            bird_pos_y, processed_image = detector.detect_nose_position(frame)
+            bird_pos_y, processed_frame, landmarks = result
+            self.last_landmarks[connection_id] = landmarks
             
-            # Update game
-            game = self.games[connection_id]
-            game.update(bird_pos_y)
+            # Hand the position to the game loop, it is applied on the next tick
+            if isinstance(bird_pos_y, list):
+                # One position per player; only player 1 is recorded
+                for game_id, player_pos_y in zip(game_ids, bird_pos_y):
+                    self.game_loop.set_input(game_id, player_pos_y)
+                bird_pos_y = bird_pos_y[0]
+            else:
+                self.game_loop.set_input(connection_id, bird_pos_y)
+            # A reused result did not go through the nose filter again, so
+            # recording it would make a replay filter the same nose twice
+            if connection_id in self.recorders and not landmarks.get("reused"):
+                self.record_frame(connection_id, frame_data, bird_pos_y, landmarks)
             
-            # Send game state
-            await self.send_game_state(websocket, connection_id)
+            # Frame age from arrival to applied result, plus drops so far
+            slot = self.frame_slots[connection_id]
+            frame_age = slot.record_age(received_at)
+            if landmarks.get("reused"):
+                metrics.FRAMES_SKIPPED.inc("unchanged")
+            else:
+                metrics.FRAMES_PROCESSED.inc()
+            metrics.FRAME_SECONDS.observe(frame_age)
+            logger.debug(f"Frame from {connection_id} processed after {frame_age * 1000:.1f} ms, {slot.dropped} dropped")
             
-            # Send processed video frame back
-            try:
-                # Reduce image quality for better performance
-                encode_param = [cv2.IMWRITE_JPEG_QUALITY, 70]
-                _, buffer = cv2.imencode('.jpg', processed_image, encode_param)
-                processed_frame_b64 = base64.b64encode(buffer).decode('utf-8')
-                
-                await websocket.send_text(json.dumps({
-                    "type": "video_processed",
-                    "frame": f"data:image/jpeg;base64,{processed_frame_b64}"
-                }))
-            except Exception as e:
-                logger.error(f"Error encoding processed frame: {str(e)}")
+            await self.send_frame_result(websocket, frame_data, processed_frame, landmarks, frame_age,
+                                         slot.dropped, annotate)
+            
+            # Let the client know when it should capture smaller or less often
+            controller = self.quality_controllers.get(connection_id)
+            if controller is not None:
+                settings = controller.observe(latency, queue_depth, slot.dropped)
+                if settings is not None:
+                    await self.send_capture_settings(websocket, connection_id)
             
         except Exception as e:
             logger.error(f"Error processing video frame from {connection_id}: {str(e)}")
@@ -130,10 +311,247 @@ class WebSocketHandler:
                 "message": f"Error processing video frame: {str(e)}"
             }))
 
+    async def skip_video_frame(self, websocket: WebSocket, connection_id: int, frame_data, received_at: float,
+                               annotate: bool):
+        """Answer a frame without detection, so the client keeps sending.
+
+        Annotated clients get their own frame back without an overlay, the
+        others the last landmarks.
+        """
+        slot = self.frame_slots[connection_id]
+        frame_age = slot.record_age(received_at)
+        metrics.FRAMES_SKIPPED.inc("paused")
+        processed_frame = None
+        if annotate:
+            if isinstance(frame_data, str):
+                processed_frame = frame_data.split(',', 1)[-1]
+            else:
+                processed_frame = memoryview(frame_data)[protocol.HEADER_SIZE:]
+        landmarks = self.last_landmarks.get(connection_id, {"nose": None})
+        await self.send_frame_result(websocket, frame_data, processed_frame, landmarks, frame_age,
+                                     slot.dropped, annotate)
+
+    async def send_frame_result(self, websocket: WebSocket, frame_data, processed_frame, landmarks,
+                                frame_age: float, dropped: int, annotate: bool):
+        """Send landmarks only, or the processed video frame back in the
+        format it arrived in"""
+        if not annotate:
+            message = {
+                "type": "landmarks",
+                **landmarks,
+                "frame_age_ms": round(frame_age * 1000.0, 1),
+                "dropped_frames": dropped
+            }
+            if not isinstance(frame_data, str):
+                _, _, message["seq"], message["timestamp"] = protocol.unpack_header(frame_data)
+            with stage("json"):
+                text = json.dumps(message)
+            with stage("send"):
+                await websocket.send_text(text)
+        elif processed_frame is None:
+            pass
+        elif isinstance(frame_data, str):
+            with stage("json"):
+                text = json.dumps({
+                    "type": "video_processed",
+                    "frame": f"data:image/jpeg;base64,{processed_frame}",
+                    "frame_age_ms": round(frame_age * 1000.0, 1),
+                    "dropped_frames": dropped
+                })
+            with stage("send"):
+                await websocket.send_text(text)
+        else:
+            _, _, seq, timestamp = protocol.unpack_header(frame_data)
+            with stage("send"):
+                await websocket.send_bytes(protocol.pack_message(
+                    protocol.MSG_VIDEO_PROCESSED, seq, timestamp, processed_frame
+                ))
+
+    def start_recording(self, connection_id: int):
+        game = self.games[connection_id]
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{connection_id:x}"
+        try:
+            recorder = Recorder(
+                self.record_dir, name,
+                metadata={
+                    "tick_rate": self.game_loop.tick_rate,
+                    "smoothing": self.detector_engine.options.get("smoothing"),
+                    "game_seed": game.seed
+                },
+                record_frames=self.record_frames,
+                max_bytes=self.record_max_bytes,
+                directory_max_bytes=self.record_total_bytes
+            )
+        except OSError as e:
+            logger.error(f"Could not start recording for {connection_id}: {str(e)}")
+            return
+        self.recorders[connection_id] = recorder
+        self.record_event(connection_id, "connect")
+        logger.info(f"Recording {connection_id} to {name}")
+
+    def record_event(self, connection_id: int, event_type: str, **fields):
+        """Record a game event together with the game's score and mode after it"""
+        recorder = self.recorders.get(connection_id)
+        if recorder is None:
+            return
+        game = self.games.get(connection_id)
+        if game is not None:
+            fields.update(score=game.score, game_mode=game.game_mode)
+        recorder.event(self.game_loop.tick_count, event_type, **fields)
+
+    def record_frame(self, connection_id: int, frame_data, bird_pos_y, landmarks):
+        recorder = self.recorders[connection_id]
+        tick = self.game_loop.tick_count
+        if isinstance(frame_data, str):
+            seq = recorder.landmarks  # JSON frames have no seq of their own
+        else:
+            _, _, seq, _ = protocol.unpack_header(frame_data)
+        nose = landmarks.get("nose")
+        recorder.landmark(tick, seq, (nose["x"], nose["y"]) if nose else None, bird_pos_y)
+        if recorder.record_frames:
+            if isinstance(frame_data, str):
+                image = base64.b64decode(frame_data.split(',')[-1])
+            else:
+                image = memoryview(frame_data)[protocol.HEADER_SIZE:]
+            recorder.frame(tick, seq, image)
+
+    async def configure(self, websocket: WebSocket, connection_id: int, data: dict):
+        """Apply client options negotiated after connecting"""
+        response_mode = data.get("response_mode")
+        if response_mode is not None:
+            if response_mode not in ("annotated", "landmarks"):
+                raise ValueError(f"Unknown response mode: {response_mode}")
+            self.response_modes[connection_id] = response_mode
+            logger.info(f"Response mode for {connection_id}: {response_mode}")
+        
+        state_sync = data.get("state_sync")
+        if state_sync is not None:
+            if state_sync == "delta":
+                self.state_syncs[connection_id] = StateSync()
+            elif state_sync == "full":
+                self.state_syncs.pop(connection_id, None)
+            else:
+                raise ValueError(f"Unknown state sync mode: {state_sync}")
+        
+        adaptive_quality = data.get("adaptive_quality")
+        if adaptive_quality is not None:
+            if adaptive_quality:
+                controller = QualityController(target_latency=self.adaptive_target_latency)
+                controller.last_dropped = self.frame_slots[connection_id].dropped
+                self.quality_controllers[connection_id] = controller
+            else:
+                self.quality_controllers.pop(connection_id, None)
+                self.frame_intervals.pop(connection_id, None)
+        
+        players = data.get("players")
+        if players is not None:
+            await self.set_players(connection_id, int(players))
+        
+        player_name = data.get("player_name")
+        if player_name is not None:
+            player_name = str(player_name).strip()[:24]
+            self.games[connection_id].player_id = player_name or "anonymous"
+        if players is not None or player_name is not None:
+            # Highscores of the other players on the camera go by P2, P3, ...
+            for index, game_id in enumerate(self.game_ids(connection_id)[1:], 2):
+                self.games[game_id].player_id = f"{self.games[connection_id].player_id} P{index}"
+        
+        await websocket.send_text(json.dumps({
+            "type": "configured",
+            "response_mode": self.response_modes[connection_id],
+            "state_sync": "delta" if connection_id in self.state_syncs else "full",
+            "player_name": self.games[connection_id].player_id,
+            "players": len(self.game_ids(connection_id)),
+            "adaptive_quality": connection_id in self.quality_controllers
+        }))
+        if adaptive_quality:
+            await self.send_capture_settings(websocket, connection_id)
+
+    def game_ids(self, connection_id):
+        """Ids of the connection's games in player order"""
+        return self.player_games.get(connection_id, [connection_id])
+
+    async def set_players(self, connection_id: int, players: int):
+        """Play with one bird per face on the connection's camera.
+
+        The detector then finds up to ``players`` faces in one pass and every
+        player gets a Game of its own; the games are started, paused and
+        restarted together, with the same round seed, so they share the
+        course. All games go back to preview mode.
+        """
+        if not 1 <= players <= self.max_players:
+            raise ValueError(f"Players must be between 1 and {self.max_players}")
+        await self.detector_engine.set_players(connection_id, players)
+        for game_id in self.game_ids(connection_id)[1:]:
+            self.game_loop.remove(game_id)
+            del self.games[game_id]
+        self.player_games.pop(connection_id, None)
+        self.games[connection_id].restart()
+        self.record_event(connection_id, "restart_game")
+        if players > 1:
+            game_ids = [connection_id] + [(connection_id, index) for index in range(1, players)]
+            for game_id in game_ids[1:]:
+                self.games[game_id] = Game(self.highscore_store)
+                self.game_loop.add(game_id, self.games[game_id])
+            self.player_games[connection_id] = game_ids
+        logger.info(f"{players} player(s) for connection {connection_id}")
+
+    def game_state(self, connection_id: int):
+        """State message data of a connection's game, or of all its players.
+
+        With several players the top-level fields are those of the player
+        furthest in the round (playing before paused before game over), so
+        the pipes stay on screen while anyone is still flying, and
+        ``players`` lists every player's bird, score and mode.
+        """
+        game_ids = self.player_games.get(connection_id)
+        if game_ids is None:
+            return self.games[connection_id].get_state()
+        states = [self.games[game_id].get_state() for game_id in game_ids]
+        order = ("playing", "paused", "game_over", "preview")
+        lead = min(states, key=lambda state: order.index(state["game_mode"]))
+        return {
+            **lead,
+            "players": [
+                {
+                    "player": index,
+                    "bird_pos_y": state["bird_pos_y"],
+                    "score": state["score"],
+                    "pipe_count": state["pipe_count"],
+                    "game_mode": state["game_mode"]
+                }
+                for index, state in enumerate(states, 1)
+            ]
+        }
+
+    async def send_capture_settings(self, websocket: WebSocket, connection_id: int):
+        """Send the controller's capture settings and match the server-side rate"""
+        settings = self.quality_controllers[connection_id].settings()
+        fps = min(settings["fps"], 1.0 / self.min_frame_interval)
+        self.frame_intervals[connection_id] = 1.0 / fps
+        logger.info(f"Capture settings for {connection_id}: {settings}")
+        await websocket.send_text(json.dumps({
+            "type": "capture_settings",
+            **settings,
+            "fps": fps
+        }))
+
+    async def send_leaderboard(self, websocket: WebSocket, connection_id: int):
+        player_id = self.games[connection_id].player_id
+        await websocket.send_text(json.dumps({
+            "type": "leaderboard",
+            "global": self.highscore_store.leaderboard(),
+            "player": self.highscore_store.player_scores(player_id)
+        }))
+
     async def start_game(self, websocket: WebSocket, connection_id: int):
         """Start the actual game with obstacles"""
         try:
-            self.games[connection_id].start_game()
+            game = self.games[connection_id]
+            game.start_game()
+            for game_id in self.game_ids(connection_id)[1:]:
+                self.games[game_id].start_game(game.round_seed)
+            self.record_event(connection_id, "start_game", round_seed=game.round_seed)
             await self.send_game_state(websocket, connection_id)
             logger.info(f"Game started for connection {connection_id}")
             
@@ -147,10 +565,13 @@ class WebSocketHandler:
     async def pause_game(self, websocket: WebSocket, connection_id: int):
         """Pause/unpause the game"""
         try:
-            self.games[connection_id].pause_game()
+            for game_id in self.game_ids(connection_id):
+                self.games[game_id].pause_game()
+            self.record_event(connection_id, "pause_game")
             await self.send_game_state(websocket, connection_id)
             
-            game_mode = self.games[connection_id].game_mode
+            game_modes = {self.games[game_id].game_mode for game_id in self.game_ids(connection_id)}
+            game_mode = "paused" if "paused" in game_modes else self.games[connection_id].game_mode
             message = "Game paused" if game_mode == "paused" else "Game resumed"
             
             await websocket.send_text(json.dumps({
@@ -176,7 +597,9 @@ class WebSocketHandler:
     # Update the restart_game method to return to preview mode:
     async def restart_game(self, websocket: WebSocket, connection_id: int):
         try:
-            self.games[connection_id].restart()  # This now returns to preview mode
+            for game_id in self.game_ids(connection_id):
+                self.games[game_id].restart()  # This now returns to preview mode
+            self.record_event(connection_id, "restart_game")
             await self.send_game_state(websocket, connection_id)
             logger.info(f"Game restarted for connection {connection_id}")
             
@@ -187,16 +610,87 @@ class WebSocketHandler:
         except Exception as e:
             logger.error(f"Error restarting game for {connection_id}: {str(e)}")
 
-    async def send_game_state(self, websocket: WebSocket, connection_id: int):
+    async def send_game_state(self, websocket: WebSocket, connection_id: int, game_state=None):
         try:
-            game_state = self.games[connection_id].get_state()
-            await websocket.send_text(json.dumps({
-                "type": "game_state",
-                "data": game_state
-            }))
+            if game_state is None:
+                game_state = self.game_state(connection_id)
+            state_sync = self.state_syncs.get(connection_id)
+            if state_sync is None:
+                message = {
+                    "type": "game_state",
+                    "data": game_state
+                }
+            else:
+                message = state_sync.encode(game_state)
+                if message is None:
+                    return  # Nothing changed since the last message
+            with stage("state_json"):
+                text = json.dumps(message)
+            with stage("state_send"):
+                await websocket.send_text(text)
+        except (WebSocketDisconnect, websockets.ConnectionClosed):
+            pass  # The client is gone; its receive loop calls disconnect()
         except Exception as e:
-            logger.error(f"Error sending game state to {connection_id}: {str(e)}")
+            if connection_id in self.active_connections:
+                logger.error(f"Error sending game state to {connection_id}: {str(e)}")
     
+    def list_games(self):
+        """Active games for the spectator lobby, without building their states"""
+        games = []
+        for connection_id in self.active_connections:
+            players = [self.games[game_id] for game_id in self.game_ids(connection_id) if game_id in self.games]
+            if not players:
+                continue
+            order = ("playing", "paused", "game_over", "preview")
+            games.append({
+                "game_id": connection_id,
+                "player_id": players[0].player_id,
+                "players": len(players),
+                "score": max(game.score for game in players),
+                "game_mode": min((game.game_mode for game in players), key=order.index),
+                "spectators": self.spectators.viewer_count(connection_id)
+            })
+        return games
+
+    def session_stats(self, connection_id: int, session=None):
+        """What a session has used: messages, bytes, detector CPU and memory.
+
+        The detector CPU is ``cpu_seconds_approx`` with thread workers, see
+        DetectorEngine.session_usage().
+
+        ``memory_bytes`` counts the buffers that grow with the session (the
+        pending frame and the worker's reused codec buffers, gate thumbnail
+        and cached result), not its share of the detector graph.
+        """
+        session = session or self.sessions.get(connection_id)
+        if session is None:
+            return None
+        usage = self.detector_engine.session_usage(connection_id)
+        buffer_bytes = usage.pop("buffer_bytes")
+        slot = self.frame_slots.get(connection_id)
+        return {
+            **session.stats(),
+            **usage,  # frames and cpu_seconds, or cpu_seconds_approx with thread workers
+            "memory_bytes": buffer_bytes + (slot.pending_bytes() if slot is not None else 0)
+        }
+
+    def list_sessions(self):
+        return [self.session_stats(connection_id) for connection_id in list(self.sessions.sessions)]
+
+    async def evict_idle(self, session):
+        """Close a session that has not sent anything for too long"""
+        logger.info(f"Evicting session {session.id}, idle for {session.idle_seconds():.0f}s")
+        metrics.SESSIONS_EVICTED.inc()
+        self.disconnect(session.id)
+        try:
+            await session.websocket.close(code=1001, reason="Idle for too long")
+        except Exception:
+            pass  # Already closed
+
+    async def spectate(self, websocket: WebSocket, game_id: int):
+        """Serve a spectator socket for the game of connection ``game_id``"""
+        await self.spectators.watch(websocket, game_id, self.active_connections.__contains__)
+
     async def send_status(self, websocket: WebSocket, connection_id: int, message: str, type: str):
         if self.last_status.get(connection_id) != message:  
             await websocket.send_text(json.dumps({
@@ -207,15 +701,26 @@ class WebSocketHandler:
         else:
             logger.debug(f"Skipped duplicate status message: {message} for {connection_id}")
             
-    async def send_periodic_updates(self):
-        """Send periodic game updates even without video frames"""
-        while True:
-            for connection_id, game in self.games.items():
-                if connection_id in self.active_connections:
-                    try:
-                        websocket = self.active_connections[connection_id]
-                        await self.send_game_state(websocket, connection_id)
-                    except Exception as e:
-                        logger.error(f"Error in periodic update for {connection_id}: {str(e)}")
-            
-            await asyncio.sleep(1.0/60.0)
\ No newline at end of file
+    async def broadcast_game_states(self, connection_ids):
+        """Push the current game state to each connection without waiting.
+
+        A connection whose previous send has not finished is skipped, so a
+        slow client only misses updates instead of delaying the game loop.
+        The state is taken once per game and shared with its spectators.
+        """
+        for connection_id in connection_ids:
+            websocket = self.active_connections.get(connection_id)
+            if websocket is None:
+                continue
+            sending = connection_id in self.state_sends
+            watched = self.spectators.watching(connection_id)
+            if sending and not watched:
+                continue
+            game_state = self.game_state(connection_id)
+            if watched:
+                self.spectators.publish(connection_id, game_state)
+            if sending:
+                continue
+            task = asyncio.create_task(self.send_game_state(websocket, connection_id, game_state))
+            self.state_sends[connection_id] = task
+            task.add_done_callback(lambda _, cid=connection_id: self.state_sends.pop(cid, None))
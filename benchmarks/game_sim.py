@@ -0,0 +1,135 @@
+"""Run many bot games headless and measure the game logic.
+
+Plays ``--games`` games with GapFollower bots through app.simulation for
+``--seconds`` of game time each, as fast as possible, and reports:
+
+* speed: steps per second and game seconds simulated per wall second;
+* difficulty: rounds played, score and round length percentiles;
+* a checksum over every round's seed and score; the simulation is
+  deterministic, so a different checksum for the same settings means the
+  game logic behaves differently;
+* replay verification of a sample of rounds.
+
+Pass an earlier result file with ``--baseline`` to fail on slowdowns or on
+changed game behaviour.
+
+Run from the repository root::
+
+    python -m benchmarks.game_sim --games 1000 --seconds 60 --output sim.json
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.simulation import GapFollower, Simulation, verify_round  # noqa: E402
+
+
+def checksum(rounds):
+    digest = hashlib.sha256()
+    for entry in rounds:
+        digest.update(f"{entry['game']}:{entry['round_seed']}:{entry['score']};".encode())
+    return digest.hexdigest()[:16]
+
+
+def run(args):
+    policies = [GapFollower(args.seed + i, args.noise, args.miss_rate) for i in range(args.games)]
+    simulation = Simulation(policies, seed=args.seed, dt=1.0 / args.tick_rate, record_inputs=args.verify > 0)
+    steps = int(args.seconds * args.tick_rate)
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    rounds = simulation.run(steps)
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    scores = np.asarray([entry["score"] for entry in rounds], dtype=float)
+    lengths = np.asarray([entry["play_time"] for entry in rounds], dtype=float)
+    result = {
+        "steps": steps,
+        "game_steps_per_second": round(steps * args.games / wall, 1),
+        "realtime_factor": round(steps * args.games / args.tick_rate / wall, 1),
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(cpu, 3),
+        "rounds": len(rounds),
+        "checksum": checksum(rounds)
+    }
+    if len(rounds):
+        result["score"] = {f"p{q}": float(v) for q, v in zip((50, 90, 99), np.percentile(scores, [50, 90, 99]))}
+        result["score"]["max"] = float(scores.max())
+        result["round_seconds"] = {
+            f"p{q}": round(float(v), 2) for q, v in zip((50, 90, 99), np.percentile(lengths, [50, 90, 99]))
+        }
+
+    if args.verify:
+        sample = rounds[:args.verify]
+        started = time.perf_counter()
+        verified = sum(verify_round(e["inputs"], e["round_seed"], e["score"], simulation.dt) for e in sample)
+        result["verified"] = f"{verified}/{len(sample)}"
+        result["verify_ms_per_round"] = round((time.perf_counter() - started) / len(sample) * 1000, 2) if sample else None
+    return result
+
+
+def compare(result, baseline, settings, tolerance):
+    """List slowdowns beyond ``tolerance`` and behaviour changes against ``baseline``"""
+    regressions = []
+    old = baseline.get("result", {})
+    if old.get("game_steps_per_second") and \
+            result["game_steps_per_second"] < old["game_steps_per_second"] * (1 - tolerance):
+        regressions.append(f"speed: {old['game_steps_per_second']} -> {result['game_steps_per_second']} steps/s")
+    if baseline.get("settings") == settings and old.get("checksum") != result["checksum"]:
+        regressions.append(f"behaviour: checksum {old.get('checksum')} -> {result['checksum']}")
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=60.0, help="Game time simulated per game")
+    parser.add_argument("--tick-rate", type=int, default=60, help="Steps per game second")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--noise", type=float, default=0.8, help="Aim noise of the bots")
+    parser.add_argument("--miss-rate", type=float, default=0.02, help="Chance per step that a bot is not seen")
+    parser.add_argument("--verify", type=int, default=20, help="Rounds to check by replaying them")
+    parser.add_argument("--output", default=None, help="JSON result file")
+    parser.add_argument("--baseline", default=None, help="Earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown")
+    args = parser.parse_args()
+
+    settings = {
+        "games": args.games, "seconds": args.seconds, "tick_rate": args.tick_rate,
+        "seed": args.seed, "noise": args.noise, "miss_rate": args.miss_rate
+    }
+    result = run(args)
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "created": datetime.datetime.now().isoformat(timespec="seconds"),
+                "settings": settings,
+                "machine": {"python": platform.python_version(), "platform": platform.platform()},
+                "result": result
+            }, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), settings, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,263 @@
+"""Load test for the /ws endpoint: how many players can one server carry?
+
+Starts ``uvicorn main:app`` on localhost (or uses ``--url``), then for each
+session count opens that many synthetic players at once. Every player
+streams binary frames from the sample_conditions clips at ``--fps`` without
+waiting for replies, starts a game, and now and then pauses, resumes and
+restarts it, like a real browser would.
+
+Per step it measures:
+
+* control lag: time from sending a frame until the first game state that
+  arrives after the server answered that frame (the input is applied on
+  the next tick, so this is what a player feels);
+* frames answered and dropped (unanswered, plus the server's own count);
+* server CPU and memory, read from /proc for the spawned server (Linux).
+
+The result is a capacity curve printed as a table and optionally written to
+JSON; the capacity is the largest session count whose p95 control lag stays
+below ``--max-lag-ms``.
+
+Run from the repository root::
+
+    python -m benchmarks.load_test --sessions 1 2 4 8 16 --duration 15
+"""
+import argparse
+import asyncio
+import datetime
+import glob
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import protocol  # noqa: E402
+from benchmarks.run_benchmark import load_clip  # noqa: E402
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+class ServerProcess:
+    """uvicorn serving main:app on a free localhost port"""
+
+    def __init__(self, env=None):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        self.url = f"ws://127.0.0.1:{self.port}/ws"
+        server_env = dict(os.environ)
+        server_env.setdefault("HIGHSCORE_DB", os.path.join(tempfile.mkdtemp(prefix="load-"), "highscores.db"))
+        server_env.update(env or {})
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--log-level", "warning"],
+            cwd=ROOT, env=server_env
+        )
+
+    async def wait_ready(self, timeout=60.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("Server exited during startup")
+            try:
+                async with websockets.connect(self.url):
+                    return
+            except OSError:
+                await asyncio.sleep(0.5)
+        raise RuntimeError("Server did not start in time")
+
+    def usage(self):
+        """Total CPU seconds and current RSS in MB of the server process"""
+        with open(f"/proc/{self.process.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS  # utime + stime
+        with open(f"/proc/{self.process.pid}/statm") as f:
+            rss = int(f.read().split()[1]) * PAGE_SIZE / 2**20
+        return cpu, rss
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class Player:
+    """One synthetic browser session"""
+
+    def __init__(self, url, frames, fps, duration):
+        # A session key of its own, so a cluster router spreads the players
+        self.url = f"{url}?session=load-{id(self):x}"
+        self.frames = frames
+        self.fps = fps
+        self.duration = duration
+        self.sent = {}  # seq -> send time
+        self.waiting = []  # Send times of answered frames waiting for a game state
+        self.lags = []
+        self.answered = 0
+        self.game_states = 0
+        self.server_dropped = 0
+        self.errors = 0
+
+    async def run(self):
+        async with websockets.connect(self.url, max_size=None) as ws:
+            await ws.send(json.dumps({"type": "configure", "response_mode": "landmarks"}))
+            receiver = asyncio.create_task(self.receive(ws))
+            try:
+                await self.stream(ws)
+                await asyncio.sleep(0.5)  # Let the last replies arrive
+            finally:
+                receiver.cancel()
+
+    async def stream(self, ws):
+        await ws.send(json.dumps({"type": "start_game"}))
+        interval = 1.0 / self.fps
+        started = time.perf_counter()
+        next_send = started
+        seq = 0
+        while time.perf_counter() - started < self.duration:
+            frame = self.frames[seq % len(self.frames)]
+            self.sent[seq] = time.perf_counter()
+            await ws.send(bytes(protocol.pack_message(protocol.MSG_VIDEO_FRAME, seq, 0.0, frame)))
+            seq += 1
+            # Exercise the game controls a few times per session
+            if seq % (self.fps * 4) == 0:
+                await ws.send(json.dumps({"type": random.choice(["pause_game", "pause_game", "restart_game"])}))
+                if seq % (self.fps * 8) == 0:
+                    await ws.send(json.dumps({"type": "start_game"}))
+            next_send += interval
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+
+    async def receive(self, ws):
+        async for message in ws:
+            if isinstance(message, bytes):
+                continue
+            data = json.loads(message)
+            if data["type"] == "landmarks":
+                sent_at = self.sent.pop(data.get("seq"), None)
+                if sent_at is not None:
+                    self.answered += 1
+                    self.waiting.append(sent_at)
+                self.server_dropped = data.get("dropped_frames", self.server_dropped)
+            elif data["type"] == "game_state":
+                self.game_states += 1
+                now = time.perf_counter()
+                self.lags.extend(now - sent_at for sent_at in self.waiting)
+                self.waiting = []
+            elif data["type"] == "error":
+                self.errors += 1
+
+    def frames_sent(self):
+        return self.answered + len(self.sent)
+
+
+async def run_step(url, server, sessions, clips, fps, duration):
+    players = [Player(url, clips[i % len(clips)], fps, duration) for i in range(sessions)]
+    usage_start = server.usage() if server else None
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(player.run() for player in players))
+    wall = time.perf_counter() - wall_start
+
+    lags = np.asarray([lag for player in players for lag in player.lags]) * 1000.0
+    sent = sum(player.frames_sent() for player in players)
+    answered = sum(player.answered for player in players)
+    step = {
+        "sessions": sessions,
+        "frames_sent": sent,
+        "frames_answered": answered,
+        "dropped_ratio": round(1 - answered / sent, 4) if sent else 0.0,
+        "server_dropped": sum(player.server_dropped for player in players),
+        "answered_fps_per_session": round(answered / wall / sessions, 2),
+        "game_states_per_session": round(sum(p.game_states for p in players) / wall / sessions, 2),
+        "errors": sum(player.errors for player in players)
+    }
+    if len(lags):
+        p50, p95, p99 = np.percentile(lags, [50, 95, 99])
+        step.update(lag_p50_ms=round(float(p50), 1), lag_p95_ms=round(float(p95), 1),
+                    lag_p99_ms=round(float(p99), 1))
+    if server:
+        cpu_end, rss = server.usage()
+        step.update(server_cpu_percent=round((cpu_end - usage_start[0]) / wall * 100.0, 1),
+                    server_rss_mb=round(rss, 1))
+    return step
+
+
+def print_curve(steps):
+    print(f"\n{'sessions':>8} {'lag p50':>9} {'lag p95':>9} {'lag p99':>9} {'fps/sess':>9} "
+          f"{'dropped':>8} {'cpu %':>7} {'rss MB':>7}")
+    for step in steps:
+        print(f"{step['sessions']:>8} {step.get('lag_p50_ms', '-'):>9} {step.get('lag_p95_ms', '-'):>9} "
+              f"{step.get('lag_p99_ms', '-'):>9} {step['answered_fps_per_session']:>9} "
+              f"{step['dropped_ratio']:>8.1%} {step.get('server_cpu_percent', '-'):>7} "
+              f"{step.get('server_rss_mb', '-'):>7}")
+
+
+async def main_async(args):
+    clip_paths = sorted(glob.glob(os.path.join(ROOT, "sample_conditions", "*.mp4")))
+    clips = [load_clip(path, args.frames, args.width, args.quality) for path in clip_paths]
+
+    server = None
+    url = args.url
+    if url is None:
+        server = ServerProcess()
+        url = server.url
+        await server.wait_ready()
+    try:
+        steps = []
+        for sessions in args.sessions:
+            step = await run_step(url, server, sessions, clips, args.fps, args.duration)
+            steps.append(step)
+            print(f"{sessions} session(s): p95 lag {step.get('lag_p95_ms')} ms, "
+                  f"{step['dropped_ratio']:.1%} dropped")
+            await asyncio.sleep(1.0)  # Let the server release the sessions
+    finally:
+        if server:
+            server.stop()
+
+    print_curve(steps)
+    fitting = [s["sessions"] for s in steps if s.get("lag_p95_ms", float("inf")) <= args.max_lag_ms]
+    capacity = max(fitting) if fitting else 0
+    print(f"\nCapacity at p95 lag <= {args.max_lag_ms} ms: {capacity} session(s)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "created": datetime.datetime.now().isoformat(timespec="seconds"),
+                "settings": vars(args),
+                "cpu_count": os.cpu_count(),
+                "capacity": capacity,
+                "curve": steps
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--fps", type=int, default=15, help="Frames per second sent by each player")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per step")
+    parser.add_argument("--frames", type=int, default=90, help="Frames loaded per clip")
+    parser.add_argument("--width", type=int, default=300)
+    parser.add_argument("--quality", type=int, default=70)
+    parser.add_argument("--max-lag-ms", type=float, default=150.0, help="Largest acceptable p95 control lag")
+    parser.add_argument("--url", default=None, help="Test a running server instead of starting one")
+    parser.add_argument("--output", default=None, help="JSON result file")
+    args = parser.parse_args()
+    os.chdir(ROOT)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main_cli()
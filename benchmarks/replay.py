@@ -0,0 +1,222 @@
+"""Replay a session recording at full speed, for profiling and debugging.
+
+Sessions are recorded by the server when RECORD_DIR is set (app.recorder).
+The recording is fed back through:
+
+* the nose filter (app.filters): bird positions are recomputed from the
+  recorded nose heights, with the recorded or another ``--smoothing``, and
+  compared with the positions the server used;
+* FaceDetector, with ``--detect`` on a recording made with RECORD_FRAMES=1:
+  the frames are detected again and the noses compared;
+* Game: a game is stepped tick by tick with the inputs and events at the
+  ticks they reached the game loop, and its score and mode are checked at
+  every recorded event. ``--inputs filter`` or ``--inputs detect`` plays it
+  with the recomputed positions instead, to see what a change would do to
+  the game.
+
+Every part is timed. Run from the repository root::
+
+    python -m benchmarks.replay recordings/20261017-101500-7f3a --smoothing average
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import profiling, recorder  # noqa: E402
+from app.codec import create_codec  # noqa: E402
+from app.filters import DEFAULT_BIRD_POS, create_nose_filter  # noqa: E402
+from app.game_logic import Game  # noqa: E402
+from app.highscore_store import HighscoreStore  # noqa: E402
+from app.simulation import ManualClock  # noqa: E402
+
+
+def landmarks_of(records):
+    return [r for r in records if r[0] == recorder.KIND_LANDMARK]
+
+
+def frame_noses(records):
+    """The recorded nose of every frame record, in order; None without a face.
+
+    A frame follows the landmark record of its detection, with the same seq.
+    """
+    noses = []
+    last_landmark = None  # (seq, nose) of the last landmark record
+    for kind, _, _, data in records:
+        if kind == recorder.KIND_LANDMARK:
+            last_landmark = data[:2]
+        elif kind == recorder.KIND_FRAME:
+            noses.append(last_landmark[1] if last_landmark is not None and last_landmark[0] == data[0] else None)
+    return noses
+
+
+def replay_filter(records, smoothing):
+    """Bird positions recomputed from the recorded noses, one per landmark record"""
+    nose_filter = create_nose_filter(smoothing)
+    positions = []
+    started = time.perf_counter()
+    for kind, _, t, data in records:
+        if kind == recorder.KIND_EVENT and data["type"] == "reset_calibration":
+            nose_filter.reset()
+        elif kind == recorder.KIND_LANDMARK:
+            _, nose, _ = data
+            # Like FaceDetector: frames without a face leave the bird at the default
+            positions.append(nose_filter(nose[1], t) if nose is not None else DEFAULT_BIRD_POS)
+    elapsed = time.perf_counter() - started
+
+    recorded = np.asarray([data[2] for _, _, _, data in landmarks_of(records)])
+    difference = np.abs(np.asarray(positions) - recorded) if positions else np.zeros(0)
+    calibrator = nose_filter.calibrator
+    return positions, {
+        "smoothing": smoothing,
+        "us_per_frame": round(elapsed / max(1, len(positions)) * 1e6, 2),
+        "max_difference": round(float(difference.max()), 4) if len(difference) else None,
+        "mean_difference": round(float(difference.mean()), 4) if len(difference) else None,
+        "final_range": [round(v, 4) for v in calibrator.range] if calibrator.range else None
+    }
+
+
+def replay_detector(records, smoothing, codec_backend):
+    """Detect the recorded frames again; returns positions and a report"""
+    from app.face_detection import FaceDetector
+
+    detector = FaceDetector(smoothing=smoothing)
+    codec = create_codec(codec_backend, detector.max_width)
+    recorded_noses = iter(frame_noses(records))
+    positions = []
+    differences = []
+    hits = 0
+    try:
+        with profiling.StageRecorder() as stages:
+            started = time.perf_counter()
+            for kind, _, _, data in records:
+                if kind == recorder.KIND_EVENT and data["type"] == "reset_calibration":
+                    detector.reset_calibration()
+                if kind != recorder.KIND_FRAME:
+                    continue
+                _, image = data
+                old = next(recorded_noses)
+                frame, rgb = codec.decode(image)
+                if frame is None:
+                    continue
+                bird_pos_y, _ = detector.detect_nose_position(frame, annotate=False, rgb=rgb)
+                positions.append(bird_pos_y)
+                nose = detector.last_nose
+                hits += nose is not None
+                if nose is not None and old is not None:
+                    differences.append(abs(nose[1] - old[1]))
+            elapsed = time.perf_counter() - started
+    finally:
+        detector.release()
+    return positions, {
+        "frames": len(positions),
+        "fps": round(len(positions) / elapsed, 2) if elapsed else None,
+        "hit_rate": round(hits / len(positions), 4) if positions else None,
+        "mean_nose_difference": round(float(np.mean(differences)), 5) if differences else None,
+        "stages": stages.summary()
+    }
+
+
+def replay_game(metadata, records, positions=None):
+    """Step a Game through the recorded ticks; ``positions`` replaces the recorded inputs"""
+    connect = next((r for r in records if r[0] == recorder.KIND_EVENT and r[3]["type"] == "connect"), None)
+    if connect is None:
+        # The oldest segments were dropped; the game state at the start is unknown
+        start_tick = records[0][1] if records else 0
+    else:
+        start_tick = connect[1]
+    game = Game(HighscoreStore(), seed=metadata.get("game_seed"), clock=ManualClock())
+    dt = 1.0 / metadata.get("tick_rate", 60)
+    nose_y = None
+    tick = start_tick
+    landmark = 0
+    mismatches = []
+    started = time.perf_counter()
+    for kind, record_tick, t, data in records:
+        # Records written at tick T reached the game before step T + 1
+        while tick < record_tick:
+            game.step(nose_y, dt)
+            tick += 1
+        if kind == recorder.KIND_LANDMARK:
+            nose_y = data[2] if positions is None else positions[landmark]
+            landmark += 1
+        elif kind == recorder.KIND_EVENT:
+            event_type = data["type"]
+            if event_type == "start_game":
+                game.start_game(data.get("round_seed"))
+            elif event_type == "pause_game":
+                game.pause_game()
+            elif event_type == "restart_game":
+                game.restart()
+            if "score" in data and (game.score, game.game_mode) != (data["score"], data["game_mode"]):
+                mismatches.append({
+                    "t": round(t, 3), "event": event_type,
+                    "recorded": [data["score"], data["game_mode"]],
+                    "replayed": [game.score, game.game_mode]
+                })
+    elapsed = time.perf_counter() - started
+    ticks = tick - start_tick
+    return {
+        "ticks": ticks,
+        "us_per_tick": round(elapsed / max(1, ticks) * 1e6, 2),
+        "rounds": sum(1 for r in records if r[0] == recorder.KIND_EVENT and r[3]["type"] == "start_game"),
+        "final_score": game.score,
+        "final_mode": game.game_mode,
+        "complete": connect is not None,
+        "mismatches": mismatches
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", help="A segment file or the recording prefix <dir>/<name>")
+    parser.add_argument("--smoothing", default=None, choices=["one_euro", "average"],
+                        help="Smoothing for the filter replay (default: the recorded one)")
+    parser.add_argument("--detect", action="store_true", help="Run the recorded frames through FaceDetector")
+    parser.add_argument("--codec", default=os.environ.get("CODEC_BACKEND", "opencv"),
+                        choices=["opencv", "simplejpeg"], help="Frame decoder for --detect")
+    parser.add_argument("--inputs", default="recorded", choices=["recorded", "filter", "detect"],
+                        help="Bird positions to play the game with")
+    parser.add_argument("--output", default=None, help="JSON result file")
+    args = parser.parse_args()
+
+    metadata, records = recorder.read_recording(args.recording)
+    smoothing = args.smoothing or metadata.get("smoothing") or "one_euro"
+    counts = {
+        name: sum(1 for r in records if r[0] == kind)
+        for name, kind in (("landmarks", recorder.KIND_LANDMARK), ("events", recorder.KIND_EVENT),
+                           ("frames", recorder.KIND_FRAME))
+    }
+    report = {
+        "metadata": metadata,
+        "duration_s": round(records[-1][2] - records[0][2], 2) if records else 0.0,
+        **counts
+    }
+
+    positions = {}
+    positions["filter"], report["filter"] = replay_filter(records, smoothing)
+    if args.detect or args.inputs == "detect":
+        if not counts["frames"]:
+            parser.error("The recording has no frames; record with RECORD_FRAMES=1")
+        positions["detect"], report["detect"] = replay_detector(records, smoothing, args.codec)
+        if args.inputs == "detect" and len(positions["detect"]) != counts["landmarks"]:
+            parser.error("Some recorded frames could not be decoded; cannot play the game with them")
+    report["game"] = replay_game(metadata, records, positions.get(args.inputs))
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.inputs == "recorded" and report["game"]["mismatches"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,282 @@
+"""Replay the sample_conditions clips through the detector and measure it.
+
+Two modes per clip:
+
+* ``detector`` runs the worker's frame function (decode, detection, drawing,
+  encode) directly, one frame after another.
+* ``handler`` sends the frames as binary messages through the full
+  WebSocketHandler path of the app, using an in-process WebSocket client,
+  and waits for each reply.
+
+For every condition it reports per-stage latency percentiles, frames per
+second (wall clock and per CPU core), memory, the memory allocated while
+processing a frame (detector mode) and the detection hit rate,
+and writes everything to a JSON file. Pass an earlier result file with
+``--baseline`` to fail on regressions.
+
+Run from the repository root::
+
+    python -m benchmarks.run_benchmark --frames 150 --output results.json
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import detector_engine, profiling, protocol  # noqa: E402
+
+
+def load_clip(path, max_frames, width, quality):
+    """Read up to ``max_frames`` frames, scaled to ``width`` and JPEG-encoded like the browser does"""
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < max_frames:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        height = int(round(frame.shape[0] * width / frame.shape[1]))
+        frame = cv2.resize(frame, (width, height))
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if ok:
+            frames.append(buffer.tobytes())
+    capture.release()
+    return frames
+
+
+def memory_mb():
+    """Current and peak resident set size in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak /= 1024  # Bytes on macOS, KB elsewhere
+    current = None
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        pass
+    return {
+        "rss_mb": round(current, 1) if current is not None else None,
+        "peak_rss_mb": round(peak / 1024, 1)
+    }
+
+
+def result_entry(frames, hits, wall, cpu, recorder, totals):
+    stages = recorder.summary()
+    stages["total"] = profiling.summarize(totals)
+    return {
+        "frames": frames,
+        "hit_rate": round(hits / frames, 4) if frames else 0.0,
+        "fps": round(frames / wall, 2) if wall else None,
+        "fps_per_core": round(frames / cpu, 2) if cpu else None,
+        "stages": stages,
+        **memory_mb()
+    }
+
+
+def allocated_per_frame(connection_id, messages, annotate, gate):
+    """Mean peak of Python and NumPy memory allocated while processing a frame, in KB.
+
+    Runs after the timed pass, so buffers that are kept from frame to frame
+    already exist. Allocations inside MediaPipe are not traced.
+    """
+    peaks = []
+    tracemalloc.start()
+    try:
+        for message in messages:
+            start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            detector_engine._process_frame(connection_id, message, annotate, gate)
+            peaks.append(tracemalloc.get_traced_memory()[1] - start)
+    finally:
+        tracemalloc.stop()
+    return round(sum(peaks) / len(peaks) / 1024, 1) if peaks else None
+
+
+def bench_detector(frames, options, annotate, gate=False):
+    """Run frames through the worker frame function on this thread"""
+    detector_engine._init_worker(options)
+    connection_id = "bench"
+    detector_engine._create_detector(connection_id)
+    messages = [bytes(protocol.pack_message(protocol.MSG_VIDEO_FRAME, i, 0.0, f)) for i, f in enumerate(frames)]
+    hits = 0
+    reused = 0
+    totals = []
+    try:
+        with profiling.StageRecorder() as recorder:
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            for message in messages:
+                started = time.perf_counter()
+                result = detector_engine._process_frame(connection_id, message, annotate, gate)
+                totals.append(time.perf_counter() - started)
+                if result is not None and result[2]["nose"] is not None:
+                    hits += 1
+                reused += result is not None and result[2].get("reused", False)
+            wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        allocated = allocated_per_frame(connection_id, messages[:30], annotate, gate)
+    finally:
+        detector_engine._release_detector(connection_id)
+    entry = result_entry(len(messages), hits, wall, cpu, recorder, totals)
+    entry["allocated_kb_per_frame"] = allocated
+    if gate:
+        entry["reused_rate"] = round(reused / len(messages), 4) if messages else 0.0
+    return entry
+
+
+def bench_handler(frames, annotate):
+    """Send frames through the app's /ws endpoint one at a time"""
+    from fastapi.testclient import TestClient
+    import main
+
+    main.websocket_handler.min_frame_interval = 0  # Measure, don't rate limit
+    response_mode = "annotated" if annotate else "landmarks"
+    hits = 0
+    totals = []
+    with TestClient(main.app) as client, client.websocket_connect("/ws") as ws:
+        ws.send_text(json.dumps({"type": "configure", "response_mode": response_mode}))
+        while json.loads(ws.receive_text())["type"] != "configured":
+            pass  # Initial game state; the detector is registered by now
+        # Thread workers live in this process, so the result can be read off the detector
+        connection_id = next(iter(main.websocket_handler.active_connections))
+        detector = detector_engine._detectors[connection_id]
+        with profiling.StageRecorder() as recorder:
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            for seq, frame in enumerate(frames):
+                started = time.perf_counter()
+                ws.send_bytes(bytes(protocol.pack_message(protocol.MSG_VIDEO_FRAME, seq, 0.0, frame)))
+                while True:
+                    message = ws.receive()
+                    if message.get("bytes") is not None:
+                        break  # Annotated frame
+                    data = json.loads(message["text"])
+                    if data["type"] == "landmarks":
+                        break
+                    if data["type"] == "error":
+                        raise RuntimeError(data["message"])
+                totals.append(time.perf_counter() - started)
+                hits += detector.last_nose is not None
+            wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    return result_entry(len(frames), hits, wall, cpu, recorder, totals)
+
+
+def compare(results, baseline, tolerance):
+    """List regressions of fps or median total latency beyond ``tolerance``"""
+    regressions = []
+    for condition, modes in results.items():
+        for mode, entry in modes.items():
+            old = baseline.get("results", {}).get(condition, {}).get(mode)
+            if not old:
+                continue
+            if old.get("fps") and entry["fps"] < old["fps"] * (1 - tolerance):
+                regressions.append(f"{condition}/{mode}: fps {old['fps']} -> {entry['fps']}")
+            old_p50 = old.get("stages", {}).get("total", {}).get("p50_ms")
+            new_p50 = entry["stages"]["total"].get("p50_ms")
+            if old_p50 and new_p50 and new_p50 > old_p50 * (1 + tolerance):
+                regressions.append(f"{condition}/{mode}: p50 {old_p50} ms -> {new_p50} ms")
+    return regressions
+
+
+def print_report(results):
+    for condition, modes in results.items():
+        for mode, entry in modes.items():
+            print(f"\n{condition} [{mode}] {entry['frames']} frames, hit rate {entry['hit_rate']:.0%}, "
+                  f"{entry['fps']} fps, {entry['fps_per_core']} fps/core, peak {entry['peak_rss_mb']} MB")
+            if entry.get("reused_rate") is not None:
+                print(f"  frame gate reused the last result for {entry['reused_rate']:.0%} of the frames")
+            if entry.get("allocated_kb_per_frame") is not None:
+                print(f"  allocated per frame: {entry['allocated_kb_per_frame']} KB")
+            for name, stats in entry["stages"].items():
+                if stats["count"]:
+                    print(f"  {name:<10} n={stats['count']:<5} p50 {stats['p50_ms']:8.2f}  "
+                          f"p90 {stats['p90_ms']:8.2f}  p99 {stats['p99_ms']:8.2f} ms")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conditions", nargs="*", help="Clip names to run (default: all)")
+    parser.add_argument("--frames", type=int, default=150, help="Frames per clip")
+    parser.add_argument("--width", type=int, default=300, help="Capture width sent by the client")
+    parser.add_argument("--quality", type=int, default=70, help="JPEG quality sent by the client")
+    parser.add_argument("--modes", nargs="*", default=["detector", "handler"], choices=["detector", "handler"])
+    parser.add_argument("--annotate", action="store_true", help="Draw and encode the annotated frame")
+    parser.add_argument("--backend", default=os.environ.get("LANDMARK_BACKEND", "facemesh"),
+                        choices=["facemesh", "tracking", "batched"])
+    parser.add_argument("--codec", default=os.environ.get("CODEC_BACKEND", "opencv"),
+                        choices=["opencv", "simplejpeg"])
+    parser.add_argument("--gate", type=float, default=0.0, metavar="THRESHOLD",
+                        help="Frame gate threshold as outside a running game (default: off)")
+    parser.add_argument("--output", default=None, help="JSON result file")
+    parser.add_argument("--baseline", default=None, help="Earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    # The handler mode runs the real app; keep its highscores out of data/
+    os.environ["LANDMARK_BACKEND"] = args.backend
+    os.environ["CODEC_BACKEND"] = args.codec
+    os.environ["FRAME_GATE_THRESHOLD"] = str(args.gate)
+    os.environ.setdefault("DETECTOR_WORKERS", "1")
+    os.environ.setdefault("DETECTOR_EXECUTOR", "thread")
+    os.environ["HIGHSCORE_DB"] = os.path.join(tempfile.mkdtemp(prefix="bench-"), "highscores.db")
+
+    clips = sorted(glob.glob(os.path.join(ROOT, "sample_conditions", "*.mp4")))
+    if args.conditions:
+        clips = [c for c in clips if os.path.splitext(os.path.basename(c))[0] in args.conditions]
+    options = {"landmark_backend": args.backend, "landmark_model": "face_landmark.tflite", "codec": args.codec,
+               "frame_gate_threshold": args.gate}
+
+    results = {}
+    for clip in clips:
+        condition = os.path.splitext(os.path.basename(clip))[0]
+        frames = load_clip(clip, args.frames, args.width, args.quality)
+        results[condition] = {}
+        if "detector" in args.modes:
+            results[condition]["detector"] = bench_detector(frames, options, args.annotate, args.gate > 0)
+        if "handler" in args.modes:
+            results[condition]["handler"] = bench_handler(frames, args.annotate)
+
+    print_report(results)
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "settings": {
+            "frames": args.frames, "width": args.width, "quality": args.quality,
+            "annotate": args.annotate, "backend": args.backend, "codec": args.codec,
+            "gate": args.gate
+        },
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "opencv": cv2.__version__
+        },
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,219 @@
+"""Spectator load test: what does watching a game cost the server?
+
+Starts ``uvicorn main:app`` on localhost, opens one player that keeps a
+game running (no camera frames, restarted on every game over) and then,
+for each count in ``--spectators``, that many viewers on
+``/spectate/{game_id}``. Per step it measures:
+
+* server CPU while the viewers watch, against the step without viewers;
+* state messages per second received by each viewer.
+
+A last step adds ``--stalled`` viewers that stop reading from the socket
+and checks that the server drops them (flappy_spectators_dropped_total)
+while the others keep their message rate. A stalled viewer only falls
+behind once the socket buffers between it and the server are full, which
+at ~30 small messages per second takes in the order of a minute, hence
+the longer ``--stall-duration``.
+
+Run from the repository root::
+
+    python -m benchmarks.spectator_load --spectators 0 10 100 300 --duration 10
+"""
+import argparse
+import asyncio
+import base64
+import datetime
+import json
+import os
+import socket
+import sys
+import time
+import urllib.request
+
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.load_test import ServerProcess  # noqa: E402
+
+
+class GamePlayer:
+    """Keeps one game playing without camera input"""
+
+    def __init__(self, url):
+        self.url = url
+        self.stopped = asyncio.Event()
+
+    async def run(self):
+        async with websockets.connect(self.url) as ws:
+            await ws.send(json.dumps({"type": "start_game"}))
+            while not self.stopped.is_set():
+                try:
+                    message = await asyncio.wait_for(ws.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                data = json.loads(message)
+                if data["type"] == "game_state" and data["data"]["game_over"]:
+                    await ws.send(json.dumps({"type": "restart_game"}))
+                    await ws.send(json.dumps({"type": "start_game"}))
+
+
+class Viewer:
+    """One spectator; a stalled one stops reading after the handshake"""
+
+    def __init__(self, url, stalled=False):
+        self.url = url
+        self.stalled = stalled
+        self.messages = 0
+        self.watched = 0.0  # Seconds from the first message to the end
+        self.close_code = None
+
+    async def run(self, duration):
+        try:
+            if self.stalled:
+                await asyncio.wait_for(self.stall(), timeout=duration)
+            else:
+                await asyncio.wait_for(self.receive(), timeout=duration)
+        except asyncio.TimeoutError:
+            pass
+
+    async def receive(self):
+        ws = await websockets.connect(self.url)
+        try:
+            async for _ in ws:
+                if not self.messages:
+                    self.first_message = time.perf_counter()
+                self.messages += 1
+            self.close_code = ws.close_code
+        finally:
+            if self.messages:
+                self.watched = time.perf_counter() - self.first_message
+            ws.transport.abort()
+
+    async def stall(self):
+        """Handshake on a raw socket with a small receive buffer, then read nothing.
+
+        (A websockets client would keep reading into its own buffers.)
+        """
+        host, port = self.url.split("/")[2].split(":")
+        path = "/" + self.url.split("/", 3)[3]
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        sock.setblocking(False)
+        await asyncio.get_running_loop().sock_connect(sock, (host, int(port)))
+        reader, writer = await asyncio.open_connection(sock=sock)
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write((f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n"
+                      f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n"
+                      f"Sec-WebSocket-Version: 13\r\n\r\n").encode())
+        await reader.readuntil(b"\r\n\r\n")
+        writer.transport.pause_reading()
+        try:
+            await asyncio.Future()  # Until the step ends
+        finally:
+            writer.transport.abort()
+
+
+def dropped_total(port):
+    """The server's flappy_spectators_dropped_total counter"""
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5.0) as response:
+        for line in response.read().decode().splitlines():
+            if line.startswith("flappy_spectators_dropped_total"):
+                return float(line.split()[-1])
+    return 0.0
+
+
+def get_json(url):
+    with urllib.request.urlopen(url, timeout=5.0) as response:
+        return json.load(response)
+
+
+async def run_step(server, game_id, spectators, stalled, duration):
+    base = f"ws://127.0.0.1:{server.port}/spectate/{game_id}"
+    viewers = [Viewer(base, stalled=i < stalled) for i in range(spectators)]
+    dropped_start = dropped_total(server.port)
+    usage_start = server.usage()
+    wall_start = time.perf_counter()
+    tasks = [asyncio.create_task(viewer.run(duration)) for viewer in viewers]
+    all_dropped_after = None
+    while time.perf_counter() - wall_start < duration:
+        await asyncio.sleep(0.5)
+        if all_dropped_after is None and stalled and dropped_total(server.port) - dropped_start >= stalled:
+            all_dropped_after = time.perf_counter() - wall_start
+    wall = time.perf_counter() - wall_start
+    cpu_end, rss = server.usage()
+    await asyncio.gather(*tasks)
+
+    readers = [viewer for viewer in viewers if not viewer.stalled]
+    rates = [viewer.messages / viewer.watched for viewer in readers if viewer.watched]
+    return {
+        "spectators": spectators,
+        "stalled": stalled,
+        "server_cpu_percent": round((cpu_end - usage_start[0]) / wall * 100.0, 1),
+        "server_rss_mb": round(rss, 1),
+        "messages_per_s_mean": round(sum(rates) / len(rates), 2) if rates else None,
+        "messages_per_s_min": round(min(rates), 2) if rates else None,
+        "readers_closed": sum(viewer.close_code is not None for viewer in readers),
+        "dropped": int(dropped_total(server.port) - dropped_start),
+        "all_stalled_dropped_after_s": round(all_dropped_after, 1) if all_dropped_after else None
+    }
+
+
+async def main_async(args):
+    server = ServerProcess({"SPECTATOR_QUEUE": str(args.queue)})
+    await server.wait_ready()
+    player = GamePlayer(server.url)
+    player_task = asyncio.create_task(player.run())
+    steps = []
+    try:
+        games = []
+        while not games:
+            await asyncio.sleep(0.5)
+            games = get_json(f"http://127.0.0.1:{server.port}/games")["games"]
+        game_id = games[0]["game_id"]
+        runs = [(spectators, 0, args.duration) for spectators in args.spectators]
+        if args.stalled:
+            runs.append((10 + args.stalled, args.stalled, args.stall_duration))
+        for spectators, stalled, duration in runs:
+            step = await run_step(server, game_id, spectators, stalled, duration)
+            steps.append(step)
+            print(f"{spectators} spectator(s): cpu {step['server_cpu_percent']}%, "
+                  f"{step['messages_per_s_mean']} msg/s per viewer, "
+                  f"{step['dropped']}/{step['stalled']} stalled dropped")
+            await asyncio.sleep(1.0)  # Let the server release the viewers
+    finally:
+        player.stopped.set()
+        await player_task
+        server.stop()
+
+    print(f"\n{'viewers':>8} {'cpu %':>7} {'rss MB':>7} {'msg/s':>7} {'min':>7} {'stalled':>8} {'dropped':>8} {'after s':>8}")
+    for step in steps:
+        print(f"{step['spectators']:>8} {step['server_cpu_percent']:>7} {step['server_rss_mb']:>7} "
+              f"{str(step['messages_per_s_mean']):>7} {str(step['messages_per_s_min']):>7} "
+              f"{step['stalled']:>8} {step['dropped']:>8} {str(step['all_stalled_dropped_after_s']):>8}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "created": datetime.datetime.now().isoformat(timespec="seconds"),
+                "settings": vars(args),
+                "cpu_count": os.cpu_count(),
+                "steps": steps
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spectators", type=int, nargs="+", default=[0, 10, 100, 300])
+    parser.add_argument("--stalled", type=int, default=5, help="Viewers that stop reading in the last step")
+    parser.add_argument("--stall-duration", type=float, default=90.0, help="Seconds of the stalled step")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per step")
+    parser.add_argument("--queue", type=int, default=32, help="SPECTATOR_QUEUE of the server")
+    parser.add_argument("--output", default=None, help="JSON result file")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main_cli()
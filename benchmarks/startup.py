@@ -0,0 +1,146 @@
+"""Startup time of the server: how soon does a new process serve players?
+
+For each of ``--runs`` fresh processes it measures:
+
+* import: ``import main`` in a new interpreter, and which of the heavy
+  modules (OpenCV, MediaPipe, matplotlib) that pulled in;
+* serving: from starting ``uvicorn main:app`` until ``/`` answers;
+* ready: until ``/ready`` answers 200, i.e. the detectors are warm
+  (DETECTOR_WARMUP, see app/config.py).
+
+The medians are checked against ``--budget``, the most seconds a restarted
+or newly scaled process may take to serve ``/``; the exit code is 1 when it
+is exceeded. Run from the repository root::
+
+    python -m benchmarks.startup --runs 5 --budget 1.5
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ("cv2", "mediapipe", "matplotlib", "scipy")
+
+IMPORT_SCRIPT = f"""
+import json, sys, time
+started = time.perf_counter()
+import main
+print(json.dumps({{
+    "seconds": time.perf_counter() - started,
+    "heavy_modules": [m for m in {HEAVY_MODULES!r} if m in sys.modules]
+}}))
+"""
+
+
+def server_env():
+    env = dict(os.environ)
+    env.setdefault("HIGHSCORE_DB", os.path.join(tempfile.mkdtemp(prefix="startup-"), "highscores.db"))
+    return env
+
+
+def measure_import(env):
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def get_status(url):
+    try:
+        with urllib.request.urlopen(url, timeout=1.0) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def measure_server(env, timeout):
+    """Seconds until ``/`` answers and until ``/ready`` answers 200"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env
+    )
+    serving = ready = None
+    try:
+        while ready is None:
+            if process.poll() is not None:
+                raise RuntimeError("Server exited during startup")
+            elapsed = time.perf_counter() - started
+            if elapsed > timeout:
+                raise RuntimeError("Server did not become ready in time")
+            if serving is None and get_status(base + "/") == 200:
+                serving = time.perf_counter() - started
+            if serving is not None:
+                status = get_status(base + "/ready")
+                if status == 200:
+                    ready = time.perf_counter() - started
+                elif status == 404:
+                    ready = serving  # A server without /ready, e.g. an older version
+            time.sleep(0.01)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return serving, ready
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="Fresh processes to measure")
+    parser.add_argument("--budget", type=float, default=1.5, help="Most seconds until / is served")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds to wait for a server")
+    parser.add_argument("--output", default=None, help="JSON result file")
+    args = parser.parse_args()
+
+    env = server_env()
+    runs = []
+    for run in range(args.runs):
+        imported = measure_import(env)
+        serving, ready = measure_server(env, args.timeout)
+        runs.append({
+            "import_s": round(imported["seconds"], 3),
+            "heavy_modules": imported["heavy_modules"],
+            "serving_s": round(serving, 3),
+            "ready_s": round(ready, 3)
+        })
+        print(f"run {run + 1}: import {imported['seconds']:.2f}s, serving {serving:.2f}s, "
+              f"ready {ready:.2f}s, heavy modules at import: {', '.join(imported['heavy_modules']) or 'none'}")
+
+    result = {
+        "warmup": env.get("DETECTOR_WARMUP", "background"),
+        "budget_s": args.budget,
+        **{key: round(statistics.median(r[key] for r in runs), 3) for key in ("import_s", "serving_s", "ready_s")},
+        "runs": runs
+    }
+    print(f"\nmedian: import {result['import_s']}s, serving {result['serving_s']}s, ready {result['ready_s']}s "
+          f"(budget {args.budget}s)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}")
+    if result["serving_s"] > args.budget:
+        print(f"Startup budget exceeded: serving after {result['serving_s']}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
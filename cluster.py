@@ -0,0 +1,70 @@
+"""Run the game on several server processes behind a sticky /ws router.
+
+Each backend is a normal ``uvicorn main:app`` process on its own localhost
+port. They share highscores through one SQLite file
+(HIGHSCORE_BACKEND=sqlite) and split the CPU cores between their detector
+workers. The router (app/router.py) serves the page and static files on the
+public port and pipes every WebSocket to one backend, keeping a session on
+the same backend across reconnects.
+
+    python cluster.py --workers 4 --port 8000
+
+To spread over several machines, start ``uvicorn main:app`` on each node
+(with a shared store) and only run the router here:
+
+    python cluster.py --backend node1:8001 --backend node2:8001
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import uvicorn
+
+from app.router import create_router_app
+
+
+def start_backends(count, host, first_port):
+    cores_per_worker = max(1, (os.cpu_count() or 1) // count)
+    env = dict(os.environ)
+    env.setdefault("HIGHSCORE_BACKEND", "sqlite")
+    env.setdefault("DETECTOR_WORKERS", str(cores_per_worker))
+    processes = []
+    backends = []
+    for index in range(count):
+        port = first_port + index
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", host, "--port", str(port)],
+            env=env
+        ))
+        backends.append(f"{host}:{port}")
+    return processes, backends
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Backend processes to start")
+    parser.add_argument("--host", default="127.0.0.1", help="Address of the router")
+    parser.add_argument("--port", type=int, default=8000, help="Port of the router")
+    parser.add_argument("--backend-port", type=int, default=8001, help="First port of the started backends")
+    parser.add_argument("--backend", action="append", default=[],
+                        help="Route to an already running backend (host:port) instead of starting any")
+    args = parser.parse_args()
+
+    processes = []
+    backends = args.backend
+    if not backends:
+        processes, backends = start_backends(args.workers, "127.0.0.1", args.backend_port)
+        time.sleep(1.0)  # Give the backends a head start; the router retries anyway
+    try:
+        uvicorn.run(create_router_app(backends), host=args.host, port=args.port)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
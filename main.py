@@ -1,8 +1,12 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 import os
 from app.websocket_handler import WebSocketHandler
+from app.detector_engine import DetectorEngine
+from app.game_loop import GameLoop
+from app.highscore_store import create_highscore_store
+from app import config, metrics
 
 app = FastAPI(title="Flappy Bird Web Game")
 
@@ -12,29 +16,132 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # Create data directory if not exists
 os.makedirs("data", exist_ok=True)
 
-# Initialize WebSocket handler
-websocket_handler = WebSocketHandler()
+# Initialize detector worker pool and WebSocket handler
+detector_engine = DetectorEngine(
+    num_workers=config.DETECTOR_WORKERS,
+    executor=config.DETECTOR_EXECUTOR,
+    max_pending=config.DETECTOR_MAX_PENDING,
+    landmark_backend=config.LANDMARK_BACKEND,
+    landmark_model=config.LANDMARK_MODEL,
+    landmark_batch_size=config.LANDMARK_BATCH_SIZE,
+    landmark_batch_window=config.LANDMARK_BATCH_WINDOW_MS / 1000.0,
+    max_width=config.DETECTOR_MAX_WIDTH,
+    smoothing=config.NOSE_SMOOTHING,
+    codec=config.CODEC_BACKEND,
+    frame_gate_threshold=config.FRAME_GATE_THRESHOLD,
+    frame_gate_max_skip=config.FRAME_GATE_MAX_SKIP,
+    pool_warm_size=config.DETECTOR_POOL_WARM,
+    pool_max_idle=config.DETECTOR_POOL_MAX_IDLE,
+    pool_max_size=config.DETECTOR_POOL_MAX,
+    pool_idle_timeout=config.DETECTOR_POOL_IDLE_TIMEOUT
+)
+game_loop = GameLoop(
+    tick_rate=config.GAME_TICK_RATE,
+    broadcast_rate=config.GAME_BROADCAST_RATE
+)
+highscore_store = create_highscore_store(config.HIGHSCORE_BACKEND, config.HIGHSCORE_DB)
+websocket_handler = WebSocketHandler(
+    detector_engine, game_loop, highscore_store,
+    max_fps=config.MAX_CLIENT_FPS,
+    adaptive_target_latency=config.ADAPTIVE_TARGET_LATENCY_MS / 1000.0,
+    record_dir=config.RECORD_DIR or None,
+    record_frames=bool(config.RECORD_FRAMES),
+    record_max_bytes=config.RECORD_MAX_MB * 2**20,
+    record_total_bytes=config.RECORD_TOTAL_MB * 2**20,
+    max_players=config.MAX_PLAYERS_PER_CAMERA,
+    spectator_queue=config.SPECTATOR_QUEUE,
+    max_spectators=config.MAX_SPECTATORS_PER_GAME,
+    max_sessions=config.MAX_SESSIONS,
+    idle_timeout=config.SESSION_IDLE_TIMEOUT
+)
+metrics.ACTIVE_SESSIONS.set_function(lambda: len(websocket_handler.active_connections))
+metrics.SPECTATORS.set_function(lambda: websocket_handler.spectators.viewer_count())
+
+@app.on_event("startup")
+async def startup():
+    if config.METRICS_STAGES:
+        metrics.enable_stage_metrics()
+    highscore_store.start()
+    detector_engine.start(warm=config.DETECTOR_WARMUP != "off")
+    game_loop.start()
+    websocket_handler.sessions.start()
+    if config.DETECTOR_WARMUP == "startup":
+        await detector_engine.warm_up()
+
+@app.on_event("shutdown")
+async def shutdown():
+    websocket_handler.sessions.stop()
+    await game_loop.stop()
+    detector_engine.shutdown()
+    highscore_store.close()
 
 @app.get("/")
 async def serve_game():
     return FileResponse("static/index.html")
 
+@app.get("/leaderboard")
+async def leaderboard(limit: int = 10):
+    return {"leaderboard": highscore_store.leaderboard(limit)}
+
+@app.get("/games")
+async def games():
+    # Active games that can be watched at /spectate/{game_id}
+    return {"games": websocket_handler.list_games()}
+
+@app.get("/sessions")
+async def sessions():
+    # Open sessions and what each has used so far
+    return {"sessions": websocket_handler.list_sessions()}
+
+@app.get("/ready")
+async def ready():
+    # For load balancers and rolling restarts: 503 until the detectors are warm
+    if not detector_engine.ready:
+        return JSONResponse({"ready": False}, status_code=503)
+    return {"ready": True}
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket_handler.connect(websocket)
+    connection_id = await websocket_handler.connect(websocket)
+    if connection_id is None:
+        return
     try:
         while True:
-            data = await websocket.receive_text()
-            await websocket_handler.handle_message(websocket, data)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes") is not None:
+                await websocket_handler.handle_binary_message(websocket, connection_id, message["bytes"])
+            else:
+                await websocket_handler.handle_message(websocket, connection_id, message["text"])
     except WebSocketDisconnect:
-        websocket_handler.disconnect(websocket)
+        pass
+    finally:
+        # Also after errors and cancellation, or the session's detector,
+        # game and state would stay behind
+        websocket_handler.disconnect(connection_id)
+
+@app.websocket("/spectate/{game_id}")
+async def spectate_endpoint(websocket: WebSocket, game_id: int):
+    await websocket_handler.spectate(websocket, game_id)
 
 if __name__ == "__main__":
+    import argparse
     import uvicorn
+    parser = argparse.ArgumentParser(description="Run the game server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--no-reload", dest="reload", action="store_false",
+                        help="Production mode: no file watcher and no restarts on code changes")
+    args = parser.parse_args()
     uvicorn.run(
         "main:app", 
-        host="127.0.0.1", 
-        port=8000, 
-        reload=True,
-        reload_dirs=["app", "static"]
+        host=args.host, 
+        port=args.port, 
+        reload=args.reload,
+        reload_dirs=["app", "static"] if args.reload else None
     )
\ No newline at end of file
@@ -1,3 +1,10 @@
+// Binary frame protocol (see app/protocol.py): 16 byte little-endian header
+// [type u8][format u8][reserved u16][seq u32][timestamp f64] + image bytes
+const FRAME_HEADER_SIZE = 16;
+const MSG_VIDEO_FRAME = 1;
+const MSG_VIDEO_PROCESSED = 2;
+const FORMAT_JPEG = 0;
+
 class FlappyBirdWebGame {
     constructor() {
         this.canvas = document.getElementById('gameCanvas');
@@ -14,6 +21,20 @@ class FlappyBirdWebGame {
         this.cameraActive = false;
         this.gameState = null;
         this.isProcessingFrame = false;
+        this.frameSeq = 0;
+        // Snapshot + delta game state sync
+        this.stateSeq = null;
+        this.stateFields = null;
+        this.statePipes = new Map();
+        // Server-drawn annotated video is a debug option (?debug in the URL);
+        // by default the server only returns landmarks and we draw locally
+        this.debugVideo = new URLSearchParams(window.location.search).has('debug');
+        // Several players in front of one camera (?players=2), one bird per face
+        this.players = parseInt(new URLSearchParams(window.location.search).get('players'), 10) || 1;
+        // Watch someone else's game (?spectate=<game id>, see /games): no
+        // camera and no controls, only the game state stream
+        this.spectateId = new URLSearchParams(window.location.search).get('spectate');
+        this.captureCanvas = document.createElement('canvas');
         
         // Game grid configuration (20x10 grid untuk konsistensi dengan backend)
         this.gridWidth = 20;
@@ -28,10 +49,13 @@ class FlappyBirdWebGame {
         // Performance tracking
         this.lastFrameTime = 0;
         this.frameRate = 10;
+        // Capture settings, adjusted by the server's capture_settings messages
+        this.captureWidth = null; // null keeps the camera's own width
+        this.jpegQuality = 0.7;
 
         // Game state management
         this.gameMode = 'preview'; // 'preview', 'playing', 'paused', 'game_over'
-        this.autoStartCamera = true; // Auto start camera on load
+        this.autoStartCamera = !this.spectateId; // Auto start camera on load
         this.currentBird = 'bird'; // Default bird
         this.previousBird = 'bird';
 
@@ -230,18 +254,45 @@ class FlappyBirdWebGame {
 
     setupWebSocket() {
         const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-        const wsUrl = `${protocol}//${window.location.host}/ws`;
+        // A per-tab session key keeps reconnects on the same server process
+        // when running behind the cluster router
+        let sessionKey = sessionStorage.getItem('flappySession');
+        if (!sessionKey) {
+            sessionKey = Math.random().toString(36).slice(2);
+            sessionStorage.setItem('flappySession', sessionKey);
+        }
+        const wsUrl = this.spectateId
+            ? `${protocol}//${window.location.host}/spectate/${encodeURIComponent(this.spectateId)}`
+            : `${protocol}//${window.location.host}/ws?session=${sessionKey}`;
         
         console.log('Connecting to WebSocket:', wsUrl);
         this.ws = new WebSocket(wsUrl);
+        this.ws.binaryType = 'arraybuffer';
         
         this.ws.onopen = () => {
             console.log('WebSocket connected');
+            if (this.spectateId) {
+                this.showStatus(`Watching game ${this.spectateId}`, 'success');
+                this.stateSeq = null;
+                return;
+            }
             this.showStatus('Connected to game server', 'success');
+            this.ws.send(JSON.stringify({
+                type: 'configure',
+                response_mode: this.debugVideo ? 'annotated' : 'landmarks',
+                state_sync: 'delta',
+                adaptive_quality: true,
+                ...(this.players > 1 ? { players: this.players } : {})
+            }));
+            this.stateSeq = null;
         };
         
         this.ws.onmessage = (event) => {
             try {
+                if (event.data instanceof ArrayBuffer) {
+                    this.handleBinaryMessage(event.data);
+                    return;
+                }
                 const data = JSON.parse(event.data);
                 this.handleWebSocketMessage(data);
             } catch (error) {
@@ -253,6 +304,15 @@ class FlappyBirdWebGame {
             console.log('WebSocket disconnected:', event.code, event.reason);
             this.showStatus('Disconnected from server. Reconnecting...', 'warning');
             this.backgroundMusic.pause(); // Pause music on disconnect
+            if (this.spectateId && event.code === 1001) {
+                this.showStatus('The game has ended', 'info');
+                return;
+            }
+            if (event.code === 1001) {
+                // Closed by the server after a long time without any input
+                this.showStatus('Disconnected after being idle. Reload the page to play again', 'warning');
+                return;
+            }
             
             // Reconnect after 3 seconds
             setTimeout(() => {
@@ -272,29 +332,34 @@ class FlappyBirdWebGame {
     handleWebSocketMessage(data) {
         switch(data.type) {
             case 'game_state':
-                this.gameState = data.data;
-                
-                // Update game mode from server
-                if (this.gameState.game_mode) {
-                    this.gameMode = this.gameState.game_mode;
-                    this.updateGameButtons();
-                    // Resume music if returning to preview or playing mode
-                    if (this.gameMode === 'preview' || this.gameMode === 'playing') {
-                        this.playBackgroundMusic();
-                    }
-                }
+                this.applyGameState(data.data);
+                break;
                 
-                this.updateUI();
+            case 'state_snapshot':
+                this.stateSeq = data.seq;
+                this.statePipes = new Map(data.data.pipes.map(pipe => [pipe.id, pipe]));
+                this.stateFields = { ...data.data };
+                delete this.stateFields.pipes;
+                this.applyGameState(this.buildSyncedState());
+                break;
                 
-                // Show game over modal if game ended
-                if (this.gameState.game_over) {
-                    if (document.getElementById('gameOverModal').classList.contains('hidden')) {
-                        setTimeout(() => {
-                            this.showGameOverModal();
-                            this.backgroundMusic.pause(); // Pause music on game over
-                        }, 500); // Small delay for better UX
+            case 'state_delta':
+                if (this.stateSeq === null) break; // Waiting for a snapshot
+                if (data.seq !== this.stateSeq + 1) {
+                    // Missed a message, ask for a fresh snapshot
+                    this.stateSeq = null;
+                    if (this.spectateId) {
+                        this.ws.close(); // Spectators start over with a new connection
+                        break;
                     }
+                    this.ws.send(JSON.stringify({ type: 'resync' }));
+                    break;
                 }
+                this.stateSeq = data.seq;
+                Object.assign(this.stateFields, data.changes || {});
+                (data.pipes_removed || []).forEach(id => this.statePipes.delete(id));
+                (data.pipes_added || []).forEach(pipe => this.statePipes.set(pipe.id, pipe));
+                this.applyGameState(this.buildSyncedState());
                 break;
                 
             case 'video_processed':
@@ -302,6 +367,22 @@ class FlappyBirdWebGame {
                 this.isProcessingFrame = false;
                 break;
                 
+            case 'landmarks':
+                this.drawLandmarkOverlay(data);
+                this.isProcessingFrame = false;
+                break;
+                
+            case 'configured':
+                console.log('Server response mode:', data.response_mode);
+                break;
+                
+            case 'capture_settings':
+                this.captureWidth = data.width;
+                this.jpegQuality = data.jpeg_quality;
+                this.frameRate = data.fps;
+                console.log('Capture settings:', data);
+                break;
+                
             case 'info':
                 this.showStatus(data.message, 'info');
                 break;
@@ -317,6 +398,69 @@ class FlappyBirdWebGame {
         }
     }
 
+    applyGameState(state) {
+        this.gameState = state;
+        
+        // Update game mode from server
+        if (this.gameState.game_mode) {
+            this.gameMode = this.gameState.game_mode;
+            this.updateGameButtons();
+            // Resume music if returning to preview or playing mode
+            if (this.gameMode === 'preview' || this.gameMode === 'playing') {
+                this.playBackgroundMusic();
+            }
+        }
+        
+        this.updateUI();
+        
+        // Show game over modal if game ended
+        if (this.gameState.game_over) {
+            if (document.getElementById('gameOverModal').classList.contains('hidden')) {
+                setTimeout(() => {
+                    this.showGameOverModal();
+                    this.backgroundMusic.pause(); // Pause music on game over
+                }, 500); // Small delay for better UX
+            }
+        }
+    }
+
+    buildSyncedState() {
+        // Pipes are kept in world coordinates, place them with the scroll offset
+        const scroll = this.stateFields.scroll || 0;
+        const pipes = Array.from(this.statePipes.values(), pipe => ({
+            id: pipe.id,
+            x: pipe.wx - scroll,
+            gap_y: pipe.gap_y
+        }));
+        return { ...this.stateFields, pipes };
+    }
+
+    handleBinaryMessage(buffer) {
+        const view = new DataView(buffer);
+        const type = view.getUint8(0);
+
+        if (type === MSG_VIDEO_PROCESSED) {
+            const image = new Blob([new Uint8Array(buffer, FRAME_HEADER_SIZE)], { type: 'image/jpeg' });
+            this.displayProcessedVideo(URL.createObjectURL(image));
+            this.isProcessingFrame = false;
+        } else {
+            console.log('Unknown binary message type:', type);
+        }
+    }
+
+    packFrame(payload) {
+        const message = new Uint8Array(FRAME_HEADER_SIZE + payload.byteLength);
+        const view = new DataView(message.buffer);
+        view.setUint8(0, MSG_VIDEO_FRAME);
+        view.setUint8(1, FORMAT_JPEG);
+        view.setUint16(2, 0, true);
+        view.setUint32(4, this.frameSeq, true);
+        view.setFloat64(8, performance.now(), true);
+        message.set(new Uint8Array(payload), FRAME_HEADER_SIZE);
+        this.frameSeq = (this.frameSeq + 1) >>> 0;
+        return message;
+    }
+
     async toggleCamera() {
         const button = document.getElementById('toggleCamera');
         
@@ -439,30 +583,36 @@ class FlappyBirdWebGame {
 
             try {
                 // Capture frame from video
-                const canvas = document.createElement('canvas');
+                const canvas = this.captureCanvas;
                 const videoWidth = this.video.videoWidth || 640;
                 const videoHeight = this.video.videoHeight || 480;
                 
-                canvas.width = videoWidth;
-                canvas.height = videoHeight;
+                // Scale down to the width the server asked for, keeping the aspect ratio
+                const captureWidth = Math.min(this.captureWidth || videoWidth, videoWidth);
+                const captureHeight = Math.round(videoHeight * captureWidth / videoWidth);
+                if (canvas.width !== captureWidth || canvas.height !== captureHeight) {
+                    canvas.width = captureWidth;
+                    canvas.height = captureHeight;
+                }
                 
                 const ctx = canvas.getContext('2d');
                 
                 if (videoWidth > 0 && videoHeight > 0) {
                     // Draw video frame to canvas
-                    ctx.drawImage(this.video, 0, 0, videoWidth, videoHeight);
-                    
-                    // Convert to base64 with compression
-                    const frameData = canvas.toDataURL('image/jpeg', 0.7);
+                    ctx.drawImage(this.video, 0, 0, captureWidth, captureHeight);
                     
-                    // Send to server for processing
+                    // Send to server for processing as a binary JPEG message
                     this.isProcessingFrame = true;
                     this.lastFrameTime = currentTime;
                     
-                    this.ws.send(JSON.stringify({
-                        type: 'video_frame',
-                        frame: frameData
-                    }));
+                    canvas.toBlob(async (blob) => {
+                        if (!blob || !this.ws || this.ws.readyState !== WebSocket.OPEN) {
+                            this.isProcessingFrame = false;
+                            return;
+                        }
+                        const payload = await blob.arrayBuffer();
+                        this.ws.send(this.packFrame(payload));
+                    }, 'image/jpeg', this.jpegQuality);
                 }
             } catch (error) {
                 console.error('Error capturing video frame:', error);
@@ -482,6 +632,10 @@ class FlappyBirdWebGame {
         try {
             const img = new Image();
             img.onload = () => {
+                if (frameData.startsWith('blob:')) {
+                    URL.revokeObjectURL(frameData);
+                }
+                
                 // Tetapkan ukuran kanvas ke nilai tetap
                 this.processedCanvas.width = 300; // Lebar tetap
                 this.processedCanvas.height = 225; // Tinggi tetap
@@ -508,6 +662,9 @@ class FlappyBirdWebGame {
             };
             
             img.onerror = () => {
+                if (frameData.startsWith('blob:')) {
+                    URL.revokeObjectURL(frameData);
+                }
                 console.error('Error loading processed frame');
                 this.isProcessingFrame = false;
             };
@@ -519,6 +676,53 @@ class FlappyBirdWebGame {
         }
     }
 
+    drawLandmarkOverlay(landmarks) {
+        // Same overlay the server draws in annotated mode, on the local video
+        const ctx = this.processedCtx;
+        const width = this.processedCanvas.width = 300;
+        const height = this.processedCanvas.height = 225;
+        const scale = width / (this.video.videoWidth || width);
+
+        ctx.drawImage(this.video, 0, 0, width, height);
+
+        (landmarks.players || [landmarks]).forEach((player, index) => {
+            if (!player.nose) return;
+            const drawMarker = (x, y) => {
+                ctx.fillStyle = '#FFFF00';
+                ctx.beginPath();
+                ctx.arc(x, y, 8 * scale, 0, 2 * Math.PI);
+                ctx.fill();
+                ctx.strokeStyle = '#FF0000';
+                ctx.lineWidth = 2 * scale;
+                ctx.beginPath();
+                ctx.arc(x, y, 12 * scale, 0, 2 * Math.PI);
+                ctx.stroke();
+            };
+
+            drawMarker(player.nose.x * width, player.nose.y * height);
+            if (landmarks.players) {
+                ctx.fillStyle = '#FFFF00';
+                ctx.font = `bold ${Math.round(14 * scale)}px Arial`;
+                ctx.fillText(String(player.player), player.nose.x * width + 14 * scale, player.nose.y * height - 14 * scale);
+            }
+
+            // Vertical guide line with the bird position on the right side
+            const guideX = width - (50 + 30 * index) * scale;
+            const guideYStart = 50 * scale;
+            const guideYEnd = height - 50 * scale;
+            ctx.strokeStyle = '#808080';
+            ctx.lineWidth = 2 * scale;
+            ctx.beginPath();
+            ctx.moveTo(guideX, guideYStart);
+            ctx.lineTo(guideX, guideYEnd);
+            ctx.stroke();
+            drawMarker(guideX, guideYStart + (guideYEnd - guideYStart) * player.guide_pos);
+        });
+
+        this.video.style.display = 'none';
+        this.processedCanvas.style.display = 'block';
+    }
+
     sendManualJump() {
         // Fallback manual control when camera is not active
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
@@ -535,7 +739,11 @@ class FlappyBirdWebGame {
         const highscoreElement = document.getElementById('highscore');
         const pipeCountElement = document.getElementById('pipeCount');
 
-        if (scoreElement) scoreElement.textContent = this.gameState.score;
+        if (scoreElement) {
+            scoreElement.textContent = this.gameState.players
+                ? this.gameState.players.map(p => `P${p.player} ${p.score}`).join(' · ')
+                : this.gameState.score;
+        }
         if (highscoreElement) highscoreElement.textContent = this.gameState.highscore;
         if (pipeCountElement) pipeCountElement.textContent = this.gameState.pipe_count; // Tambahkan ini
 
@@ -612,14 +820,33 @@ class FlappyBirdWebGame {
     drawBird() {
         if (!this.gameState) return;
         
+        if (!this.gameState.players) {
+            this.drawBirdAt(this.gameState.bird_pos_y, this.currentBird);
+            return;
+        }
+        // One bird per player, each in its own color; birds that crashed fade out
+        const sprites = ['bird', 'redBird', 'yellowBird'];
+        const first = Math.max(0, sprites.indexOf(this.currentBird));
+        this.gameState.players.forEach((player, index) => {
+            this.ctx.globalAlpha = player.game_mode === 'game_over' ? 0.35 : 1.0;
+            this.drawBirdAt(player.bird_pos_y, sprites[(first + index) % sprites.length]);
+            this.ctx.fillStyle = '#FFF';
+            this.ctx.font = 'bold 12px Arial';
+            this.ctx.textAlign = 'center';
+            this.ctx.fillText(`P${player.player}`, 2 * this.cellWidth, player.bird_pos_y * this.cellHeight - this.cellWidth * 0.5);
+        });
+        this.ctx.globalAlpha = 1.0;
+    }
+
+    drawBirdAt(birdPosY, sprite) {
         const birdX = 2 * this.cellWidth; // Fixed X position
-        const birdY = this.gameState.bird_pos_y * this.cellHeight;
+        const birdY = birdPosY * this.cellHeight;
         const birdSize = this.cellWidth * 0.8;
         
-        if (this.images[this.currentBird]) {
-            // Draw bird sprite based on currentBird
+        if (this.images[sprite]) {
+            // Draw bird sprite based on the selected bird
             this.ctx.drawImage(
-                this.images[this.currentBird],
+                this.images[sprite],
                 birdX - birdSize / 2,
                 birdY - birdSize / 2,
                 birdSize,
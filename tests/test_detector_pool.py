@@ -0,0 +1,163 @@
+import pytest
+
+from app import detector_engine, detector_pool
+from app.detector_pool import DetectorPool, DetectorPoolExhausted
+
+
+class FakeDetector:
+    """Stands in for FaceDetector, which needs MediaPipe"""
+
+    def __init__(self, max_faces=1):
+        self.max_faces = max_faces
+        self.resets = 0
+        self.released = False
+
+    def reset(self):
+        self.resets += 1
+
+    def release(self):
+        self.released = True
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(detector_pool.time, "monotonic", clock)
+    return clock
+
+
+def test_warm_lease_and_give_back():
+    pool = DetectorPool(FakeDetector, warm_size=2)
+    pool.warm()
+    assert pool.stats() == {"idle": 2, "leased": 0, "created": 2, "reused": 0, "closed": 0}
+
+    first = pool.lease()
+    pool.lease()
+    pool.lease()
+    assert pool.stats() == {"idle": 0, "leased": 3, "created": 3, "reused": 2, "closed": 0}
+
+    pool.give_back(first)
+    assert first.resets == 1
+    assert pool.lease() is first  # The most recently returned one
+
+
+def test_max_idle():
+    pool = DetectorPool(FakeDetector, warm_size=0, max_idle=1)
+    first, second = pool.lease(), pool.lease()
+    pool.give_back(first)
+    pool.give_back(second)
+    assert second.released and not first.released
+    assert pool.stats()["idle"] == 1 and pool.stats()["closed"] == 1
+
+
+def test_max_size():
+    pool = DetectorPool(FakeDetector, warm_size=1, max_size=2)
+    pool.warm()
+    pool.lease()
+    second = pool.lease()
+    with pytest.raises(DetectorPoolExhausted):
+        pool.lease()
+    pool.give_back(second)
+    assert pool.lease() is second
+
+
+def test_warm_stays_within_max_size():
+    pool = DetectorPool(FakeDetector, warm_size=4, max_size=2)
+    pool.warm()
+    assert pool.stats()["created"] == 2
+
+
+def test_idle_timeout(clock):
+    pool = DetectorPool(FakeDetector, warm_size=1, max_idle=4, idle_timeout=60.0)
+    detectors = [pool.lease() for _ in range(3)]
+    for detector in detectors:
+        pool.give_back(detector)
+    clock.now += 61.0
+    pool.evict_idle()
+    # Down to warm_size, the most recently returned one stays
+    assert [detector for detector, _ in pool.idle] == [detectors[2]]
+    assert detectors[0].released and detectors[1].released
+
+
+def test_unpooled_detectors_count_toward_max_size():
+    pool = DetectorPool(FakeDetector, warm_size=1, max_size=2)
+    pool.warm()
+    single = pool.lease()
+    multi = pool.lease_unpooled(lambda: FakeDetector(max_faces=2))
+    assert pool.stats()["leased"] == 2
+    with pytest.raises(DetectorPoolExhausted):
+        pool.lease()
+    with pytest.raises(DetectorPoolExhausted):
+        pool.lease_unpooled(lambda: FakeDetector(max_faces=2))
+
+    pool.give_back_unpooled(multi)
+    assert multi.released and pool.stats() == {"idle": 0, "leased": 1, "created": 1, "reused": 1, "closed": 1}
+
+    # An idle detector is closed to make room
+    pool.give_back(single)
+    pool.lease_unpooled(lambda: FakeDetector(max_faces=2))
+    assert not single.released
+    pool.lease_unpooled(lambda: FakeDetector(max_faces=2))
+    assert single.released and pool.stats()["idle"] == 0
+    with pytest.raises(DetectorPoolExhausted):
+        pool.lease()
+
+
+def test_failed_unpooled_detector_is_not_counted():
+    pool = DetectorPool(FakeDetector, max_size=1)
+
+    def broken():
+        raise RuntimeError("No graph")
+
+    with pytest.raises(RuntimeError):
+        pool.lease_unpooled(broken)
+    assert pool.stats()["leased"] == 0
+    pool.lease()
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    """Worker 0 of detector_engine with a pool of at most two fake detectors"""
+    pool = DetectorPool(FakeDetector, warm_size=0, max_size=2)
+    monkeypatch.setitem(detector_engine._pools, 0, pool)
+    monkeypatch.setattr(detector_engine, "_new_detector", FakeDetector)
+    monkeypatch.setattr(detector_engine, "_detectors", {})
+    return pool
+
+
+def test_set_players_stays_within_max_size(worker):
+    detector_engine._detectors[1] = worker.lease()
+    detector_engine._detectors[2] = worker.lease()
+
+    detector_engine._set_players(1, 2)
+    assert detector_engine._detectors[1].max_faces == 2
+    assert worker.stats()["leased"] == 2 and worker.stats()["idle"] == 0
+
+    detector_engine._set_players(1, 3)
+    detector_engine._set_players(2, 2)
+    assert worker.stats()["leased"] == 2
+
+    detector_engine._set_players(1, 1)
+    assert detector_engine._detectors[1].max_faces == 1
+    assert worker.stats()["leased"] == 2
+
+
+def test_set_players_keeps_the_old_players_on_failure(worker, monkeypatch):
+    detector_engine._detectors[1] = worker.lease()
+
+    def broken(max_faces=1):
+        raise RuntimeError("No graph")
+
+    monkeypatch.setattr(detector_engine, "_new_detector", broken)
+    with pytest.raises(RuntimeError):
+        detector_engine._set_players(1, 2)
+    assert detector_engine._detectors[1].max_faces == 1
+    assert worker.stats()["leased"] == 1
@@ -0,0 +1,72 @@
+from app.face_tracking import FaceTracker
+from app.filters import DEFAULT_BIRD_POS
+
+
+def players(tracker):
+    """Nose of every player slot, None while free"""
+    return [track.nose for track in tracker.tracks]
+
+
+def test_new_faces_take_slots_left_to_right():
+    tracker = FaceTracker(3)
+    tracker.update([(0.8, 0.5), (0.2, 0.5)], 0.0)
+    assert players(tracker) == [(0.2, 0.5), (0.8, 0.5), None]
+
+
+def test_faces_keep_their_players_when_crossing():
+    tracker = FaceTracker(2)
+    for frame in range(60):
+        # Face a walks left to right above face b, which walks the other way
+        a = (0.1 + frame * 0.0135, 0.4)
+        b = (0.9 - frame * 0.0135, 0.6)
+        noses = [a, b] if frame % 2 else [b, a]  # FaceMesh order is arbitrary
+        tracker.update(noses, frame / 30)
+        assert players(tracker) == [a, b]
+
+
+def test_missing_face_keeps_its_slot_for_a_while():
+    tracker = FaceTracker(2, max_missing=5, max_no_face_frames=2)
+    tracker.update([(0.2, 0.5), (0.8, 0.5)], 0.0)
+    for frame in range(1, 4):
+        tracker.update([(0.8, 0.5)], frame / 30)
+    assert players(tracker) == [(0.2, 0.5), (0.8, 0.5)]
+    assert not tracker.tracks[0].found
+    assert tracker.tracks[0].bird_pos == DEFAULT_BIRD_POS
+
+    # Back within max_missing: the same player again
+    tracker.update([(0.8, 0.5), (0.25, 0.5)], 4 / 30)
+    assert players(tracker) == [(0.25, 0.5), (0.8, 0.5)]
+
+
+def test_slot_is_freed_after_max_missing():
+    tracker = FaceTracker(2, max_missing=3)
+    tracker.update([(0.2, 0.5), (0.8, 0.5)], 0.0)
+    for frame in range(1, 5):
+        tracker.update([(0.8, 0.5)], frame / 30)
+    assert players(tracker) == [None, (0.8, 0.5)]
+
+    # A new face takes the free slot
+    tracker.update([(0.8, 0.5), (0.5, 0.5)], 5 / 30)
+    assert players(tracker) == [(0.5, 0.5), (0.8, 0.5)]
+
+
+def test_distant_face_is_a_new_player():
+    tracker = FaceTracker(2, max_distance=0.25)
+    tracker.update([(0.2, 0.5)], 0.0)
+    tracker.update([(0.7, 0.5)], 1 / 30)
+    assert players(tracker) == [(0.2, 0.5), (0.7, 0.5)]
+
+
+def test_more_faces_than_players():
+    tracker = FaceTracker(1)
+    positions = tracker.update([(0.6, 0.5), (0.3, 0.5)], 0.0)
+    assert len(positions) == 1
+    assert players(tracker) == [(0.3, 0.5)]
+
+
+def test_reset():
+    tracker = FaceTracker(2)
+    tracker.update([(0.2, 0.5), (0.8, 0.5)], 0.0)
+    tracker.reset()
+    assert players(tracker) == [None, None]
+    assert tracker.update([], 1 / 30) == [DEFAULT_BIRD_POS, DEFAULT_BIRD_POS]
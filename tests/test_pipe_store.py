@@ -0,0 +1,156 @@
+import math
+import random
+
+import numpy as np
+
+from app.game_logic import Game, GameBatch
+from app.highscore_store import HighscoreStore
+from app.pipe_store import PipeStore
+from app.simulation import ManualClock
+
+
+class ReferencePipes:
+    """The pipes of one game as a list of dicts, stepped like Game did before PipeStore"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.pipes = []
+        self.next_id = 0
+
+    def spawn(self, x, gap_y):
+        self.pipes.append({"id": self.next_id, "x": x, "gap_y": gap_y, "scored": False})
+        self.next_id += 1
+
+    def advance(self, distance):
+        for pipe in self.pipes:
+            pipe["x"] -= distance
+        self.pipes = [pipe for pipe in self.pipes if pipe["x"] >= -3]
+        if not any(pipe["x"] > 15 for pipe in self.pipes):
+            self.spawn(22, self.rng.randint(3, 7))
+
+    def check(self, bird_y):
+        hit = False
+        for pipe in self.pipes:
+            if 0.5 <= pipe["x"] <= 3.5 and not (pipe["gap_y"] - 1.5 <= bird_y <= pipe["gap_y"] + 1.5):
+                hit = True
+        scored = False
+        for pipe in self.pipes:
+            if (not scored and not pipe["scored"] and 1.8 <= pipe["x"] < 2.0
+                    and pipe["gap_y"] - 1.5 <= bird_y <= pipe["gap_y"] + 1.5):
+                pipe["scored"] = True
+                scored = True
+        return hit, scored
+
+
+def test_matches_per_object_pipes():
+    rng = random.Random(7)
+    store = PipeStore(capacity=2)  # Grows while the test runs
+    games = []
+    next_ids = {}
+    for index in range(6):
+        slot = store.add_slot()
+        reference = ReferencePipes(random.Random(index))
+        store_rng = random.Random(index)
+        reference.spawn(15, 5)
+        store.add(slot, 0, 15, 5)
+        next_ids[slot] = 1
+        games.append((slot, reference, store_rng))
+
+    for _ in range(2000):
+        distance = store.per_slot()
+        bird_y = store.per_slot()
+        active = store.per_slot(np.bool_)
+        for slot, _, _ in games:
+            distance[slot] = rng.uniform(0.0, 0.4)
+            bird_y[slot] = rng.uniform(0.5, 8.5)
+            active[slot] = True
+
+        store.advance(distance)
+        has_next = store.has_pipe_beyond(15)
+        for slot, _, store_rng in games:
+            if not has_next[slot]:
+                store.add(slot, next_ids[slot], 22, store_rng.randint(3, 7))
+                next_ids[slot] += 1
+        hits, scored = store.check(bird_y, active)
+
+        for slot, reference, _ in games:
+            reference.advance(distance[slot])
+            assert store.pipes(slot) == [
+                {"id": pipe["id"], "x": pipe["x"], "gap_y": pipe["gap_y"]} for pipe in reference.pipes
+            ]
+            assert (hits[slot], scored[slot]) == reference.check(bird_y[slot])
+
+
+def test_inactive_slots_are_left_alone():
+    store = PipeStore()
+    moving, still = store.add_slot(), store.add_slot()
+    store.add(moving, 0, 1.0, 5.0)
+    store.add(still, 0, 1.0, 5.0)
+    distance = store.per_slot()
+    distance[moving] = 5.0
+    store.advance(distance)
+    assert store.pipes(moving) == []
+    assert store.pipes(still) == [{"id": 0, "x": 1.0, "gap_y": 5.0}]
+
+    active = store.per_slot(np.bool_)
+    hits, scored = store.check(np.full(store.num_slots, 8.0), active)
+    assert not hits.any() and not scored.any()
+
+
+def test_scores_once_per_pipe_and_step():
+    store = PipeStore()
+    slot = store.add_slot()
+    store.add(slot, 0, 1.9, 5.0)
+    store.add(slot, 1, 1.95, 5.0)
+    active = np.ones(1, np.bool_)
+    bird_y = np.full(1, 5.0)
+    assert store.check(bird_y, active)[1][slot]
+    assert store.scored[:store.size].tolist() == [True, False]
+    assert store.check(bird_y, active)[1][slot]
+    assert not store.check(bird_y, active)[1][slot]
+
+
+def test_next_gap():
+    store = PipeStore()
+    a, b, c = store.add_slot(), store.add_slot(), store.add_slot()
+    store.add(a, 0, 0.5, 3.0)
+    store.add(a, 1, 8.0, 6.0)
+    store.add(b, 0, 4.0, 7.0)
+    gaps = store.next_gap(1.0)
+    assert gaps[a] == 6.0 and gaps[b] == 7.0 and math.isnan(gaps[c])
+
+
+def test_removed_slots_are_reused_without_their_pipes():
+    store = PipeStore()
+    a, b = store.add_slot(), store.add_slot()
+    store.add(a, 0, 10.0, 5.0)
+    store.add(b, 0, 12.0, 4.0)
+    store.remove_slot(a)
+    assert store.add_slot() == a
+    assert store.pipes(a) == []
+    assert store.pipes(b) == [{"id": 0, "x": 12.0, "gap_y": 4.0}]
+
+
+def _nose(tick, index):
+    if (tick // 200) % 5 == 4:
+        return None  # No face for a while
+    return 5.0 + 2.5 * math.sin(tick * 0.03 + index)
+
+
+def test_game_batch_matches_games_stepped_alone():
+    highscores = HighscoreStore()
+    alone = [Game(highscores, seed=index, clock=ManualClock()) for index in range(5)]
+    batched = [Game(highscores, seed=index, clock=ManualClock()) for index in range(5)]
+    batch = GameBatch()
+    for index, game in enumerate(batched):
+        batch.add(index, game)
+
+    for tick in range(3000):
+        if tick % 500 == 0:
+            for game in alone + batched:
+                if game.game_mode != "playing":
+                    game.start_game()
+        for index, game in enumerate(alone):
+            game.step(_nose(tick, index), 1 / 60)
+        batch.step({index: _nose(tick, index) for index in range(len(batched))}, 1 / 60)
+        assert [game.get_state() for game in batched] == [game.get_state() for game in alone]
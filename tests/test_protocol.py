@@ -0,0 +1,30 @@
+import pytest
+
+from app import protocol
+
+
+def test_round_trip():
+    payload = b"\xff\xd8jpeg bytes\xff\xd9"
+    message = protocol.pack_message(protocol.MSG_VIDEO_FRAME, 42, 1234.5, payload, protocol.FORMAT_WEBP)
+    assert len(message) == protocol.HEADER_SIZE + len(payload)
+    assert protocol.unpack_header(message) == (protocol.MSG_VIDEO_FRAME, protocol.FORMAT_WEBP, 42, 1234.5)
+    assert bytes(message[protocol.HEADER_SIZE:]) == payload
+
+
+def test_payload_from_a_buffer():
+    buffer = bytearray(b"0123456789")
+    message = protocol.pack_message(protocol.MSG_VIDEO_PROCESSED, 1, 0.0, memoryview(buffer)[2:6])
+    assert bytes(message[protocol.HEADER_SIZE:]) == b"2345"
+    # The message is a copy
+    buffer[2:6] = b"xxxx"
+    assert bytes(message[protocol.HEADER_SIZE:]) == b"2345"
+
+
+def test_seq_wraps_around():
+    message = protocol.pack_message(protocol.MSG_VIDEO_FRAME, 2**32 + 5, 0.0, b"")
+    assert protocol.unpack_header(message)[2] == 5
+
+
+def test_short_message():
+    with pytest.raises(protocol.ProtocolError):
+        protocol.unpack_header(b"\x01\x00\x00")
@@ -0,0 +1,145 @@
+import base64
+import os
+
+import pytest
+
+from app import recorder
+from app.game_logic import Game
+from app.recorder import Recorder, prune_recordings, read_recording, segment_paths
+from app.websocket_handler import WebSocketHandler
+from benchmarks.replay import frame_noses, replay_game
+
+
+def test_round_trip(tmp_path):
+    rec = Recorder(str(tmp_path), "session", metadata={"tick_rate": 60, "game_seed": 7}, record_frames=True)
+    rec.event(0, "connect", score=0, game_mode="preview")
+    rec.landmark(1, 5, (0.25, 0.5), 4.5)
+    rec.frame(1, 5, b"jpeg")
+    rec.landmark(2, 6, None, 5.0)
+    rec.close()
+    rec.landmark(3, 7, (0.5, 0.5), 5.0)  # Ignored after close()
+
+    metadata, records = read_recording(str(tmp_path / "session"))
+    assert metadata["tick_rate"] == 60 and metadata["game_seed"] == 7 and "started_at" in metadata
+    assert [(kind, tick, data) for kind, tick, _, data in records] == [
+        (recorder.KIND_EVENT, 0, {"type": "connect", "score": 0, "game_mode": "preview"}),
+        (recorder.KIND_LANDMARK, 1, (5, (0.25, 0.5), 4.5)),
+        (recorder.KIND_FRAME, 1, (5, b"jpeg")),
+        (recorder.KIND_LANDMARK, 2, (6, None, 5.0))
+    ]
+    times = [t for _, _, t, _ in records]
+    assert times == sorted(times)
+
+
+def test_frames_only_when_asked(tmp_path):
+    rec = Recorder(str(tmp_path), "session")
+    rec.frame(1, 1, b"jpeg")
+    rec.close()
+    assert read_recording(str(tmp_path / "session"))[1] == []
+
+
+def test_segment_rollover(tmp_path):
+    rec = Recorder(str(tmp_path), "session", max_bytes=10**6, segment_bytes=500)
+    for tick in range(100):
+        rec.landmark(tick, tick, (0.5, tick / 100), 5.0)
+    rec.close()
+    paths = segment_paths(str(tmp_path / "session"))
+    assert len(paths) > 1 and len(paths) == rec.segment_count
+    assert segment_paths(paths[0]) == paths
+
+    metadata, records = read_recording(paths[-1])
+    assert [data[0] for _, _, _, data in records] == list(range(100))
+
+
+def test_oldest_segments_are_dropped(tmp_path):
+    rec = Recorder(str(tmp_path), "session", max_bytes=2000, segment_bytes=500)
+    for tick in range(200):
+        rec.landmark(tick, tick, (0.5, 0.5), 5.0)
+    rec.close()
+    paths = segment_paths(str(tmp_path / "session"))
+    assert sum(os.path.getsize(path) for path in paths) <= 2000 + 500
+    assert not paths[0].endswith("-000001.rec")
+
+    # Each segment has the metadata, so what is left still reads
+    _, records = read_recording(paths[0])
+    seqs = [data[0] for _, _, _, data in records]
+    assert seqs == list(range(seqs[0], 200))
+
+
+def test_truncated_segment(tmp_path):
+    rec = Recorder(str(tmp_path), "session")
+    for tick in range(10):
+        rec.landmark(tick, tick, (0.5, 0.5), 5.0)
+    rec.close()
+    path = segment_paths(str(tmp_path / "session"))[0]
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 3)  # Cut off in the middle of the last record
+    assert len(read_recording(path)[1]) == 9
+
+
+def test_missing_recording(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        read_recording(str(tmp_path / "nothing"))
+
+
+def test_directory_limit(tmp_path):
+    directory = str(tmp_path)
+    for index in range(4):
+        rec = Recorder(directory, f"old{index}")
+        for tick in range(50):
+            rec.landmark(tick, tick, (0.5, 0.5), 5.0)
+        rec.close()
+        os.utime(segment_paths(os.path.join(directory, f"old{index}"))[0], (index, index))
+    size = os.path.getsize(segment_paths(os.path.join(directory, "old0"))[0])
+
+    # Open recordings count but are kept, however old
+    current = Recorder(directory, "current")
+    for tick in range(50):
+        current.landmark(tick, tick, (0.5, 0.5), 5.0)
+    current.file.flush()
+    os.utime(segment_paths(os.path.join(directory, "current"))[0], (0, 0))
+
+    assert prune_recordings(directory, int(size * 3.5)) == ["old0", "old1"]
+    assert sorted(os.listdir(directory)) == ["current-000001.rec", "old2-000001.rec", "old3-000001.rec"]
+    assert prune_recordings(directory, int(size * 3.5)) == []
+    current.close()
+
+
+def test_directory_limit_on_rollover(tmp_path):
+    directory = str(tmp_path)
+    for index in range(3):
+        rec = Recorder(directory, f"session{index}", segment_bytes=1000, directory_max_bytes=3000)
+        for tick in range(100):
+            rec.landmark(tick, tick, (0.5, 0.5), 5.0)
+        rec.close()
+    # Each session alone is larger than the limit, so it drops the one before
+    assert {name.rsplit("-", 1)[0] for name in os.listdir(directory)} == {"session2"}
+
+
+def test_handler_recording_replays(tmp_path):
+    """A session recorded by WebSocketHandler reads back for benchmarks/replay.py"""
+    handler = WebSocketHandler(record_dir=str(tmp_path), record_frames=True)
+    handler.games[1] = Game(handler.highscore_store, seed=3)
+    handler.start_recording(1)
+    rec = handler.recorders[1]
+
+    noses = [(0.5, 0.3 + index * 0.01) for index in range(20)]
+    for index, nose in enumerate(noses):
+        image = b"jpeg %d" % index
+        frame_data = "data:image/jpeg;base64," + base64.b64encode(image).decode()
+        landmarks = {"nose": {"x": nose[0], "y": nose[1]}} if index % 5 else {}
+        handler.record_frame(1, frame_data, 5.0, landmarks)
+        handler.game_loop.tick_count += 1
+    handler.record_event(1, "disconnect")
+    rec.close()
+
+    metadata, records = read_recording(os.path.join(str(tmp_path), rec.name))
+    assert metadata["game_seed"] == 3
+    frames = [data for kind, _, _, data in records if kind == recorder.KIND_FRAME]
+    # JSON frames have no seq of their own; each gets a distinct one
+    assert [seq for seq, _ in frames] == list(range(20))
+    assert [image for _, image in frames] == [b"jpeg %d" % index for index in range(20)]
+    assert frame_noses(records) == [nose if index % 5 else None for index, nose in enumerate(noses)]
+
+    report = replay_game(metadata, records)
+    assert report["complete"] and report["ticks"] == 20 and report["mismatches"] == []
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from app import sessions
+from app.sessions import SessionLimitReached, SessionManager
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sessions.time, "monotonic", clock)
+    return clock
+
+
+def test_ids_are_never_reused():
+    manager = SessionManager()
+    first = manager.open("ws1")
+    manager.close(first.id)
+    second = manager.open("ws2")
+    assert second.id != first.id
+    assert manager.get(first.id) is None and manager.get(second.id) is second
+
+
+def test_close_twice():
+    manager = SessionManager()
+    session = manager.open("ws")
+    assert manager.close(session.id) is session
+    assert manager.close(session.id) is None
+    assert len(manager) == 0
+
+
+def test_max_sessions():
+    manager = SessionManager(max_sessions=2)
+    first = manager.open("ws1")
+    manager.open("ws2")
+    with pytest.raises(SessionLimitReached):
+        manager.open("ws3")
+    manager.close(first.id)
+    manager.open("ws3")
+    assert len(manager) == 2
+
+
+def test_usage():
+    session = SessionManager().open("ws")
+    session.touch(100)
+    session.touch(50)
+    stats = session.stats()
+    assert stats["session_id"] == session.id
+    assert (stats["messages"], stats["bytes_in"]) == (2, 150)
+
+
+def test_idle(clock):
+    manager = SessionManager(idle_timeout=60.0)
+    quiet = manager.open("ws1")
+    busy = manager.open("ws2")
+    clock.now += 50.0
+    busy.touch(10)
+    assert manager.idle() == []
+    clock.now += 20.0
+    assert manager.idle() == [quiet]
+
+    assert SessionManager(idle_timeout=0).idle() == []
+
+
+def test_sweep_evicts_idle_sessions(clock, monkeypatch):
+    real_sleep = asyncio.sleep
+
+    async def sleep(seconds):
+        await real_sleep(0)
+
+    monkeypatch.setattr(sessions.asyncio, "sleep", sleep)
+    manager = SessionManager(idle_timeout=60.0)
+    evicted = []
+
+    async def on_idle(session):
+        evicted.append(session.id)
+        if session.id == quiet.id:
+            raise ConnectionError("Already closed")  # Logged, the sweep goes on
+        manager.close(session.id)
+
+    async def run():
+        manager.on_idle = on_idle
+        manager.start()
+        for _ in range(3):
+            await real_sleep(0)
+        assert evicted == []
+
+        clock.now += 61.0
+        manager.open("ws3")
+        for _ in range(3):
+            await real_sleep(0)
+        manager.stop()
+
+    quiet = manager.open("ws1")
+    other = manager.open("ws2")
+    asyncio.run(run())
+    assert other.id in evicted and quiet.id in evicted
+    assert manager.get(other.id) is None and manager.get(quiet.id) is quiet
+    assert len(manager) == 2
+    assert manager.sweeper is None
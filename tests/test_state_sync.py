@@ -0,0 +1,116 @@
+from app.state_sync import StateSync
+
+
+def state(scroll=0.0, bird_pos_y=5.0, score=0, pipes=()):
+    return {
+        "bird_pos_y": bird_pos_y,
+        "score": score,
+        "scroll": scroll,
+        "pipes": [{"id": pipe_id, "x": x, "gap_y": gap_y} for pipe_id, x, gap_y in pipes]
+    }
+
+
+class Client:
+    """Applies messages like the browser does, asking for a resync on a gap"""
+
+    def __init__(self):
+        self.seq = None
+        self.fields = None
+        self.pipes = {}
+
+    def apply(self, message):
+        """Returns False when the message cannot be applied"""
+        if message["type"] == "state_snapshot":
+            data = dict(message["data"])
+            self.pipes = {pipe["id"]: pipe for pipe in data.pop("pipes")}
+            self.fields = data
+        elif self.seq is None or message["seq"] != self.seq + 1:
+            return False
+        else:
+            self.fields.update(message.get("changes", {}))
+            for pipe in message.get("pipes_added", []):
+                self.pipes[pipe["id"]] = pipe
+            for pipe_id in message.get("pipes_removed", []):
+                del self.pipes[pipe_id]
+        self.seq = message["seq"]
+        return True
+
+    def pipe_xs(self):
+        """Screen x of every pipe, as the server had it"""
+        return {pipe_id: round(pipe["wx"] - self.fields["scroll"], 4) for pipe_id, pipe in self.pipes.items()}
+
+
+def test_snapshot_then_deltas():
+    sync = StateSync()
+    first = sync.encode(state(pipes=[(0, 15.0, 5)]))
+    assert first["type"] == "state_snapshot" and first["seq"] == 1
+    assert first["data"]["pipes"] == [{"id": 0, "wx": 15.0, "gap_y": 5}]
+
+    # Pipes only move with the scroll, so they are not sent again
+    delta = sync.encode(state(scroll=0.5, pipes=[(0, 14.5, 5)]))
+    assert delta == {"type": "state_delta", "seq": 2, "changes": {"scroll": 0.5}}
+
+    delta = sync.encode(state(scroll=1.0, score=10, pipes=[(1, 21.0, 4)]))
+    assert delta["seq"] == 3
+    assert delta["changes"] == {"scroll": 1.0, "score": 10}
+    assert delta["pipes_added"] == [{"id": 1, "wx": 22.0, "gap_y": 4}]
+    assert delta["pipes_removed"] == [0]
+
+
+def test_nothing_changed():
+    sync = StateSync()
+    sync.encode(state(bird_pos_y=5.0))
+    # Below the rounding precision
+    assert sync.encode(state(bird_pos_y=5.0001)) is None
+    assert sync.encode(state(bird_pos_y=5.01))["seq"] == 2
+
+
+def test_resync_sends_a_snapshot():
+    sync = StateSync()
+    sync.encode(state())
+    sync.request_resync()
+    message = sync.encode(state())
+    assert message["type"] == "state_snapshot" and message["seq"] == 2
+
+
+def test_client_follows_the_server_state():
+    sync = StateSync()
+    client = Client()
+    pipes = []
+    for tick in range(300):
+        scroll = tick * 0.3
+        if tick % 20 == 0:
+            pipes.append((tick // 20, 22.0 + scroll, tick % 5 + 3))
+        visible = [(pipe_id, wx - scroll, gap_y) for pipe_id, wx, gap_y in pipes if wx - scroll >= -3]
+        message = sync.encode(state(scroll=scroll, score=tick // 50 * 10, pipes=visible))
+        if message is not None:
+            assert client.apply(message)
+        assert client.fields["score"] == tick // 50 * 10
+        assert client.pipe_xs() == {pipe_id: round(x, 4) for pipe_id, x, _ in visible}
+
+
+def test_gap_needs_a_resync():
+    sync = StateSync()
+    client = Client()
+    assert client.apply(sync.encode(state()))
+    sync.encode(state(score=10))  # Lost
+    assert not client.apply(sync.encode(state(score=20)))
+
+    sync.request_resync()
+    assert client.apply(sync.encode(state(score=30)))
+    assert client.apply(sync.encode(state(score=40)))
+    assert client.fields["score"] == 40
+
+
+def test_joining_mid_stream():
+    sync = StateSync()
+    assert sync.snapshot() is None
+    sync.encode(state(pipes=[(0, 15.0, 5)]))
+    sync.encode(state(scroll=1.0, score=10, pipes=[(0, 14.0, 5)]))
+
+    # A viewer joining now continues with the deltas encoded for the others
+    late = Client()
+    assert late.apply(sync.snapshot())
+    assert late.apply(sync.encode(state(scroll=2.0, score=20, pipes=[(0, 13.0, 5), (1, 21.0, 3)])))
+    assert late.fields["score"] == 20
+    assert late.pipe_xs() == {0: 13.0, 1: 21.0}